@@ -0,0 +1,28 @@
+'''Compares two result files written by run.py'''
+import json
+import click
+
+
+def key(result):
+    return (result.get('sessions', 0), result.get('storage', ''),
+            result['name'])
+
+
+@click.command(help='Compare two benchmark results')
+@click.argument('baseline', type=click.File())
+@click.argument('contender', type=click.File())
+def main(baseline, contender):
+    old = {key(result): result for result in json.load(baseline)['results']}
+    new = {key(result): result for result in json.load(contender)['results']}
+
+    click.echo(f'{"sessions":>8} {"storage":<8} {"benchmark":<14} '
+               f'{"before":>9} {"after":>9} {"ratio":>7}')
+    for k in sorted(old.keys() & new.keys()):
+        before, after = old[k]['best'], new[k]['best']
+        sessions, storage, name = k
+        click.echo(f'{sessions:>8} {storage:<8} {name:<14} '
+                   f'{before:>8.4f}s {after:>8.4f}s {after / before:>6.2f}x')
+
+
+if __name__ == '__main__':
+    main()
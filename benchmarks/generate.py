@@ -0,0 +1,110 @@
+'''Generates realistic strack data files of any size.
+
+The output only depends on the parameters and the seed, so the same file
+can be generated again to compare two versions of strack.'''
+from datetime import date, datetime, time, timedelta
+from colorsys import hsv_to_rgb
+import json
+import random
+import click
+
+WORDS = ['review', 'meeting', 'bugfix', 'lecture', 'exercise', 'reading',
+         'refactoring', 'planning', 'docs', 'tests', 'release', 'support']
+
+
+def random_comment(rng: random.Random, length: int) -> str:
+    words = []
+    while len(' '.join(words)) < length:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words)[:length]
+
+
+def generate(sessions: int = 1000,
+             projects: int = 10,
+             sessions_per_day: int = 4,
+             comment_length: int = 20,
+             comment_ratio: float = 0.3,
+             active: bool = True,
+             end: date = None,
+             seed: int = 0) -> dict:
+    '''Returns the data of a history with the given number of sessions,
+    ending on the given day, in the format of the strack data file. The
+    history ends yesterday by default, so that no session is in the future
+    and the open one has been running since yesterday evening.'''
+    rng = random.Random(seed)
+    end = end or date.today() - timedelta(days=1)
+
+    # A few distinct comments per project, like real usage
+    comments = [random_comment(rng, comment_length)
+                for _ in range(max(1, projects * 3))]
+    objs = [{
+        'name': f'project-{index}',
+        'color': '#{:02x}{:02x}{:02x}'.format(
+            *(int(c * 255) for c in hsv_to_rgb(rng.random(), 0.5, 0.95))),
+        'sessions': [],
+    } for index in range(projects)]
+
+    # Walk backwards from the last day, then reverse the order
+    days = -(-sessions // sessions_per_day)
+    remaining = sessions
+    day = end - timedelta(days=days - 1)
+    while remaining > 0:
+        # Sessions of a day are spread between 8:00 and 20:00
+        count = min(remaining, sessions_per_day)
+        slot = 12 * 60 // count
+        for index in range(count):
+            offset = 8 * 60 + index * slot + rng.randrange(max(1, slot // 4))
+            start = datetime.combine(day, time()) + timedelta(minutes=offset)
+            duration = timedelta(minutes=rng.randrange(15, max(16, slot)))
+            obj = {'start': str(start), 'end': str(start + duration)}
+            if rng.random() < comment_ratio:
+                obj['comment'] = rng.choice(comments)
+            rng.choice(objs)['sessions'].append(obj)
+        remaining -= count
+        day += timedelta(days=1)
+
+    # Leave the last session of the history open
+    active_project = None
+    if active and sessions:
+        last = max((obj for obj in objs if obj['sessions']),
+                   key=lambda obj: obj['sessions'][-1]['start'])
+        last['sessions'][-1]['end'] = 'None'
+        active_project = last['name']
+
+    return {
+        'active_project': active_project,
+        'projects': objs,
+        'version': 1,
+    }
+
+
+def write(obj: dict, file: str) -> None:
+    with open(file, 'w') as f:
+        json.dump(obj, f, indent=4)
+
+
+@click.command(help='Generate a strack data file')
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('-n', '--sessions', default=1000, help='Number of sessions')
+@click.option('-y', '--years', default=None, type=float,
+              help='Years of history (overrides --sessions)')
+@click.option('-p', '--projects', default=10, help='Number of projects')
+@click.option('-d', '--sessions-per-day', default=4,
+              help='Number of sessions per day')
+@click.option('-c', '--comment-length', default=20,
+              help='Length of the comments')
+@click.option('--comment-ratio', default=0.3,
+              help='Fraction of the sessions with a comment')
+@click.option('--active/--no-active', default=True,
+              help='Leave the last session open')
+@click.option('--seed', default=0, help='Seed of the random generator')
+def main(output, sessions, years, projects, sessions_per_day,
+         comment_length, comment_ratio, active, seed):
+    if years is not None:
+        sessions = int(years * 365 * sessions_per_day)
+    write(generate(sessions, projects, sessions_per_day, comment_length,
+                   comment_ratio, active, seed=seed), output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''Measures the memory used by the sessions once they are decoded.
+
+The sessions of a generated history are decoded with the current Session
+class and with a copy of the previous one, which kept two datetimes and
+the comment in the __dict__ of every session.'''
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from os import path
+import gc
+import tracemalloc
+import click
+
+from strack.data import Session
+from strack.file_utils import load_file, set_file
+from .generate import generate, write
+
+SIZES = [10000, 100000, 1000000]
+
+
+class DictSession:
+    '''Layout of Session before it used __slots__ and epoch integers'''
+
+    def __init__(self, start, end=None, comment=None):
+        self.start = start
+        self.end = end
+        self.comment = comment
+
+    @staticmethod
+    def from_obj(obj):
+        end = obj['end']
+        return DictSession(datetime.fromisoformat(obj['start']),
+                           datetime.fromisoformat(end)
+                           if end != 'None' else None,
+                           obj.get('comment'))
+
+
+def traced_size(function):
+    '''Returns the result of the function and the memory it still holds'''
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(size: int, workdir: str) -> dict:
+    obj = generate(size)
+    objs = [session for project in obj['projects']
+            for session in project['sessions']]
+
+    _, before = traced_size(lambda: [DictSession.from_obj(session)
+                                     for session in objs])
+    _, after = traced_size(lambda: [Session.from_obj(session)
+                                    for session in objs])
+
+    # Everything load_file keeps, with the sessions decoded
+    file = path.join(workdir, f'{size}.json')
+    write(obj, file)
+    del obj, objs
+
+    def load():
+        set_file(file)
+        data = load_file()
+        for project in data.projects:
+            for _ in project.sessions:
+                pass
+        return data
+    _, loaded = traced_size(load)
+
+    return {'sessions': size, 'dict_session': before,
+            'slots_session': after, 'load_file': loaded}
+
+
+@click.command(help='Compare the memory used by decoded sessions')
+@click.option('-s', '--size', 'sizes', multiple=True, type=click.INT,
+              help='Number of sessions (can be repeated)')
+def main(sizes):
+    click.echo(f'{"sessions":>10} {"__dict__":>12} {"__slots__":>12} '
+               f'{"load_file":>12}   (bytes per session)')
+    with TemporaryDirectory() as workdir:
+        for size in sizes or SIZES:
+            result = measure(size, workdir)
+            click.echo(f'{size:>10} {result["dict_session"] / size:>12.0f} '
+                       f'{result["slots_session"] / size:>12.0f} '
+                       f'{result["load_file"] / size:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
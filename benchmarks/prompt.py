@@ -0,0 +1,78 @@
+'''Times the prompt command against status on histories of increasing size.
+
+Both commands are run the way a shell prompt runs them, as new processes
+through the strack entry point. The time of an interpreter that does
+nothing is measured as well, the prompt only adds its own time to it.'''
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from os import path
+import subprocess
+import sys
+import click
+
+from strack.file_utils import load_file, set_file, update_state
+from .generate import generate, write
+
+SIZES = [1000, 100000, 1000000]
+
+ENTRY_POINT = 'from strack.client import main; main()'
+
+
+def process_time(args, repeat: int) -> float:
+    '''Returns the median wall time of running the command in a new
+    process'''
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run([sys.executable, *args], check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(perf_counter() - start)
+    return median(times)
+
+
+def in_process_time(file: str, repeat: int) -> float:
+    '''Returns the median time of importing the prompt and rendering it,
+    without the interpreter startup'''
+    code = ('from time import perf_counter; start = perf_counter(); '
+            'from strack.prompt import render; render(%r); '
+            'print(perf_counter() - start)' % file)
+    return median(float(subprocess.run(
+        [sys.executable, '-c', code], check=True, capture_output=True,
+        text=True).stdout) for _ in range(repeat))
+
+
+def measure(size: int, workdir: str, repeat: int) -> dict:
+    file = path.join(workdir, f'{size}.json')
+    write(generate(size), file)
+    # The state is written by start and stop, as for any saved data
+    set_file(file)
+    update_state(load_file())
+
+    command = ['-c', ENTRY_POINT, '--file', file]
+    return {
+        'prompt': process_time([*command, 'prompt'], repeat),
+        'prompt_only': in_process_time(file, repeat),
+        'status': process_time([*command, 'status'], max(1, repeat // 4)),
+    }
+
+
+@click.command(help='Compare the time of the prompt and status commands')
+@click.option('-s', '--size', 'sizes', multiple=True, type=click.INT,
+              help='Number of sessions (can be repeated)')
+@click.option('-r', '--repeat', default=20, help='Runs per command')
+def main(sizes, repeat):
+    python = process_time(['-c', ''], repeat)
+    click.echo(f'python startup: {python * 1000:.1f}ms')
+    click.echo(f'{"sessions":>10} {"prompt":>10} {"in process":>12} '
+               f'{"status":>10}')
+    with TemporaryDirectory() as workdir:
+        for size in sizes or SIZES:
+            result = measure(size, workdir, repeat)
+            click.echo(f'{size:>10} {result["prompt"] * 1000:>8.1f}ms '
+                       f'{result["prompt_only"] * 1000:>10.2f}ms '
+                       f'{result["status"] * 1000:>8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+'''Times strack on generated histories of increasing size.
+
+Every command is run through click's CliRunner against a copy of the
+data, so that commands modifying it always start from the same state.
+The results are written as JSON, see compare.py to compare two runs.'''
+from datetime import datetime
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from os import path, remove
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tracemalloc
+import click
+from click.testing import CliRunner
+
+from strack.data import Data
+from strack.file_utils import load_file, set_file
+from strack.strack import cli
+from .generate import generate, write
+
+SIZES = [1000, 10000, 100000]
+STORAGES = {'json': 'data.json', 'sqlite': 'data.db', 'sharded': 'data',
+            'binary': 'data.strack'}
+
+# Commands run against every history, with the command preparing the
+# data for them if needed. The history ends with an open session.
+COMMANDS = {
+    'status': (['status'], None),
+    'report': (['report'], None),
+    'cal': (['cal'], None),
+    'list -n 20': (['list', '-n', '20'], None),
+    'list': (['list'], None),
+    'project list': (['project', 'list'], None),
+    'stop': (['stop'], None),
+    'start': (['start', 'project-0'], ['stop']),
+}
+
+
+SIDECARS = ['', '.journal', '.cache']
+
+
+def copy_data(source: str, target: str) -> None:
+    '''Replaces a data file or directory with a copy of another one,
+    together with its sidecar files'''
+    shutil.rmtree(target, ignore_errors=True)
+    for suffix in SIDECARS:
+        if path.isfile(target + suffix):
+            remove(target + suffix)
+
+    if path.isdir(source):
+        shutil.copytree(source, target)
+        return
+    for suffix in SIDECARS:
+        if path.exists(source + suffix):
+            shutil.copyfile(source + suffix, target + suffix)
+
+
+def measure(function, repeat: int, setup=None):
+    '''Returns the time of the first run and of the following ones'''
+    times = []
+    for _ in range(repeat + 1):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return times[0], times[1:] or times
+
+
+def peak_memory(function, setup=None) -> int:
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def invoke(file: str, args):
+    def run():
+        result = CliRunner().invoke(cli, ['--file', file, *args])
+        if result.exception is not None and result.exit_code != 0:
+            raise result.exception
+    return run
+
+
+def startup_time(repeat: int) -> dict:
+    '''Measures the import time of the entry point with -X importtime'''
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import strack.strack'],
+            capture_output=True, text=True, check=True).stderr
+        # Lines are formatted as 'import time: self | cumulative | name'
+        for line in output.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == 'strack.strack':
+                times.append(int(fields[1]) / 10**6)
+    return {'name': 'import', 'first': times[0], 'best': min(times),
+            'median': median(times)}
+
+
+def run_size(size: int, storages, repeat: int, memory: bool, workdir: str):
+    results = []
+    source = path.join(workdir, f'{size}.json')
+    write(generate(size), source)
+    sample = path.join(workdir, 'sample.json')
+
+    def result(name, storage, first, times, peak=None):
+        click.echo(f'{size:>8} {storage:<8} {name:<14} {min(times):.4f}s')
+        results.append({'sessions': size, 'storage': storage, 'name': name,
+                        'first': first, 'best': min(times),
+                        'median': median(times), 'peak_memory': peak})
+
+    # Parsing and writing the JSON format
+    def load():
+        with open(source) as f:
+            return Data.from_file(f)
+    data = load()
+
+    def save():
+        with open(sample, 'w') as f:
+            data.to_file(f)
+
+    result('load', 'json', *measure(load, repeat),
+           peak_memory(load) if memory else None)
+    result('save', 'json', *measure(save, repeat),
+           peak_memory(save) if memory else None)
+    del data
+
+    for storage in storages:
+        original = path.join(workdir, f'{size}-{STORAGES[storage]}')
+        if storage == 'json':
+            shutil.copyfile(source, original)
+        else:
+            invoke(original, ['migrate', source])()
+        target = path.join(workdir, f'{size}-run-{STORAGES[storage]}')
+
+        def reset():
+            copy_data(original, target)
+
+        def load_storage():
+            set_file(target)
+            return load_file()
+
+        result('load_file', storage, *measure(load_storage, repeat, reset),
+               peak_memory(load_storage, reset) if memory else None)
+
+        for name, (args, prepare) in COMMANDS.items():
+            command = invoke(target, args)
+            setup = reset
+            if prepare is not None:
+                def setup():
+                    reset()
+                    invoke(target, prepare)()
+            result(name, storage, *measure(command, repeat, setup),
+                   peak_memory(command, setup) if memory else None)
+
+    return results
+
+
+@click.command(help='Run the benchmarks and write the results as JSON')
+@click.option('-o', '--output', default='benchmark.json',
+              type=click.Path(dir_okay=False), help='Result file')
+@click.option('-s', '--size', 'sizes', multiple=True, type=click.INT,
+              help='Number of sessions (can be repeated, up to 1000000)')
+@click.option('--storage', 'storages', multiple=True,
+              type=click.Choice(list(STORAGES)), help='Storage backend')
+@click.option('-r', '--repeat', default=3, help='Runs per benchmark')
+@click.option('--memory/--no-memory', default=True,
+              help='Measure the peak memory with tracemalloc')
+def main(output, sizes, storages, repeat, memory):
+    results = [startup_time(repeat)]
+    with TemporaryDirectory() as workdir:
+        for size in sizes or SIZES:
+            results += run_size(size, storages or ['json'], repeat, memory,
+                                workdir)
+
+    with open(output, 'w') as f:
+        json.dump({
+            'date': str(datetime.now()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }, f, indent=4)
+    click.echo(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
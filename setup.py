@@ -11,6 +11,6 @@ setup(
     ],
     entry_points='''
         [console_scripts]
-        strack=strack.strack:cli
+        strack=strack.client:main
     ''',
 )
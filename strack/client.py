@@ -0,0 +1,116 @@
+'''Entry point that forwards commands to a running daemon. It only imports
+the standard library, the CLI is imported when no daemon answers.'''
+# Annotations aren't evaluated, typing takes longer to import than the
+# prompt takes to run
+from __future__ import annotations
+import os
+import sys
+
+# Commands that the daemon answers
+FORWARDED = {'status', 'start', 'stop', 'report'}
+
+# Commands answered from the state file, without the daemon or the CLI
+LOCAL = {'prompt'}
+
+# Options of live views, which stay open in the terminal running them
+LIVE_OPTIONS = {'--watch', '--live'}
+
+
+def resolve_storage_path():
+    if os.environ.get('STRACK_DATA'):
+        return os.environ.get('STRACK_DATA')
+    return os.path.expanduser('~/strack_data.json')
+
+
+def socket_path(file: str) -> str:
+    return file + '.sock'
+
+
+def parse_args(args: list[str]) -> tuple[str, list[str]] | None:
+    '''Returns the data file and the command with its arguments, or None if
+    the command can't be forwarded or answered locally'''
+    file = None
+    index = 0
+    while index < len(args) and args[index].startswith('-'):
+        if args[index] == '--file' and index + 1 < len(args):
+            file = args[index + 1]
+            index += 2
+        elif args[index].startswith('--file='):
+            file = args[index][len('--file='):]
+            index += 1
+        else:
+            return None
+
+    command = args[index:]
+    # Traced commands run in this process
+    if os.environ.get('STRACK_TRACE'):
+        return None
+    if (not command or command[0] not in FORWARDED | LOCAL
+            or '--help' in command or LIVE_OPTIONS & set(command)):
+        return None
+    return os.path.realpath(file or resolve_storage_path()), command
+
+
+def forward(file: str, args: list[str]) -> dict | None:
+    '''Runs the command in the daemon of the data file. Returns None if no
+    daemon is running or the command has to be run directly.'''
+    # Imported here, since the prompt has to start as fast as possible
+    import json
+    import shutil
+    import socket
+
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    request = {
+        'args': args,
+        'width': shutil.get_terminal_size().columns,
+        'color': sys.stdout.isatty(),
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path(file))
+            client.sendall(json.dumps(request).encode() + b'\n')
+            client.shutdown(socket.SHUT_WR)
+            response = b''.join(iter(lambda: client.recv(65536), b''))
+    except OSError:
+        return None
+
+    if not response:
+        return None
+    response = json.loads(response)
+    if response.get('fallback'):
+        return None
+    return response
+
+
+def is_running(file: str) -> bool:
+    '''Returns True if a daemon is listening for the data file'''
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path(file))
+    except OSError:
+        return False
+    return True
+
+
+def main():
+    parsed = parse_args(sys.argv[1:])
+    if parsed and parsed[1][0] == 'prompt':
+        from .prompt import main as prompt
+        if prompt(parsed[0], parsed[1][1:]):
+            return
+        parsed = None
+    response = forward(*parsed) if parsed else None
+    if response is None:
+        from .strack import cli
+        return cli()
+
+    sys.stdout.write(response['output'])
+    sys.exit(response['exit_code'])
+
+
+if __name__ == '__main__':
+    main()
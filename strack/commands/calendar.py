@@ -1,69 +1,71 @@
 import click
-from datetime import datetime, timedelta
-from rich.table import Table
-from rich import print, box
-from rich.text import Text
-from rich.style import Style
-from typing import List
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
 
+from strack import profiling
 from strack.data import Data
-from strack.utils import round_time, is_this_week
+from strack.data.stream import Window
+from strack.file_utils import load_file, pass_data
+from strack.output import format_option, write_records
+from strack.utils import week_range
+from strack.watch import View, watch
 
-days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+DATE = click.DateTime(['%Y-%m-%d'])
+FIELDS = ['project', 'start', 'end', 'comment']
 
 
-def earliest_and_latest(sessions_per_day):
-    earliest = None
-    latest = None
-
-    for day in days:
-        for start, end, *_ in sessions_per_day[day]:
-            earliest = min(start, earliest) if earliest else start
-            latest = max(end, latest) if latest else end
-
-    return earliest, latest
+def slot_of(dt: datetime, slot: int) -> int:
+    '''Returns the slot of the day containing the time'''
+    return (dt.hour * 60 + dt.minute) // slot
 
 
-def get_sessions_per_day(data: Data):
-    sessions_per_day = {day: [] for day in days}
+def day_range(days: List[date]):
+    '''Returns the start of the first day and the end of the last one'''
+    return (datetime.combine(days[0], time()),
+            datetime.combine(days[-1], time()) + timedelta(days=1))
 
-    # Round the time to the nearest half hour and group by day
-    for project in data.projects:
-        for session in project.sessions:
-            start = session.start
-            end = session.end or datetime.now()
-
-            # Ignore sessions that are not this week
-            if not is_this_week(start):
-                continue
 
-            weekday = days[start.weekday()]
+def split_session(project, session, range_start: datetime,
+                  range_end: datetime, now: datetime):
+    '''Yields the parts of the session in the range, one per day'''
+    # Sessions outside of the range are only shown inside of it
+    start = max(session.start, range_start)
+    end = min(session.end or now, range_end)
 
-            # Round the time to the nearest half hour
-            start = round_time(start)
-            end = round_time(end)
+    while start < end:
+        day_end = datetime.combine(start.date() + timedelta(days=1), time())
+        segment_end = min(end, day_end)
+        yield project, session, start, segment_end
+        start = segment_end
 
-            # Truncate the date and only keep the time
-            start = start.replace(year=1900, month=1, day=1)
-            end = end.replace(year=1900, month=1, day=1)
 
-            sessions_per_day[weekday].append(
-                (start, end, project, session.comment))
+def split_sessions(data: Data, days: List[date]):
+    '''Yields the project, session, start and end of the parts of the
+    sessions of the days, sorted by start. Sessions crossing midnight are
+    split into one part per day.'''
+    range_start, range_end = day_range(days)
+    for project, session in data.sessions_between(range_start, range_end):
+        yield from split_session(project, session, range_start, range_end,
+                                 data.now)
 
-    return sessions_per_day
 
+def add_segments(segments_per_day: Dict[date, list], parts, slot: int):
+    '''Adds the parts of sessions as (first slot, end slot, project,
+    comment) segments to their day'''
+    slots_per_day = 24 * 60 // slot
+    for project, session, start, end in parts:
+        last = (slots_per_day if end.time() == time()
+                else slot_of(end, slot))
+        segments_per_day[start.date()].append(
+            (slot_of(start, slot), last, project, session.comment))
 
-def get_intervals(earliest: datetime, latest: datetime):
-    total_interval = latest - earliest
-    # Get the number of half hours
-    total_interval = total_interval.total_seconds() / 1800
-    intervals = []
-    for i in range(int(total_interval)):
-        start = earliest + timedelta(minutes=30 * i)
-        end = start + timedelta(minutes=30)
-        intervals.append((start, end))
 
-    return intervals
+def get_segments_per_day(data: Data, days: List[date], slot: int):
+    '''Returns the sessions of the days as segments, grouped by day and
+    sorted by start'''
+    segments_per_day: Dict[date, list] = {day: [] for day in days}
+    add_segments(segments_per_day, split_sessions(data, days), slot)
+    return segments_per_day
 
 
 def get_text_color(rgb_color, threshold=128):
@@ -77,44 +79,177 @@ def get_text_color(rgb_color, threshold=128):
         return 'white'  # white
 
 
-def print_calendar(intervals, sessions_per_day):
+def sweep(segments, first: int, last: int) -> list:
+    '''Returns the cell of each slot between first and last from the sorted
+    segments of a day. Segments starting later cover the earlier ones.'''
+    cells: List[Optional[tuple]] = [None] * (last - first)
+    for start, end, project, comment in segments:
+        label = project.name + (f' ({comment})' if comment else '')
+        for index in range(max(start, first), min(end, last)):
+            cells[index - first] = (project, label if index == start else '')
+    return cells
+
+
+def create_calendar(days: List[date], segments_per_day, slot: int,
+                    title: Optional[str] = None):
+    '''Returns the table of the segments of the days, or a message if
+    there are none'''
+    from rich import box
+    from rich.style import Style
+    from rich.table import Table
+    from rich.text import Text
+
+    segments = [segment for day in days for segment in segments_per_day[day]]
+    if not segments:
+        return f'No sessions from {days[0]} to {days[-1]}'
+
+    # Find the earliest and latest time regardless of the day
+    first = min(start for start, *_ in segments)
+    last = max(end for _, end, *_ in segments)
+
+    columns = [sweep(segments_per_day[day], first, last) for day in days]
+
     table = Table(show_header=True, box=box.ROUNDED, expand=False,
-                  collapse_padding=True, padding=(0, 0))
+                  collapse_padding=True, padding=(0, 0), title=title)
     table.add_column('Time')
-
     for day in days:
-        table.add_column(day, min_width=5, justify='center')
-
-    for start, end in intervals:
-        row: List[str | Text] = [f'{start.strftime("%H:%M")}']
-        for day in days:
-            cell = ''
-            for dr in sessions_per_day[day]:
-                if dr[0] <= start and dr[1] >= end:
-                    color = dr[2].color
-                    text_color = get_text_color(color.triplet)
-                    cell = Text('', style=Style(color=text_color, bgcolor=color))
-                    if dr[0] == start:
-                        project_name, comment = dr[2].name, dr[3]
-                        cell.append(project_name)
-                        if comment:
-                            cell += f' ({comment})'
-            row.append(cell)
+        table.add_column(f'{day:%a}', min_width=5, justify='center')
+
+    styles = {}
+    for index in range(last - first):
+        minutes = (first + index) * slot
+        row: List[str | Text] = [f'{minutes // 60:02d}:{minutes % 60:02d}']
+        for cells in columns:
+            if cells[index] is None:
+                row.append('')
+                continue
+            project, label = cells[index]
+            if project.name not in styles:
+                color = project.color
+                text_color = get_text_color(color.get_truecolor())
+                styles[project.name] = Style(color=text_color, bgcolor=color)
+            row.append(Text(label, style=styles[project.name]))
         table.add_row(*row)
 
-    print(table)
+    return table
+
+
+def get_calendars(days: List[date], segments_per_day, slot: int,
+                  show_title: bool):
+    '''Yields the calendar of each week of the days'''
+    for i in range(0, len(days), 7):
+        chunk = days[i:i + 7]
+        title = f'{chunk[0]} - {chunk[-1]}' if show_title else None
+        yield create_calendar(chunk, segments_per_day, slot, title)
+
+
+class CalendarView(View):
+    '''Calendar of the data at the time it was loaded. The segments of the
+    completed sessions are computed once, the ones of the running session
+    up to the time shown.'''
+
+    def __init__(self, data: Data, days: List[date], slot: int,
+                 show_title: bool):
+        super().__init__()
+        self.days = days
+        self.slot = slot
+        self.show_title = show_title
+        self.range = day_range(days)
+        self.segments_per_day: Dict[date, list] = {day: [] for day in days}
+        self.running: list = []
+        for project, session in data.sessions_between(*self.range):
+            if session.end is None:
+                self.running.append((project, session))
+                continue
+            add_segments(self.segments_per_day,
+                         split_session(project, session, *self.range,
+                                       data.now), slot)
+
+    def content(self, now: datetime):
+        '''Returns the segments of the running session at the time'''
+        running: Dict[date, list] = {day: [] for day in self.days}
+        for project, session in self.running:
+            add_segments(running, split_session(project, session,
+                                                *self.range, now), self.slot)
+        return running
+
+    def render(self, running: Dict[date, list]):
+        from rich.console import Group
+
+        # Segments stay sorted by start, the running session is the last
+        segments_per_day = {
+            day: sorted(segments + running[day], key=lambda s: s[0])
+            for day, segments in self.segments_per_day.items()}
+        return Group(*get_calendars(self.days, segments_per_day, self.slot,
+                                    self.show_title))
+
+
+def get_days(week, weeks, from_, to) -> List[date]:
+    '''Returns the days shown by the calendar'''
+    from rich import print
+    if from_ is not None:
+        first = from_.date()
+        last = to.date() if to else first + timedelta(days=6)
+    elif to is not None:
+        print('The --to option requires --from')
+        exit(1)
+    else:
+        week_start, _ = week_range()
+        first = week_start.date() + timedelta(weeks=week)
+        last = first + timedelta(weeks=weeks, days=-1)
+
+    if last < first:
+        print('The last day is before the first day')
+        exit(1)
 
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
 
-@click.command('cal', help='Show calendar for the week')
-@click.pass_obj
-def calendar(data: Data):
-    sessions_per_day = get_sessions_per_day(data)
 
-    # Find the earliest and latest time regardless of the day
-    earliest, latest = earliest_and_latest(sessions_per_day)
-    assert earliest and latest, 'No sessions found for this week'
+def get_window(week, weeks, from_, to, **_) -> Window:
+    return Window(*day_range(get_days(week, weeks, from_, to)))
 
-    # Get intervals
-    intervals = get_intervals(earliest, latest)
 
-    print_calendar(intervals, sessions_per_day)
+@click.command('cal', help='Show calendar for the week')
+@click.option('-w', '--week', default=0, type=click.INT,
+              help='Week to show relative to the current one, e.g. -1')
+@click.option('--weeks', default=1, type=click.IntRange(min=1),
+              help='Number of weeks to show')
+@click.option('--from', 'from_', default=None, type=DATE,
+              help='First day to show instead of a week')
+@click.option('--to', default=None, type=DATE,
+              help='Last day to show, a week after --from by default')
+@click.option('-s', '--slot', default='30',
+              type=click.Choice(['15', '30', '60']), help='Minutes per row')
+@click.option('--live', is_flag=True,
+              help='Keep the calendar open and update it')
+@format_option
+@pass_data(get_window)
+def calendar(data: Data, week, weeks, from_, to, slot, live, output_format):
+    from rich import print
+    slot = int(slot)
+    days = get_days(week, weeks, from_, to)
+    if output_format:
+        if live:
+            print('The --live option can\'t be used with --format')
+            exit(1)
+        records = ((project.name, start, end, session.comment)
+                   for project, session, start, end
+                   in split_sessions(data, days))
+        write_records(output_format, FIELDS, records)
+        return
+
+    # Only the current week is shown without a title
+    show_title = from_ is not None or week != 0 or weeks > 1
+    if live:
+        # The days of the current week change with the date
+        watch(data, lambda: load_file(get_window(week, weeks, from_, to)),
+              lambda data: CalendarView(data, get_days(week, weeks, from_, to),
+                                        slot, show_title))
+        return
+
+    with profiling.phase('aggregate'):
+        segments_per_day = get_segments_per_day(data, days, slot)
+
+    with profiling.phase('render'):
+        for table in get_calendars(days, segments_per_day, slot, show_title):
+            print(table)
@@ -0,0 +1,25 @@
+import click
+from os import path, remove
+
+from strack import file_utils
+from strack.client import FORWARDED, is_running, socket_path
+from strack.data import Data
+
+
+@click.command(help='Keep the data in memory and answer '
+               f'{", ".join(sorted(FORWARDED))} over a socket')
+@click.pass_obj
+def daemon(data: Data):
+    from strack.daemon import Daemon
+
+    file = file_utils.DATA_FILE
+    if is_running(file):
+        print('A daemon is already running for this data file.')
+        exit(1)
+
+    # Remove the socket left behind by a daemon that didn't shut down
+    if path.exists(socket_path(file)):
+        remove(socket_path(file))
+
+    print(f'Listening on {socket_path(file)}')
+    Daemon(data, socket_path(file)).run()
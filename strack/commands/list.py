@@ -0,0 +1,118 @@
+import click
+from itertools import islice
+from typing import Optional
+
+from strack.data import Data
+from strack.data.stream import Window
+from strack.file_utils import pass_data
+from strack.output import format_option, write_records
+
+DATE = click.DateTime(['%Y-%m-%d', '%Y-%m-%d %H:%M'])
+HEADERS = ['Project', 'Date', 'Start', 'End', 'Duration', 'Comment']
+FIELDS = ['project', 'start', 'end', 'duration', 'comment']
+
+# Rows rendered at once when the output goes through the pager
+CHUNK_SIZE = 200
+
+
+def get_window(since, before, projects) -> Optional[Window]:
+    '''Returns the sessions to read, all of them without filters'''
+    if since is None and before is None and projects is None:
+        return None
+    return Window(since, before, projects)
+
+
+@click.command(name='list', help='Lists sessions')
+@click.argument('project_name', required=False)
+@click.option('-n', '--limit', default=None, type=click.INT,
+              help='Limit the number of sessions shown')
+@click.option('--since', default=None, type=DATE,
+              help='Only show sessions started after this date')
+@click.option('--before', default=None, type=DATE,
+              help='Only show sessions ended before this date')
+@format_option
+@pass_data(lambda project_name, since, before, **_: get_window(
+    since, before, [project_name] if project_name else None))
+def list_sessions(data: Data, project_name, limit, since, before,
+                  output_format):
+    from rich import print
+    from rich.console import Console
+
+    # Get sessions of the project sorted by start time, latest first
+    projects = [project_name] if project_name else None
+    sessions = data.recent_sessions(since, before, projects)
+
+    if output_format:
+        records = ((project.name, session.start, session.end,
+                    session.duration(data.now), session.comment)
+                   for project, session in islice(sessions, limit or None))
+        write_records(output_format, FIELDS, records)
+        return
+
+    # Limit number of sessions
+    rows = (make_row(data, project, session)
+            for project, session in islice(sessions, limit or None))
+
+    # Only read as many rows as needed to know whether a pager is needed
+    console = Console()
+    first_rows = list(islice(rows, console.height + 1))
+    if len(first_rows) <= console.height:
+        print(make_table(first_rows))
+        return
+
+    names = [project.name for project in data.projects]
+    widths = column_widths(console, names)
+    click.echo_via_pager(render_chunks(console, first_rows, rows, widths),
+                         color=console.is_terminal)
+
+
+def make_row(data: Data, project, session) -> list:
+    start_time = session.start
+    end_time = session.end or data.now
+    return [project.name,
+            f'{start_time:%Y-%m-%d}', f'{start_time:%H:%M}',
+            f'{end_time:%H:%M}', session.duration_str(data.now),
+            session.comment or '']
+
+
+def make_table(rows, widths=None, show_header=True):
+    from rich import box
+    from rich.table import Table
+
+    table = Table(box=box.ROUNDED, show_header=show_header)
+    for index, header in enumerate(HEADERS):
+        width = widths and widths[index]
+        table.add_column(header, width=width,
+                         no_wrap=bool(widths) and index < 5)
+    for row in rows:
+        table.add_row(*row)
+    return table
+
+
+def column_widths(console, names) -> list:
+    '''Returns fixed column widths, so that tables rendered separately
+    line up'''
+    widths = [max(map(len, names), default=0), 10, 5, 5, 8]
+    widths[0] = max(widths[0], len(HEADERS[0]))
+    # Each column has two spaces of padding and a border on its left side
+    used = sum(widths) + len(HEADERS) * 3 + 1
+    widths.append(max(len(HEADERS[-1]), console.width - used))
+    return widths
+
+
+def render_chunks(console, first_rows, rows, widths):
+    '''Renders the rows as one table, a chunk at a time, so the pager can
+    show the first page before the last rows are read'''
+    chunk, show_header = first_rows, True
+    bottom = ''
+    while chunk:
+        with console.capture() as capture:
+            console.print(make_table(chunk, widths, show_header))
+        lines = capture.get().splitlines(keepends=True)
+        # Chunks are glued together by dropping their inner borders
+        if not show_header:
+            lines = lines[1:]
+        bottom = lines.pop()
+        yield ''.join(lines)
+        chunk, show_header = list(islice(rows, CHUNK_SIZE)), False
+    yield bottom
@@ -1,9 +1,4 @@
 import click
-from rich.prompt import Confirm
-from rich.color import Color, ColorParseError
-from rich.text import Text
-from rich.style import Style
-from rich import print
 
 from strack.file_utils import save_file
 from strack.data.project import random_color
@@ -18,6 +13,7 @@ def project():
 @click.argument('project_name')
 @click.pass_obj
 def project_add(data, project_name):
+    from rich import print
     if data.has_project(project_name):
         print(f'Project "{project_name}" already exists.')
     else:
@@ -30,10 +26,13 @@ def project_add(data, project_name):
 @click.argument('project_name')
 @click.pass_obj
 def project_remove(data, project_name):
+    from rich import print
     if not data.has_project(project_name):
         print(f'Project "{project_name}" doesn\'t exist.')
         exit(1)
 
+    from rich.prompt import Confirm
+
     session_count = data.get_project(project_name).session_count()
     confirmed = Confirm.ask((
         f'Are you sure you want to remove the project "{project_name}"'
@@ -50,6 +49,7 @@ def project_remove(data, project_name):
 @click.argument('new_name')
 @click.pass_obj
 def project_rename(data, old_name, new_name):
+    from rich import print
     if not data.has_project(old_name):
         print(f'Project "{old_name}" doesn\'t exist.')
         exit(1)
@@ -58,7 +58,7 @@ def project_rename(data, old_name, new_name):
         print(f'There is already a project with the name "{new_name}".')
         exit(1)
 
-    data.get_project(old_name).name = new_name
+    data.rename_project(old_name, new_name)
     save_file(data)
     print(f'Project "{old_name}" has been renamed to "{new_name}".')
 
@@ -66,6 +66,9 @@ def project_rename(data, old_name, new_name):
 @project.command(name='list', help='List projects')
 @click.pass_obj
 def project_list(data):
+    from rich import print
+    from rich.style import Style
+    from rich.text import Text
 
     for project in data.projects:
         text = Text(' ⬤', style=Style.from_color(project.color))
@@ -78,12 +81,17 @@ def project_list(data):
 @click.argument('color')
 @click.pass_obj
 def project_set_color(data, project_name, color):
+    from rich import print
+    from rich.color import Color, ColorParseError
+    from rich.style import Style
+    from rich.text import Text
+
     if not data.has_project(project_name):
         print(f'Project "{project_name}" doesn\'t exist.')
         exit(1)
 
     if color == 'random':
-        color = random_color()
+        color = Color.parse(random_color())
     else:
         try:
             color = Color.parse(color)
@@ -91,7 +99,7 @@ def project_set_color(data, project_name, color):
             print(f'Invalid color: "{color}"')
             exit(1)
 
-    data.get_project(project_name).color = color
+    data.set_color(project_name, color)
     save_file(data)
 
     style = Style.from_color(color=color)
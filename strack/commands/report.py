@@ -1,94 +1,221 @@
-from rich.style import Style
-from rich.table import Table
-from rich import print, box
 import click
-from datetime import date
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
-from strack.utils import is_this_week, format_duration
+from strack import profiling
+from strack.utils import week_range, format_duration
 from strack.data import Data
+from strack.data.stream import Window
+from strack.file_utils import pass_data
+from strack.output import format_option, write_records
+
+if TYPE_CHECKING:
+    from rich.table import Table
 
 days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
 
+DATE = click.DateTime(['%Y-%m-%d'])
+
+# A column of the report: its header and its first and last day (exclusive)
+Column = Tuple[str, date, date]
+
+FIELDS = ['project', 'start', 'end', 'duration']
+
+
+def next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def parse_month(value: str) -> date:
+    from rich import print
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        print(f'Invalid month "{value}", expected YYYY-MM')
+        exit(1)
+
+
+def parse_year(value: str) -> date:
+    from rich import print
+    if not value.isdigit() or len(value) != 4:
+        print(f'Invalid year "{value}", expected YYYY')
+        exit(1)
+    return date(int(value), 1, 1)
+
+
+def get_range(month, year, from_, to) -> Tuple[date, date, str]:
+    '''Returns the first and last day (exclusive) of the report and the
+    header of its total column'''
+    from rich import print
+    if sum(option is not None for option in (month, year, from_)) > 1:
+        print('Only one of --month, --year and --from can be used')
+        exit(1)
+    if to is not None and from_ is None:
+        print('The --to option requires --from')
+        exit(1)
+
+    today = date.today()
+    if month is not None:
+        first = parse_month(month) if month else today.replace(day=1)
+        return first, next_month(first), 'Month'
+    if year is not None:
+        first = parse_year(year) if year else today.replace(month=1, day=1)
+        return first, first.replace(year=first.year + 1), 'Year'
+    if from_ is not None:
+        last = to.date() if to is not None else today
+        if last < from_.date():
+            print('The last day is before the first day')
+            exit(1)
+        return from_.date(), last + timedelta(days=1), 'Range'
+
+    week_start, week_end = week_range()
+    return week_start.date(), week_end.date(), 'Week'
+
+
+def get_columns(first: date, end: date, group_by: str,
+                is_week: bool) -> List[Column]:
+    '''Splits the range into columns of a day, week or month'''
+    columns = []
+    start = first
+    while start < end:
+        if group_by == 'day':
+            stop = start + timedelta(days=1)
+            label = (days[start.weekday()] if is_week
+                     else f'{days[start.weekday()]} {start.day:02d}')
+        elif group_by == 'week':
+            stop = start + timedelta(days=7 - start.weekday())
+            label = f'W{start.isocalendar()[1]:02d}'
+        else:
+            stop = next_month(start)
+            same_year = first.year == (end - timedelta(days=1)).year
+            label = f'{start:%b}' if same_year else f'{start:%b %y}'
+        stop = min(stop, end)
+        columns.append((label, start, stop))
+        start = stop
+    return columns
+
 
-def create_table():
+def create_table(columns: List[Column], period: str, header: str = 'Project'):
     '''Creates a table for the report command'''
+    from rich import box
+    from rich.style import Style
+    from rich.table import Table
+
     # Create the table
     table = Table(box=box.ROUNDED, show_footer=True)
 
-    table.add_column('Project')
-    today_day = date.today().weekday()
-    for index, day in enumerate(days):
-        if index == today_day:
-            table.add_column(day, justify='center',
+    table.add_column(header)
+    today = date.today()
+    for label, start, end in columns:
+        if start <= today < end:
+            table.add_column(label, justify='center',
                              style=Style(color='blue'),
                              header_style=Style(color='blue'),
                              footer_style=Style(color='blue'))
-        elif index > today_day:
-            table.add_column(day, justify='center',
+        elif start > today:
+            table.add_column(label, justify='center',
                              style=Style(color='bright_black'),
                              header_style=Style(color='bright_black'),
                              footer_style=Style(color='bright_black'))
         else:
-            table.add_column(day, justify='center')
-    table.add_column('Week')
+            table.add_column(label, justify='center')
+    table.add_column(period)
     table.add_column('Total')
 
     return table
 
 
-def get_project_duration_per_day(project):
-    '''Returns a list of the duration per day for the project'''
-    duration_per_day = [0 for _ in days]
-    for session in project.sessions:
-        # Ignare sessions that are not this week
-        if not is_this_week(session.start):
-            continue
-
-        # Calculate duration
-        duration = session.duration()
-
-        # Increment time for the day
-        weekday = session.start.weekday()
-        duration_per_day[weekday] += duration
-
-    return duration_per_day
+def get_duration_per_column(per_day: Dict[date, float], first: date,
+                            columns: List[Column]) -> List[float]:
+    '''Returns a list of the duration per column of the durations per day'''
+    count = (columns[-1][2] - first).days
+    # The sum of any days is the difference of two prefix sums
+    sums = [0, *accumulate(
+        per_day.get(first + timedelta(days=index), 0)
+        for index in range(count))]
+    return [sums[(end - first).days] - sums[(start - first).days]
+            for _, start, end in columns]
 
 
 @click.command(help='Show report')
-@click.pass_obj
-def report(data: Data):
-    # Calculate the duration per day for each project
-    total_per_day_per_project = [
-        get_project_duration_per_day(project)
-        for project in data.projects]
-
-    # Calculate the total per day
-    total_per_day = [sum(x) for x in zip(*total_per_day_per_project)]
+@click.option('--month', default=None, is_flag=False, flag_value='',
+              metavar='[YYYY-MM]',
+              help='Show a month, the current one by default')
+@click.option('--year', default=None, is_flag=False, flag_value='',
+              metavar='[YYYY]', help='Show a year, the current one by default')
+@click.option('--from', 'from_', default=None, type=DATE,
+              help='First day to show instead of the current week')
+@click.option('--to', default=None, type=DATE,
+              help='Last day to show, today by default')
+@click.option('-g', '--group-by', default=None,
+              type=click.Choice(['day', 'week', 'month']),
+              help='Length of the columns, based on the range by default')
+@format_option
+@pass_data(lambda month, year, from_, to, **_: Window(*(
+    datetime.combine(day, time())
+    for day in get_range(month, year, from_, to)[:2])))
+def report(data: Data, month, year, from_, to, group_by, output_format):
+    from rich import print
+    first, end, period = get_range(month, year, from_, to)
+    if group_by is None:
+        length = (end - first).days
+        group_by = ('day' if length <= 7
+                    else 'week' if length <= 62 else 'month')
+    columns = get_columns(first, end, group_by, period == 'Week')
+
+    # Calculate the duration per column for each project
+    with profiling.phase('aggregate'):
+        durations = data.durations_per_day(datetime.combine(first, time()),
+                                           datetime.combine(end, time()))
+        total_per_column_per_project = [
+            get_duration_per_column(
+                durations.get(project.name, {}), first, columns)
+            for project in data.projects]
+
+    if output_format:
+        # One record per project and column, with the last day included
+        records = (
+            (project.name, start, end - timedelta(days=1), duration)
+            for project, column_totals in zip(data.projects,
+                                              total_per_column_per_project)
+            for (_, start, end), duration in zip(columns, column_totals)
+            if duration > 0)
+        write_records(output_format, FIELDS, records)
+        return
 
     # Create the table
-    table = create_table()
-
-    # Fill the table
-    for project, daily_total in zip(data.projects, total_per_day_per_project):
-        # Format duration for each day
-        per_day = [
-            format_duration(time)
-            if time > 0 else ''
-            for time in daily_total]
-
-        # Calculate weekly and all time total
-        weekly_total = format_duration(sum(daily_total))
-        total = format_duration(project.total_duration())
-
-        table.add_row(project.name, *per_day, weekly_total, total)
-
-    # Show daily totals in footer
+    table = create_table(columns, period)
+    fill_table(table, [
+        (project.name, column_totals, data.total_duration(project.name))
+        for project, column_totals in zip(data.projects,
+                                          total_per_column_per_project)])
+
+    with profiling.phase('render'):
+        print(table)
+
+
+def fill_table(table: 'Table', rows: List[Tuple[str, List[float], float]]):
+    '''Adds the rows, made of a name, the duration per column and the total
+    of all time, and the total per column in the footer'''
+    for name, column_totals, total in rows:
+        # Format duration for each column
+        per_column = [
+            format_duration(duration)
+            if duration > 0 else ''
+            for duration in column_totals]
+
+        # Calculate the total of the range and of all time
+        period_total = format_duration(sum(column_totals))
+        table.add_row(name, *per_column, period_total,
+                      format_duration(total))
+
+    # Show column totals in footer
+    total_per_column = [sum(x) for x in zip(*(row[1] for row in rows))]
     table.columns[0].footer = 'Total'
-    for i, day_total in enumerate(total_per_day):
-        table.columns[i + 1].footer = format_duration(day_total)
-
-    # Show weekly total
-    weekly_total = sum(total_per_day)
-    table.columns[-2].footer = format_duration(weekly_total)
+    for i, column_total in enumerate(total_per_column):
+        table.columns[i + 1].footer = format_duration(column_total)
 
-    print(table)
+    # Show the total of the range
+    period_total = sum(total_per_column)
+    table.columns[-2].footer = format_duration(period_total)
@@ -0,0 +1,171 @@
+import click
+from datetime import datetime
+from typing import List
+
+from strack import file_utils, profiling, prompt
+from strack.data import Data
+from strack.data.stream import Window
+from strack.utils import week_range, format_duration
+from strack.file_utils import pass_data, save_file
+from strack.output import format_option, write_records
+from strack.watch import View, watch as watch_data
+
+STATUS_FIELDS = ['project', 'start', 'duration', 'today', 'week', 'total']
+
+
+@click.command(help='Start tracking a project')
+@click.argument('project_name')
+@click.option('-t', '--time', default=None,
+              help='Start time (current time is used if not specified)')
+@click.pass_obj
+def start(data: Data, project_name, time):
+    from rich import print
+
+    # Check that there is no active project
+    if data.is_active():
+        print(f'Project "{data.get_active().name}" is currently active.')
+        print('Use [bold]strack stop[/bold] to stop the current session')
+        return
+
+    # Check that the project exists#
+    if not data.has_project(project_name):
+        from rich.prompt import Confirm
+
+        print(f'Project "{project_name}" doesn\'t exist.')
+        if Confirm.ask('Do you want to create it?'):
+            data.add_project(project_name)
+        else:
+            exit()
+
+    # Start the session
+    date = datetime.now()
+    if time:
+        start_time = datetime.strptime(time, '%H:%M')
+        date = datetime.combine(date, start_time.time())
+    data.start_session(project_name, date)
+    save_file(data)
+    print(f'{project_name} is now active.')
+
+
+@click.command()
+@click.option('-c', '--comment', default=None, help='Add a comment')
+@click.option('-t', '--time', default=None,
+              help='End time (current time is used if not specified)')
+@click.pass_obj
+def stop(data: Data, comment, time):
+    from rich import print
+    if not data.is_active():
+        print('No active project.')
+        return
+
+    active_project = data.get_active()
+
+    # Set end time
+    date = datetime.now()
+    if time:
+        end_time = datetime.strptime(time, '%H:%M')
+        date = datetime.combine(date, end_time.time())
+
+    active_session = data.stop_session(date, comment)
+    save_file(data)
+
+    # Print summary
+    duration_str = active_session.duration_str()
+    print((f'Session {active_project.name} stopped '
+           f'(Duration: {duration_str})'))
+
+
+def get_totals(active_project, data: Data):
+    '''Returns the time spent on the project today, this week and in total'''
+    # The day is the one of the time the data was loaded at, like the
+    # duration of the running session
+    today = data.now.date()
+    with profiling.phase('aggregate'):
+        durations = data.durations_per_day(
+            *week_range(today), [active_project.name])
+        per_day = durations.get(active_project.name, {})
+        time_total = data.total_duration(active_project.name)
+    return per_day.get(today, 0), sum(per_day.values()), time_total
+
+
+class StatusView(View):
+    '''Status of the data at the time it was loaded. The totals are
+    computed once, the running session is added to them up to the time
+    shown.'''
+
+    def __init__(self, data: Data):
+        super().__init__()
+        self.at = data.now
+        self.project = None
+        if data.is_active():
+            active_project = data.get_active()
+            self.project = active_project.name
+            self.start = active_project.active_session().start
+            self.totals = get_totals(active_project, data)
+
+    def content(self, now: datetime) -> List[str]:
+        if self.project is None:
+            return ['No active project.',
+                    ('Start a session by typing: '
+                     '[bold]strack start [italic]project_name')]
+
+        elapsed = (now - self.at).total_seconds()
+        time_today, time_week, time_total = (
+            total + elapsed for total in self.totals)
+        duration_str = format_duration((now - self.start).total_seconds())
+        return [f'Active project: [bold]{self.project}[/bold]',
+                (f'Current session: [bold]{duration_str}[/bold] '
+                 f'started at {self.start:%H:%M}'),
+                f'Today: {format_duration(time_today)}',
+                f'Week: {format_duration(time_week)}',
+                f'Total: {format_duration(time_total)}']
+
+    def render(self, content: List[str]):
+        from rich.console import Group
+        from rich.text import Text
+        return Group(*map(Text.from_markup, content))
+
+
+@click.command()
+@click.option('--watch', is_flag=True,
+              help='Keep the status open and update it')
+@format_option
+@pass_data(lambda **_: Window(*week_range()))
+def status(data: Data, watch, output_format):
+    from rich import print
+    if output_format:
+        if watch:
+            print('The --watch option can\'t be used with --format')
+            exit(1)
+        records = []
+        if data.is_active():
+            active_project = data.get_active()
+            active_session = active_project.active_session()
+            records.append((active_project.name, active_session.start,
+                            active_session.duration(data.now),
+                            *get_totals(active_project, data)))
+        write_records(output_format, STATUS_FIELDS, records, single=True)
+        return
+
+    if watch:
+        watch_data(data, lambda: file_utils.load_file(Window(*week_range())),
+                   StatusView)
+        return
+
+    for line in StatusView(data).content(data.now):
+        print(line)
+
+
+@click.command(help=('Print the active session for a shell prompt. The '
+                     'format can use {project}, {elapsed}, {start}, {today}, '
+                     '{week}, {project_today} and {project_week}.'))
+@click.argument('format', default=prompt.DEFAULT_FORMAT)
+@click.option('-i', '--idle', default='',
+              help='Format used when no project is active')
+def prompt_segment(format, idle):
+    from rich import print
+    try:
+        click.echo(prompt.render(file_utils.DATA_FILE, format, idle))
+    except ValueError as error:
+        print(error)
+        exit(1)
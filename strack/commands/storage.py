@@ -0,0 +1,51 @@
+import click
+
+from strack.data import Data
+from strack.data.archive import COMPRESSIONS
+from strack.file_utils import (
+    archive_file, can_archive, compact_file, write_file)
+from strack.storage import open_storage
+
+
+@click.command(help='Fold the journal into the data file')
+@click.pass_obj
+def compact(data: Data):
+    from rich import print
+    compact_file(data)
+    print('Data file compacted.')
+
+
+@click.command(help='Import the data from another data file')
+@click.argument('source',
+                type=click.Path(exists=True, resolve_path=True))
+@click.pass_obj
+def migrate(data: Data, source):
+    from rich import print
+    if data.projects:
+        print('The data file already contains projects.')
+        exit(1)
+
+    storage = open_storage(source)
+    data = storage.load()
+    # The other backends have no archives
+    data.restore_archive()
+    write_file(data)
+    session_count = sum(project.session_count() for project in data.projects)
+    print((f'Imported {len(data.projects)} projects and '
+           f'{session_count} sessions from {source}.'))
+
+
+@click.command(help='Move old sessions to compressed archives per year')
+@click.option('--before', required=True, type=click.DateTime(['%Y-%m-%d']),
+              help='Archive the sessions ended before this date')
+@click.option('--compression', default='gzip',
+              type=click.Choice(list(COMPRESSIONS)),
+              help='Compression of the new archive files')
+@click.pass_obj
+def archive(data: Data, before, compression):
+    from rich import print
+    if not can_archive():
+        print('Sessions of this data file format can\'t be archived.')
+        exit(1)
+    count = archive_file(data, before, compression)
+    print(f'Archived {count} sessions ended before {before.date()}.')
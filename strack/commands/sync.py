@@ -0,0 +1,27 @@
+import click
+
+from strack import file_utils, profiling, sync
+from strack.data import Data
+
+
+@click.command('sync', help=('Merge the data of other machines through a '
+                             'shared directory'))
+@click.argument('directory', type=click.Path(exists=True, file_okay=False,
+                                             resolve_path=True))
+@click.pass_obj
+def sync_data(data: Data, directory):
+    from rich import print
+    state = sync.SyncState.load(file_utils.DATA_FILE)
+    if state is None:
+        state = sync.SyncState.create(directory)
+    elif state.directory != directory:
+        print(f'The data file is synced through {state.directory}.')
+        exit(1)
+
+    with profiling.phase('sync'):
+        sent, received = sync.sync(data, state)
+    # Merged changes came from the other machines, they aren't sent back
+    if data.changes:
+        file_utils.commit_file(data, capture=False)
+    state.save(file_utils.DATA_FILE)
+    print(f'Sent {sent} and received {received} changes.')
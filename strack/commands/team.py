@@ -0,0 +1,244 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+from glob import glob
+from os import cpu_count, listdir, path
+from typing import Dict, List, Optional
+import json
+
+import click
+
+from strack import file_utils, profiling
+from strack.commands.report import (
+    DATE, create_table, fill_table, get_columns, get_duration_per_column,
+    get_range)
+from strack.data import Session
+from strack.data.index import to_epoch
+from strack.output import format_option, write_records
+from strack.storage import (
+    SQLITE_SUFFIXES, BINARY_SUFFIX, open_storage, storage_class)
+from strack.storage.cache import AggregateCache, file_key, split_session
+from strack.storage.sharded import MANIFEST
+from strack.storage.storage import atomic_write
+
+# Version of the cache of the summaries, caches of other versions are
+# ignored
+TEAM_CACHE_VERSION = 1
+
+# Extensions of the data files found in a directory
+SUFFIXES = ('.json', BINARY_SUFFIX, *SQLITE_SUFFIXES)
+
+FIELDS = ['person', 'project', 'start', 'end', 'duration']
+
+
+def find_files(patterns: List[str]) -> List[str]:
+    '''Returns the data files of the arguments, which are data files,
+    directories holding data files or glob patterns'''
+    from rich import print
+    files = []
+    for pattern in patterns:
+        if path.isdir(pattern) and not path.exists(
+                path.join(pattern, MANIFEST)):
+            files += [path.join(pattern, name)
+                      for name in sorted(listdir(pattern))
+                      if name.endswith(SUFFIXES)
+                      or path.exists(path.join(pattern, name, MANIFEST))]
+        elif path.exists(pattern):
+            files.append(pattern)
+        else:
+            matches = sorted(glob(pattern))
+            if not matches:
+                print(f'No data file matches "{pattern}".')
+                exit(1)
+            files += matches
+    # Files given twice are only counted once
+    return list(dict.fromkeys(path.realpath(file) for file in files))
+
+
+def person_names(files: List[str]) -> Dict[str, str]:
+    '''Names each person after their data file, without its extension
+    unless two files only differ by it'''
+    stems = [path.splitext(path.basename(file))[0] for file in files]
+    return {file: stem if stems.count(stem) == 1 else path.basename(file)
+            for file, stem in zip(files, stems)}
+
+
+def summarize(file: str) -> dict:
+    '''Returns the duration per project and day of the completed sessions
+    of a data file, their total and the running session. Runs in the
+    worker processes.'''
+    try:
+        # The files of the others are never created, migrated or repaired
+        data = open_storage(file, read_only=True).load()
+    except Exception as error:
+        return {'error': str(error)}
+
+    # The aggregate cache of the file is used if it's up to date
+    cache = getattr(data, 'cache', None) or AggregateCache.build(data)
+    days = {name: dict(per_day) for name, per_day in cache.days.items()}
+    totals = dict(cache.totals)
+    for project in data.projects:
+        totals.setdefault(project.name, 0)
+        if project.rollup is not None:
+            per_day = days.setdefault(project.name, {})
+            for day, duration in project.rollup.days.items():
+                per_day[day] = per_day.get(day, 0) + duration
+            totals[project.name] += project.rollup.total
+
+    running = None
+    if data.is_active():
+        running = [data.active_project,
+                   str(data.get_active().active_session().start)]
+    return {'days': days, 'totals': totals, 'running': running}
+
+
+def load_summaries(files: List[str], cache_file: str,
+                   jobs: Optional[int]) -> Dict[str, dict]:
+    '''Returns the summary of each file. Only the files that changed since
+    the last run are read again, in a pool of processes.'''
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+        if cache.get('version') != TEAM_CACHE_VERSION:
+            cache = {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+    cached = cache.get('files', {})
+
+    keys = {file: file_key(*storage_class(file).data_files(file))
+            for file in files}
+    stale = [file for file in files
+             if cached.get(file, {}).get('key') != keys[file]]
+    if profiling.TRACER is not None:
+        profiling.TRACER.count('files', len(files))
+        profiling.TRACER.count('parsed', len(stale))
+
+    # Starting the workers takes longer than reading a single file
+    jobs = min(jobs or cpu_count() or 1, len(stale))
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(summarize, stale))
+    else:
+        results = [summarize(file) for file in stale]
+
+    for file, summary in zip(stale, results):
+        if 'error' in summary:
+            click.echo(f'Could not read {file}: {summary["error"]}', err=True)
+            continue
+        cached[file] = {'key': keys[file], 'summary': summary}
+
+    # Files that aren't part of the report anymore are forgotten
+    cached = {file: cached[file] for file in files if file in cached}
+    if stale:
+        with atomic_write(cache_file) as f:
+            json.dump({'version': TEAM_CACHE_VERSION, 'files': cached}, f,
+                      separators=(',', ':'))
+    return {file: entry['summary'] for file, entry in cached.items()}
+
+
+def in_range(summary: dict, first: date, end: date,
+             now: datetime) -> Dict[str, Dict[date, float]]:
+    '''Returns the duration per project and day of the summary in the
+    range, counting the running session up to now'''
+    days = [first + timedelta(days=index)
+            for index in range((end - first).days)]
+    durations: Dict[str, Dict[date, float]] = {}
+    for name, per_day in summary['days'].items():
+        for day in days:
+            duration = per_day.get(day.isoformat())
+            if duration:
+                durations.setdefault(name, {})[day] = duration
+
+    if summary['running'] is not None:
+        name, start = summary['running']
+        session = Session(datetime.fromisoformat(start), now)
+        parts = split_session(session,
+                              to_epoch(datetime.combine(first, time())),
+                              to_epoch(datetime.combine(end, time())))
+        per_day = durations.setdefault(name, {})
+        for day, part in parts.items():
+            day = date.fromisoformat(day)
+            per_day[day] = per_day.get(day, 0) + part
+    return durations
+
+
+def running_total(summary: dict, name: str, now: datetime) -> float:
+    total = summary['totals'].get(name, 0)
+    if summary['running'] is not None and summary['running'][0] == name:
+        start = datetime.fromisoformat(summary['running'][1])
+        total += (now - start).total_seconds()
+    return total
+
+
+@click.command('team-report', help='Show the report of several data files')
+@click.argument('files', nargs=-1, required=True)
+@click.option('--month', default=None, is_flag=False, flag_value='',
+              metavar='[YYYY-MM]',
+              help='Show a month, the current one by default')
+@click.option('--year', default=None, is_flag=False, flag_value='',
+              metavar='[YYYY]', help='Show a year, the current one by default')
+@click.option('--from', 'from_', default=None, type=DATE,
+              help='First day to show instead of the current week')
+@click.option('--to', default=None, type=DATE,
+              help='Last day to show, today by default')
+@click.option('-g', '--group-by', default=None,
+              type=click.Choice(['day', 'week', 'month']),
+              help='Length of the columns, based on the range by default')
+@click.option('--by', 'rows', default='project',
+              type=click.Choice(['project', 'person']),
+              help='Show a row per project or per person')
+@click.option('-j', '--jobs', default=None, type=click.IntRange(min=1),
+              help='Number of files read at once, one per CPU by default')
+@format_option
+def team_report(files, month, year, from_, to, group_by, rows, jobs,
+                output_format):
+    from rich import print
+    first, end, period = get_range(month, year, from_, to)
+    if group_by is None:
+        length = (end - first).days
+        group_by = ('day' if length <= 7
+                    else 'week' if length <= 62 else 'month')
+    columns = get_columns(first, end, group_by, period == 'Week')
+
+    files = find_files(files)
+    names = person_names(files)
+    with profiling.phase('load'):
+        summaries = load_summaries(
+            files, file_utils.DATA_FILE + '.team-cache', jobs)
+
+    # Duration per column and total of each person and project
+    now = datetime.now()
+    with profiling.phase('aggregate'):
+        results = []
+        for file, summary in summaries.items():
+            durations = in_range(summary, first, end, now)
+            for name in summary['totals']:
+                results.append((
+                    names[file], name,
+                    get_duration_per_column(durations.get(name, {}), first,
+                                            columns),
+                    running_total(summary, name, now)))
+
+    if output_format:
+        # One record per person, project and column, with the last day
+        records = (
+            (person, project, start, end - timedelta(days=1), duration)
+            for person, project, column_totals, _ in results
+            for (_, start, end), duration in zip(columns, column_totals)
+            if duration > 0)
+        write_records(output_format, FIELDS, records)
+        return
+
+    # Rows are merged by project or person, in order of appearance
+    merged: Dict[str, list] = {}
+    for person, project, column_totals, total in results:
+        row = merged.setdefault(person if rows == 'person' else project,
+                                [[0] * len(columns), 0])
+        row[0] = [a + b for a, b in zip(row[0], column_totals)]
+        row[1] += total
+
+    table = create_table(columns, period, rows.capitalize())
+    fill_table(table, [(name, column_totals, total)
+                       for name, (column_totals, total) in merged.items()])
+
+    with profiling.phase('render'):
+        print(table)
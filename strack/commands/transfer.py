@@ -0,0 +1,191 @@
+import click
+import csv
+import json
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from strack.data import Data, Session
+from strack.commands.list import get_window
+from strack.file_utils import pass_data, save_file
+
+DATE = click.DateTime(['%Y-%m-%d', '%Y-%m-%d %H:%M'])
+FIELDS = ['project', 'start', 'end', 'comment']
+
+# Columns of the detailed CSV export of Toggl Track
+TOGGL_FIELDS = ['Project', 'Description', 'Start date', 'Start time',
+                'End date', 'End time']
+NO_PROJECT = 'No project'
+
+# Number of sessions validated before they are added to their projects
+BATCH_SIZE = 1000
+
+
+def guess_format(file_name: str) -> str:
+    if file_name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(f, format: str) -> Iterator[Tuple[int, dict]]:
+    '''Yields the line number and fields of each session of the file'''
+    if format == 'jsonl':
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f'Line {number}: invalid JSON')
+        return
+
+    reader = csv.DictReader(f)
+    fields = reader.fieldnames or []
+    if format == 'csv' and 'Start date' not in fields:
+        missing = [field for field in FIELDS[:3] if field not in fields]
+        if missing:
+            raise ValueError(f'Missing columns: {", ".join(missing)}')
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    missing = [field for field in TOGGL_FIELDS if field not in fields]
+    if missing:
+        raise ValueError(f'Missing Toggl columns: {", ".join(missing)}')
+    for row in reader:
+        yield reader.line_num, {
+            'project': row['Project'] or NO_PROJECT,
+            'start': f'{row["Start date"]} {row["Start time"]}',
+            'end': f'{row["End date"]} {row["End time"]}',
+            'comment': row['Description'],
+        }
+
+
+def parse_time(value, field: str) -> datetime:
+    if not value or value == 'None':
+        raise ValueError(f'missing {field}')
+    try:
+        dt = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f'invalid {field} "{value}"')
+    # Times are stored in local time
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def parse_session(row: dict) -> Tuple[str, Session]:
+    '''Returns the project and session of the row, if they are valid'''
+    name = str(row.get('project') or '').strip()
+    if not name:
+        raise ValueError('missing project')
+    start = parse_time(row.get('start'), 'start')
+    end = parse_time(row.get('end'), 'end')
+    if end < start:
+        raise ValueError('the session ends before it starts')
+    return name, Session(start=start, end=end,
+                         comment=row.get('comment') or None)
+
+
+def timing(count: int, started: float) -> str:
+    '''Returns the time since started and the number of sessions per
+    second'''
+    elapsed = time.perf_counter() - started
+    # The clock may not have advanced for a few sessions
+    rate = f'{count / elapsed:.0f}' if elapsed > 0 else '-'
+    return f'in {elapsed:.2f}s ({rate} sessions/s)'
+
+
+def add_batch(data: Data, batch: Dict[str, List[Session]]) -> int:
+    '''Adds the sessions to their projects, and returns the number of
+    projects that had to be created'''
+    created = 0
+    for name, sessions in batch.items():
+        if not data.has_project(name):
+            data.add_project(name)
+            created += 1
+        elif data.is_active(name):
+            # The running session has to remain the last one
+            running = data.get_active().active_session()
+            if any(session.start >= running.start for session in sessions):
+                raise ValueError(
+                    f'Sessions of "{name}" start after its running session')
+        data.import_sessions(name, sessions)
+    return created
+
+
+@click.command(name='import', help='Import sessions from a CSV or JSONL file')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('-f', '--format', default=None,
+              type=click.Choice(['csv', 'jsonl', 'toggl']),
+              help='Format of the file, guessed from its name by default')
+@click.pass_obj
+def import_sessions(data: Data, file, format):
+    format = format or guess_format(file.name)
+    started = time.perf_counter()
+
+    # Everything is validated before the data file is written once
+    count = created = 0
+    batch: Dict[str, List[Session]] = {}
+    try:
+        for number, row in read_rows(file, format):
+            try:
+                name, session = parse_session(row)
+            except (ValueError, TypeError, AttributeError) as error:
+                raise ValueError(f'Line {number}: {error}')
+            batch.setdefault(name, []).append(session)
+            count += 1
+            if count % BATCH_SIZE == 0:
+                created += add_batch(data, batch)
+                batch = {}
+        created += add_batch(data, batch)
+    except ValueError as error:
+        click.echo(f'{error}. Nothing was imported.', err=True)
+        exit(1)
+
+    save_file(data)
+    click.echo((f'Imported {count} sessions ({created} new projects) '
+                f'{timing(count, started)}.'))
+
+
+@click.command(name='export', help='Export completed sessions to CSV or JSONL')
+@click.argument('file', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('-f', '--format', default=None,
+              type=click.Choice(['csv', 'jsonl']),
+              help='Format of the file, guessed from its name by default')
+@click.option('-p', '--project', 'projects', multiple=True,
+              help='Only export sessions of this project')
+@click.option('--since', default=None, type=DATE,
+              help='Only export sessions started after this date')
+@click.option('--before', default=None, type=DATE,
+              help='Only export sessions started before this date')
+@pass_data(lambda projects, since, before, **_: get_window(
+    since, before, list(projects) or None))
+def export_sessions(data: Data, file, format, projects, since, before):
+    format = format or guess_format(file.name)
+    started = time.perf_counter()
+
+    if format == 'jsonl':
+        def write(name: str, session: Session):
+            file.write(json.dumps({'project': name,
+                                   **session.__serialize__()}) + '\n')
+    else:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+
+        def write(name: str, session: Session):
+            writer.writerow([name, session.start.isoformat(),
+                             session.end.isoformat(), session.comment or ''])
+
+    # Rows are written as the sessions are read, in order of start
+    count = 0
+    sessions = data.sessions_between(since, before, list(projects) or None)
+    for project, session in sessions:
+        if session.end is None or (since and session.start < since):
+            continue
+        write(project.name, session)
+        count += 1
+
+    # The file may be the standard output
+    click.echo(f'Exported {count} sessions {timing(count, started)}.',
+               err=True)
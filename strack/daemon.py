@@ -0,0 +1,117 @@
+from contextlib import redirect_stdout
+from datetime import datetime
+from os import path, remove
+from signal import SIGINT, SIGTERM
+import asyncio
+import io
+import json
+import sys
+
+import click
+import rich
+
+from strack import file_utils
+from strack.data import Data
+
+
+class Daemon:
+    '''Keeps the data in memory and runs the commands sent by the clients'''
+
+    def __init__(self, data: Data, socket_path: str):
+        self.data = data
+        self.socket_path = socket_path
+
+    def run(self) -> None:
+        file_utils.DEFER_SAVES = True
+        try:
+            asyncio.run(self.serve())
+        finally:
+            file_utils.DEFER_SAVES = False
+
+    async def serve(self) -> None:
+        server = await asyncio.start_unix_server(
+            self.handle, path=self.socket_path)
+
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+        for signal in (SIGINT, SIGTERM):
+            loop.add_signal_handler(
+                signal, lambda: stopped.done() or stopped.set_result(None))
+
+        try:
+            async with server:
+                await stopped
+        finally:
+            self.flush()
+            if path.exists(self.socket_path):
+                remove(self.socket_path)
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        try:
+            request = json.loads(await reader.readline())
+            response = self.execute(request)
+        except Exception as error:
+            response = {'output': f'Error: {error}\n', 'exit_code': 1}
+        writer.write(json.dumps(response).encode() + b'\n')
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    def execute(self, request: dict) -> dict:
+        '''Runs a command on the data and returns what it printed'''
+        from strack.strack import cli
+
+        self.refresh()
+        name, *args = request['args']
+        command = cli.get_command(None, name)
+
+        output = io.StringIO()
+        rich.reconfigure(file=output, width=request.get('width', 80),
+                         force_terminal=request.get('color', False))
+        self.data.now = datetime.now()
+        exit_code = 0
+        stdin = sys.stdin
+        # Prompts fail instead of waiting for input on the daemon's terminal
+        sys.stdin = io.StringIO()
+        try:
+            with redirect_stdout(output):
+                command.main(args, prog_name=f'strack {name}',
+                             obj=self.data, standalone_mode=False)
+        except (EOFError, click.Abort):
+            # The command needs the terminal, the client runs it directly
+            self.flush()
+            return {'fallback': True}
+        except click.ClickException as error:
+            error.show(file=output)
+            exit_code = error.exit_code
+        except SystemExit as error:
+            exit_code = error.code or 0
+        finally:
+            sys.stdin = stdin
+
+        # The changes are saved before the reply, so that the commands and
+        # the prompt reading the data file see them once the client returns
+        self.flush()
+        return {'output': output.getvalue(), 'exit_code': exit_code}
+
+    def refresh(self) -> None:
+        '''Reloads the data if it was changed by another process'''
+        if not file_utils.STORAGE.is_stale():
+            return
+        if self.data.changes:
+            self.flush()
+        else:
+            self.data = file_utils.load_file()
+
+    def flush(self) -> None:
+        '''Saves the pending changes'''
+        if not self.data.changes:
+            return
+
+        with file_utils.lock_file():
+            try:
+                self.data = file_utils.commit_file(self.data)
+            except SystemExit:
+                # The changes conflict with the stored data, which wins
+                self.data = file_utils.load_file()
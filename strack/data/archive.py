@@ -0,0 +1,171 @@
+'''Sessions moved out of the data file into compressed files per year. The
+data file keeps the number, total and duration per day of the archived
+sessions of each project, so that totals and reports don't have to read
+the archives.'''
+from datetime import date, datetime, timedelta
+from os import path
+from typing import Dict, Iterable, List, Optional, Tuple
+import gzip
+import json
+import lzma
+
+from strack import profiling
+from .index import SessionIndex, add_days
+from .project import Project
+from .session import EPOCH, Session, SessionList
+
+ARCHIVE_VERSION = 1
+
+# Extension of the archive files for each compression
+COMPRESSIONS = {'gzip': '.gz', 'lzma': '.xz'}
+
+
+class Rollup:
+    '''Number, total and duration per day of the archived sessions of a
+    project. The sessions are stored under key in the archive files, which
+    stays the same when the project is renamed.'''
+
+    def __init__(self, key: str, count: int = 0, total: float = 0.0,
+                 days: Optional[Dict[str, float]] = None):
+        self.key = key
+        self.count = count
+        self.total = total
+        self.days: Dict[str, float] = days or {}
+
+    def add(self, session: Session) -> None:
+        buckets: Dict[int, int] = {}
+        add_days(buckets, session.start_us, session.end_us)
+        for day, duration in buckets.items():
+            day = (EPOCH.date() + timedelta(days=day)).isoformat()
+            self.days[day] = self.days.get(day, 0) + duration / 10**6
+        self.count += 1
+        self.total += session.duration()
+
+    @staticmethod
+    def from_obj(obj) -> 'Rollup':
+        return Rollup(obj['key'], obj['count'], obj['total'], obj['days'])
+
+    def __serialize__(self):
+        return {
+            'key': self.key,
+            'count': self.count,
+            'total': self.total,
+            'days': self.days,
+        }
+
+
+def open_archive(file: str, mode: str = 'rt', fileobj=None):
+    '''Opens the archive file, or the file object written to it, with the
+    compression of its extension'''
+    opener = lzma.open if file.endswith(COMPRESSIONS['lzma']) else gzip.open
+    return opener(fileobj if fileobj is not None else file, mode)
+
+
+class Archive:
+    '''Archive files of the data, with the sessions started in each year.
+    Every session ended before the date before is archived.'''
+
+    def __init__(self, before: datetime, files: Dict[str, str],
+                 keys: List[str]):
+        self.before = before
+        # Names of the files per year, relative to the data file
+        self.files = files
+        # Keys of every project that was archived, even if it was removed
+        self.keys = keys
+        self.directory = ''
+        self.loaded: Dict[str, Dict[str, SessionList]] = {}
+
+    def path(self, year: str) -> str:
+        return path.join(self.directory, self.files[year])
+
+    def read(self, year: str) -> Dict[str, SessionList]:
+        '''Returns the sessions of the year per project key'''
+        if year not in self.loaded:
+            with profiling.phase('archive'), \
+                    open_archive(self.path(year)) as f:
+                obj = json.load(f)
+            if obj.get('version') != ARCHIVE_VERSION:
+                raise Exception(f'Could not parse archive {self.files[year]}')
+            self.loaded[year] = {key: SessionList(sessions)
+                                 for key, sessions in obj['projects'].items()}
+        return self.loaded[year]
+
+    def years(self, start: Optional[datetime],
+              end: Optional[datetime]) -> List[str]:
+        '''Returns the years whose sessions can overlap the range, sessions
+        started in a year can end in the next one'''
+        return sorted(year for year in self.files
+                      if (start is None or int(year) >= start.year - 1)
+                      and (end is None or int(year) <= end.year))
+
+    def index(self, years: Iterable[str],
+              projects: Dict[str, Project]) -> SessionIndex:
+        '''Returns the index of the archived sessions of the projects, given
+        by key. Sessions of removed projects are left out.'''
+        return SessionIndex((projects[key], sessions)
+                            for year in years
+                            for key, sessions in self.read(year).items()
+                            if key in projects)
+
+    def file_name(self, data_file: str, year: str, compression: str) -> str:
+        '''Returns the file of the year, named after the data file'''
+        if year not in self.files:
+            name, extension = path.splitext(path.basename(data_file))
+            self.files[year] = (f'{name}.{year}{extension}'
+                                f'{COMPRESSIONS[compression]}')
+        return self.files[year]
+
+    def new_key(self, name: str) -> str:
+        '''Returns a key for a project that was never archived'''
+        key = name
+        suffix = 1
+        while key in self.keys:
+            suffix += 1
+            key = f'{name}#{suffix}'
+        self.keys.append(key)
+        return key
+
+    @staticmethod
+    def from_obj(obj) -> 'Archive':
+        return Archive(datetime.fromisoformat(obj['before']), obj['files'],
+                       obj['keys'])
+
+    def __serialize__(self):
+        return {
+            'before': str(self.before),
+            'files': self.files,
+            'keys': self.keys,
+        }
+
+
+def rollup_days(rollups: Iterable[Tuple[str, Rollup]], start: datetime,
+                end: datetime) -> Dict[str, Dict[date, float]]:
+    '''Returns the archived duration per project and day of a range made of
+    whole days'''
+    days = [(start + timedelta(days=index)).date()
+            for index in range((end - start).days)]
+    durations: Dict[str, Dict[date, float]] = {}
+    for name, rollup in rollups:
+        for day in days:
+            duration = rollup.days.get(day.isoformat())
+            if duration:
+                durations.setdefault(name, {})[day] = duration
+    return durations
+
+
+def write_archive(f, sessions: Dict[str, List[Session]]) -> None:
+    '''Writes the sessions per project key to an open archive file'''
+    json.dump({'version': ARCHIVE_VERSION,
+               'projects': {key: [session.__serialize__() for session in items]
+                            for key, items in sessions.items()}},
+              f, separators=(',', ':'))
+
+
+def merge_sessions(old: SessionList, new: List[Session]) -> List[Session]:
+    '''Merges sessions into the archived ones, sorted by start. Sessions
+    that were already archived are only kept once.'''
+    seen = {(session.start_us, session.end_us) for session in old}
+    merged = list(old) + [session for session in new
+                          if (session.start_us, session.end_us) not in seen]
+    merged.sort(key=lambda session: session.start_us)
+    return merged
@@ -1,32 +1,88 @@
 from __future__ import annotations
-from typing import List, Optional
-from .project import Project
+from datetime import date, datetime, time
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+from strack import profiling
+from .archive import Archive, Rollup, rollup_days
+from .index import SessionIndex
+from .project import Project, random_color
+from .session import Session, SessionList, to_epoch
+import heapq
 import json
 
+if TYPE_CHECKING:
+    from rich.color import Color
+
 VERSION = 1
 
+# Version of the binary format of strack.storage.binary
+BINARY_VERSION = 1
+
+
+def serialize(obj):
+    try:
+        return obj.__serialize__()
+    except AttributeError:
+        pass
+    try:
+        return obj.__dict__
+    except AttributeError:
+        pass
+    return obj.__str__()
+
+
+def add_durations(durations: Dict[str, Dict[date, float]],
+                  more: Dict[str, Dict[date, float]]) -> None:
+    for name, days in more.items():
+        per_day = durations.setdefault(name, {})
+        for day, duration in days.items():
+            per_day[day] = per_day.get(day, 0) + duration
+
+
+def journal_generation(header: str) -> int:
+    '''Returns the generation of the snapshot the journal header was written
+    for, or -1 if the header was only partially written'''
+    try:
+        return json.loads(header).get('generation', 0)
+    except json.JSONDecodeError:
+        return -1
+
 
 class Data:
-    def __init__(self, projects=[], active_project=''):
+    def __init__(self, projects=None, active_project='', generation=0,
+                 archive=None):
         self.active_project: Optional[str] = active_project
-        self.projects: List[Project] = projects
+        self.projects: List[Project] = projects if projects is not None else []
         self.version = VERSION
+        # Time used for open sessions, so that a command is consistent
+        self.now: datetime = datetime.now()
+        # Sessions sorted by start time, built when first queried
+        self.index: Optional[SessionIndex] = None
+        # Number of times the journal has been folded into the snapshot
+        self.generation: int = generation
+        # Changes that have not been written to the journal yet
+        self.changes: List[dict] = []
+        # Records of the journal replayed or written since the snapshot
+        self.records: int = 0
+        # Files the old sessions were moved to, None if there are none
+        self.archive: Optional[Archive] = archive
 
-    def has_project(self, name: str) -> bool:
-        return any(project.name == name for project in self.projects)
+    @property
+    def projects(self) -> List[Project]:
+        return self._projects
 
-    def add_project(self, name: str) -> None:
-        self.projects.append(Project(name))
+    @projects.setter
+    def projects(self, projects: List[Project]) -> None:
+        self._projects = projects
+        self.by_name = {project.name: project for project in projects}
 
-    def remove_project(self, name: str) -> None:
-        self.projects = [
-            project for project in self.projects if project.name != name]
+    def has_project(self, name: str) -> bool:
+        return name in self.by_name
 
     def get_project(self, name: str) -> Project:
-        for project in self.projects:
-            if project.name == name:
-                return project
-        raise Exception(f'Project {name} not found')
+        try:
+            return self.by_name[name]
+        except KeyError:
+            raise Exception(f'Project {name} not found')
 
     def get_active(self) -> Project:
         assert self.active_project
@@ -37,8 +93,326 @@ class Data:
             return self.active_project not in ['', None]
         return self.active_project == name
 
-    @staticmethod
-    def from_obj(obj):
+    def add_project(self, name: str, color: Optional[Color] = None) -> None:
+        color_name = color.name if color else random_color()
+        self.record({'op': 'add', 'project': name, 'color': color_name})
+
+    def remove_project(self, name: str) -> None:
+        self.record({'op': 'remove', 'project': name})
+
+    def rename_project(self, old_name: str, new_name: str) -> None:
+        self.record({'op': 'rename', 'project': old_name, 'name': new_name})
+
+    def set_color(self, name: str, color: Color) -> None:
+        self.record({'op': 'set-color', 'project': name, 'color': color.name})
+
+    def start_session(self, name: str, start: datetime) -> Session:
+        return self.record(
+            {'op': 'start', 'project': name, 'start': str(start)})
+
+    def stop_session(self, end: datetime,
+                     comment: Optional[str] = None) -> Session:
+        # The start identifies the session when the data is synced
+        change = {'op': 'stop', 'project': self.active_project,
+                  'start': str(self.get_active().active_session().start),
+                  'end': str(end)}
+        if comment:
+            change['comment'] = comment
+        return self.record(change)
+
+    def import_sessions(self, name: str, sessions: List[Session]) -> None:
+        '''Adds completed sessions to the project in a single change'''
+        self.record({'op': 'import', 'project': name,
+                     'sessions': [session.__serialize__()
+                                  for session in sessions]})
+
+    def find_session(self, name: str, start: datetime) -> Session:
+        '''Returns the session of the project started at the time'''
+        sessions = self.get_project(name).sessions
+        index = sessions.bisect(start)
+        if index == len(sessions) or sessions[index].start != start:
+            raise Exception(f'No session of {name} started at {start}')
+        return sessions[index]
+
+    def sessions_between(self,
+                         start: Optional[datetime] = None,
+                         end: Optional[datetime] = None,
+                         projects: Optional[List[str]] = None,
+                         reverse: bool = False
+                         ) -> Iterator[Tuple[Project, Session]]:
+        '''Returns the sessions overlapping the range, sorted by start time.
+        Sessions crossing the boundaries of the range are not truncated.'''
+        sessions = self.get_index().sessions_between(
+            start, end, self.now, projects, reverse)
+        archived = self.archived_index(start, end)
+        if archived is None:
+            return sessions
+        return heapq.merge(
+            archived.sessions_between(start, end, self.now, projects,
+                                      reverse),
+            sessions, key=lambda item: item[1].start_us, reverse=reverse)
+
+    def recent_sessions(self,
+                        since: Optional[datetime] = None,
+                        before: Optional[datetime] = None,
+                        projects: Optional[List[str]] = None
+                        ) -> Iterator[Tuple[Project, Session]]:
+        '''Yields the sessions started after since and ended before before,
+        latest first. The sorted sessions of each project are merged as
+        they are consumed, so taking the first n costs O(n log projects).'''
+        # Times are compared in microseconds, without building datetimes
+        since_us = to_epoch(since) if since is not None else None
+        before_us = to_epoch(before) if before is not None else None
+        now_us = to_epoch(self.now)
+
+        def latest_first(project):
+            sessions = project.sessions
+            # Sessions started after before can't have ended before it
+            high = sessions.bisect(before) if before else len(sessions)
+            for index in range(high - 1, -1, -1):
+                session = sessions[index]
+                if since_us is not None and session.start_us < since_us:
+                    break
+                end_us = session.end_us
+                if before_us is not None and (
+                        end_us if end_us is not None else now_us) > before_us:
+                    continue
+                yield session.start_us, project, session
+
+        selected = [project for project in self.projects
+                    if projects is None or project.name in projects]
+        merged = heapq.merge(*map(latest_first, selected),
+                             key=lambda x: x[0], reverse=True)
+
+        archive = self.archive
+        if archive is None or (since is not None and since >= archive.before):
+            for _, project, session in merged:
+                yield project, session
+            return
+
+        # Archived sessions all started before the archive date, so the
+        # archives are only opened once the sessions after it are listed
+        before_archive = to_epoch(archive.before)
+        older = []
+        for item in merged:
+            if item[0] < before_archive:
+                older = [item]
+                break
+            yield item[1], item[2]
+        archived = self.archived_sessions(since, before, projects)
+        for _, project, session in heapq.merge(
+                older, merged, archived, key=lambda x: x[0], reverse=True):
+            yield project, session
+
+    def archived_sessions(self, since: Optional[datetime],
+                          before: Optional[datetime],
+                          projects: Optional[List[str]]
+                          ) -> Iterator[Tuple[int, Project, Session]]:
+        '''Yields the archived sessions started after since and ended
+        before before, latest first. Each year is read when it's reached.'''
+        since_us = to_epoch(since) if since is not None else None
+        before_us = to_epoch(before) if before is not None else None
+        for year in reversed(self.archive.years(since, before)):
+            index = self.archive.index([year], self.archived_projects())
+            for project, session in index.sessions_between(
+                    since, before, self.now, projects, reverse=True):
+                if since_us is not None and session.start_us < since_us:
+                    continue
+                if before_us is not None and session.end_us > before_us:
+                    continue
+                yield session.start_us, project, session
+
+    def archived_projects(self) -> Dict[str, Project]:
+        '''Returns the projects with archived sessions by archive key'''
+        return {project.rollup.key: project for project in self.projects
+                if project.rollup is not None}
+
+    def archived_index(self, start: Optional[datetime],
+                       end: Optional[datetime]) -> Optional[SessionIndex]:
+        '''Returns the index of the archived sessions that can overlap the
+        range, or None if the range doesn't reach into the archive'''
+        if self.archive is None or (start is not None
+                                    and start >= self.archive.before):
+            return None
+        return self.archive.index(self.archive.years(start, end),
+                                  self.archived_projects())
+
+    def add_archived(self, durations: Dict[str, Dict[date, float]],
+                     start: datetime, end: datetime,
+                     projects: Optional[List[str]] = None
+                     ) -> Dict[str, Dict[date, float]]:
+        '''Adds the durations of the archived sessions in the range. Ranges
+        made of whole days are read from the rollups.'''
+        if self.archive is None or start >= self.archive.before:
+            return durations
+        if start.time() == time() and end.time() == time():
+            add_durations(durations, rollup_days(
+                ((project.name, project.rollup) for project in self.projects
+                 if project.rollup is not None
+                 and (projects is None or project.name in projects)),
+                start, end))
+        else:
+            add_durations(durations, self.archived_index(
+                start, end).durations_per_day(start, end, self.now, projects))
+        return durations
+
+    def archived_total(self, name: str) -> float:
+        rollup = self.get_project(name).rollup
+        return rollup.total if rollup is not None else 0.0
+
+    def get_index(self) -> SessionIndex:
+        if self.index is None:
+            with profiling.phase('index'):
+                self.index = SessionIndex(
+                    (project, project.sessions) for project in self.projects)
+        return self.index
+
+    def durations_per_day(self,
+                          start: datetime,
+                          end: datetime,
+                          projects: Optional[List[str]] = None
+                          ) -> Dict[str, Dict[date, float]]:
+        '''Returns the duration per project and day of the sessions
+        started in the range'''
+        return self.add_archived(self.get_index().durations_per_day(
+            start, end, self.now, projects), start, end, projects)
+
+    def new_project(self, name: str, color: str) -> Project:
+        return Project(name, color)
+
+    def total_duration(self, name: str) -> float:
+        return (self.get_index().total_durations(self.now).get(name, 0)
+                + self.archived_total(name))
+
+    def archive_sessions(self, before: datetime
+                         ) -> Dict[str, Dict[str, List[Session]]]:
+        '''Removes the sessions ended before the date from the projects and
+        adds them to their rollups. Returns the removed sessions per year
+        they started in and per project key.'''
+        if self.archive is None:
+            self.archive = Archive(before, {}, [])
+        self.archive.before = max(self.archive.before, before)
+        before_us = to_epoch(before)
+
+        archived: Dict[str, Dict[str, List[Session]]] = {}
+        for project in self.projects:
+            kept = []
+            for item, session in zip(project.sessions.items,
+                                     project.sessions):
+                if session.end_us is None or session.end_us > before_us:
+                    kept.append(item)
+                    continue
+                if project.rollup is None:
+                    project.rollup = Rollup(self.archive.new_key(project.name))
+                project.rollup.add(session)
+                archived.setdefault(str(session.start.year), {}).setdefault(
+                    project.rollup.key, []).append(session)
+            project.sessions = SessionList(kept)
+        self.index = None
+        return archived
+
+    def restore_archive(self) -> None:
+        '''Moves the archived sessions back into their projects'''
+        if self.archive is None:
+            return
+        projects = self.archived_projects()
+        for year in self.archive.files:
+            for key, sessions in self.archive.read(year).items():
+                if key in projects:
+                    projects[key].import_sessions(list(sessions))
+        for project in self.projects:
+            project.rollup = None
+        self.archive = None
+        self.index = None
+
+    def record(self, change: dict):
+        '''Applies a change and queues it for the journal'''
+        result = self.apply(change)
+        self.changes.append(change)
+        return result
+
+    def apply(self, change: dict):
+        '''Applies a single journal record to the data'''
+        self.index = None
+        op = change['op']
+        if op == 'add':
+            assert not self.has_project(change['project']), \
+                f'Project "{change["project"]}" already exists'
+            project = self.new_project(change['project'], change['color'])
+            self.projects.append(project)
+            self.by_name[project.name] = project
+        elif op == 'remove':
+            name = change['project']
+            self.projects = [
+                project for project in self.projects if project.name != name]
+            if self.active_project == name:
+                self.active_project = None
+        elif op == 'rename':
+            project = self.by_name.pop(change['project'])
+            project.name = change['name']
+            self.by_name[project.name] = project
+            if self.active_project == change['project']:
+                self.active_project = change['name']
+        elif op == 'set-color':
+            self.get_project(change['project']).color = change['color']
+        elif op == 'start':
+            assert not self.is_active(), 'A session is already active'
+            self.active_project = change['project']
+            session = Session(start=datetime.fromisoformat(change['start']))
+            self.get_active().add_session(session)
+            return session
+        elif op == 'stop':
+            assert self.is_active(change['project']), 'Session is not active'
+            session = self.get_active().active_session()
+            session.end = datetime.fromisoformat(change['end'])
+            if change.get('comment'):
+                session.comment = change['comment']
+            self.active_project = None
+            return session
+        elif op == 'import':
+            sessions = [Session.from_obj(obj) for obj in change['sessions']]
+            self.get_project(change['project']).import_sessions(sessions)
+            return sessions
+        elif op == 'update':
+            session = self.find_session(
+                change['project'], datetime.fromisoformat(change['start']))
+            assert session.end is not None, 'Session is active'
+            session.end = datetime.fromisoformat(change['end'])
+            session.comment = change.get('comment')
+            return session
+        else:
+            raise Exception(f'Unknown journal record: {op}')
+
+    def replay(self, f) -> None:
+        '''Replays the journal on top of the snapshot'''
+        header = f.readline()
+        if not header:
+            return
+
+        # Ignore journals that were already folded into the snapshot
+        if journal_generation(header) != self.generation:
+            return
+
+        for line in f:
+            try:
+                change = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written record can only be the last one
+                break
+            self.apply(change)
+            self.records += 1
+
+    def write_journal(self, f) -> None:
+        '''Appends the pending changes to the journal'''
+        if f.tell() == 0:
+            f.write(json.dumps({'generation': self.generation}) + '\n')
+        for change in self.changes:
+            f.write(json.dumps(change, separators=(',', ':')) + '\n')
+        self.records += len(self.changes)
+        self.changes = []
+
+    @classmethod
+    def from_obj(cls, obj):
         # Verify version
         version = obj.get('version', 0)
         if version < VERSION:
@@ -48,29 +422,32 @@ class Data:
             projects = []
             for project in obj['projects']:
                 projects.append(Project.from_obj(project))
-            return Data(
+            archive = obj.get('archive')
+            return cls(
                 projects=projects,
-                active_project=obj.get('active_project', ''))
+                active_project=obj.get('active_project', ''),
+                generation=obj.get('generation', 0),
+                archive=Archive.from_obj(archive) if archive else None)
         except AttributeError:
             raise Exception('Could not parse Data')
 
+    def __serialize__(self):
+        obj = {
+            'active_project': self.active_project,
+            'projects': self.projects,
+            'version': self.version,
+            'generation': self.generation,
+        }
+        if self.archive is not None:
+            obj['archive'] = self.archive
+        return obj
+
     def __repr__(self):
         return self.__dict__.__str__()
 
     def to_file(self, f):
-        def serialize(obj):
-            try:
-                return obj.__serialize__()
-            except AttributeError:
-                pass
-            try:
-                return obj.__dict__
-            except AttributeError:
-                pass
-            return obj.__str__()
-
         json.dump(self, f, default=serialize, indent=4)
 
-    @staticmethod
-    def from_file(f) -> Data:
-        return Data.from_obj(json.load(f))
+    @classmethod
+    def from_file(cls, f) -> Data:
+        return cls.from_obj(json.load(f))
@@ -0,0 +1,176 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .project import Project
+from .session import EPOCH, Session, SessionList, to_epoch
+
+DAY = 86400 * 10**6
+
+# Sorts after the end of every closed session
+OPEN = 2**63 - 1
+
+
+def add_days(buckets: Dict[int, int], start: int, end: int,
+             offset: int = 0) -> None:
+    '''Adds the time range in microseconds to the buckets of the days it
+    covers, at the key offset + day. Ranges crossing midnight are split.'''
+    while start < end:
+        day = start // DAY
+        part_end = min(end, (day + 1) * DAY)
+        buckets[offset + day] = buckets.get(offset + day, 0) + part_end - start
+        start = part_end
+
+
+def parse(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SessionIndex:
+    '''Sessions of every project stored column-wise and sorted by start.
+
+    Start and end times are kept in int64 arrays of microseconds, next to
+    the project of each session and an index into a table of the distinct
+    comments. The latest end time up to each position is kept as well.
+    Both only increase, which allows finding the sessions overlapping a
+    range by bisection. Session objects are only created for the sessions
+    that are returned.'''
+
+    def __init__(self, lists: Iterable[Tuple[Project, SessionList]]):
+        self.projects: List[Project] = []
+        self.comments: List[Optional[str]] = [None]
+        comment_ids: Dict[str, int] = {}
+
+        rows = []
+        unit = timedelta(microseconds=1)
+        for project, sessions in lists:
+            project_id = len(self.projects)
+            self.projects.append(project)
+            for item in sessions.items:
+                if isinstance(item, Session):
+                    start, end = item.start_us, item.end_us
+                    comment = item.comment
+                else:
+                    start = (parse(item['start']) - EPOCH) // unit
+                    end = parse(item.get('end'))
+                    end = (end - EPOCH) // unit if end is not None else None
+                    comment = item.get('comment')
+
+                if comment is None:
+                    comment_id = 0
+                else:
+                    comment_id = comment_ids.setdefault(
+                        comment, len(comment_ids) + 1)
+
+                rows.append((start, end if end is not None else OPEN,
+                             project_id, comment_id))
+        rows.sort()
+        self.comments += comment_ids
+
+        columns = list(zip(*rows)) if rows else [(), (), (), ()]
+        self.starts = array('q', columns[0])
+        self.ends = array('q', columns[1])
+        self.project_ids = array('i', columns[2])
+        self.comment_ids = array('i', columns[3])
+        self.max_ends = array('q', accumulate(self.ends, max))
+
+        self.totals: Optional[Dict[str, float]] = None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def session(self, index: int) -> Session:
+        end = self.ends[index]
+        return Session.from_epoch(self.starts[index],
+                                  end if end != OPEN else None,
+                                  self.comments[self.comment_ids[index]])
+
+    def overlapping(self, start: Optional[datetime],
+                    end: Optional[datetime]) -> range:
+        '''Returns the positions of the sessions that can overlap the range'''
+        start_us = to_epoch(start) if start is not None else None
+        low = (bisect_right(self.max_ends, start_us)
+               if start_us is not None else 0)
+        high = (bisect_left(self.starts, to_epoch(end))
+                if end is not None else len(self.starts))
+        return range(low, high)
+
+    def project_filter(self, projects: Optional[List[str]]):
+        if projects is None:
+            return None
+        return {project_id for project_id, project in enumerate(self.projects)
+                if project.name in projects}
+
+    def sessions_between(self,
+                         start: Optional[datetime],
+                         end: Optional[datetime],
+                         now: datetime,
+                         projects: Optional[List[str]] = None,
+                         reverse: bool = False
+                         ) -> Iterator[Tuple[Project, Session]]:
+        start_us = to_epoch(start) if start is not None else None
+        now_us = to_epoch(now)
+        selected = self.project_filter(projects)
+
+        indexes = self.overlapping(start, end)
+        for index in reversed(indexes) if reverse else indexes:
+            if selected is not None and self.project_ids[index] not in selected:
+                continue
+            if start_us is not None:
+                # Open sessions end now
+                end_us = self.ends[index]
+                if min(end_us, now_us) <= start_us:
+                    continue
+            yield self.projects[self.project_ids[index]], self.session(index)
+
+    def durations_per_day(self,
+                          start: datetime,
+                          end: datetime,
+                          now: datetime,
+                          projects: Optional[List[str]] = None
+                          ) -> Dict[str, Dict[date, float]]:
+        '''Sums the duration of the sessions in the range per project and
+        day. Sessions crossing midnight are split between the days.'''
+        start_us, end_us, now_us = to_epoch(start), to_epoch(end), to_epoch(now)
+        selected = self.project_filter(projects)
+
+        # Accumulate per (project, day) key, like a weighted bincount
+        buckets: Dict[int, int] = {}
+        first_day = start_us // DAY
+        days = (end_us - 1) // DAY - first_day + 1
+        starts, ends, project_ids = self.starts, self.ends, self.project_ids
+        for index in self.overlapping(start, end):
+            project_id = project_ids[index]
+            if selected is not None and project_id not in selected:
+                continue
+            # Only the part of the session in the range and before now counts
+            add_days(buckets, max(starts[index], start_us),
+                     min(ends[index], now_us, end_us),
+                     project_id * days - first_day)
+
+        durations: Dict[str, Dict[date, float]] = {}
+        for key, duration in buckets.items():
+            project_id, day = divmod(key, days)
+            name = self.projects[project_id].name
+            day = EPOCH.date() + timedelta(days=first_day + day)
+            durations.setdefault(name, {})[day] = duration / 10**6
+        return durations
+
+    def total_durations(self, now: datetime) -> Dict[str, float]:
+        '''Sums the duration of all the sessions per project'''
+        if self.totals is None:
+            now_us = to_epoch(now)
+            sums = [0] * len(self.projects)
+            for start, end, project_id in zip(
+                    self.starts, self.ends, self.project_ids):
+                sums[project_id] += min(end, now_us) - start
+            self.totals = {project.name: total / 10**6
+                           for project, total in zip(self.projects, sums)}
+        return self.totals
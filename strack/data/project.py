@@ -1,36 +1,63 @@
-from .session import Session
-from typing import List
-from rich.color import Color
+from __future__ import annotations
+from .session import Session, SessionList
 from colorsys import hsv_to_rgb
+from typing import TYPE_CHECKING, List, Optional
 import random
 
+if TYPE_CHECKING:
+    from rich.color import Color
+    from .archive import Rollup
 
-def random_color():
+
+def random_color() -> str:
+    '''Returns a random color as a HEX value'''
     hue = random.random()
     hsv = (hue, 0.5, 0.95)
     rgb = hsv_to_rgb(*hsv)
-    return Color.from_rgb(rgb[0] * 255, rgb[1] * 255, rgb[2] * 255)
+    return '#{:02x}{:02x}{:02x}'.format(*(int(c * 255) for c in rgb))
 
 
 class Project:
     def __init__(self, name, color=None):
         self.name: str = name
-        self.color: Color = color or random_color()
-        self.sessions: List[Session] = []
+        self.color = color or random_color()
+        self.sessions: SessionList = SessionList()
+        # Archived sessions, see strack.data.archive
+        self.rollup: Optional[Rollup] = None
+
+    @property
+    def color(self) -> Color:
+        # Colors are only parsed when they are rendered
+        if self._color is None:
+            from rich.color import Color
+            self._color = Color.parse(self.color_name)
+        return self._color
+
+    @color.setter
+    def color(self, color) -> None:
+        if isinstance(color, str):
+            self.color_name: str = color
+            self._color: Optional[Color] = None
+        else:
+            self.color_name = color.name
+            self._color = color
 
     def add_session(self, session: Session) -> None:
-        self.sessions.append(session)
+        self.sessions.insert(session)
+
+    def import_sessions(self, sessions: List[Session]) -> None:
+        self.sessions.extend_sorted(sessions)
 
     def session_count(self) -> int:
         return len(self.sessions)
 
     def active_session(self) -> Session:
-        session = self.sessions[-1]
-        assert session.end is None, 'Session is not active'
+        session = self.sessions.open_session()
+        assert session is not None, 'Session is not active'
         return session
 
-    def total_duration(self) -> int:
-        return sum([session.duration() for session in self.sessions])
+    def total_duration(self, now=None) -> float:
+        return sum([session.duration(now) for session in self.sessions])
 
     @staticmethod
     def from_obj(obj):
@@ -39,26 +66,31 @@ class Project:
         except AttributeError:
             raise Exception('Missing project name')
 
-        try:
-            color = Color.parse(obj['color'])
-        except AttributeError:
-            color = None
-            pass
+        color = obj.get('color')
 
         project = Project(name=name, color=color)
 
+        # Sessions are only decoded when they are accessed
         try:
-            for session in obj['sessions']:
-                project.add_session(Session.from_obj(session))
-        except AttributeError:
+            project.sessions = SessionList(obj['sessions'])
+        except (KeyError, TypeError):
             raise Exception('Missing sessions')
 
+        if 'archived' in obj:
+            from .archive import Rollup
+            project.rollup = Rollup.from_obj(obj['archived'])
+
         return project
 
     def __serialize__(self):
-        data = self.__dict__.copy()
-        data['color'] = self.color.name
-        return data
+        obj = {
+            'name': self.name,
+            'color': self.color_name,
+            'sessions': self.sessions,
+        }
+        if self.rollup is not None:
+            obj['archived'] = self.rollup
+        return obj
 
     def __repr__(self):
         return self.__dict__.__str__()
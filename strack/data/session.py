@@ -1,16 +1,70 @@
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import List, Optional
 from strack.utils import format_duration
+import heapq
+import sys
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch(dt: datetime) -> int:
+    '''Converts a naive datetime to microseconds since the epoch.
+    Whole days since the epoch then match the calendar days of the time.'''
+    return (dt - EPOCH) // MICROSECOND
+
+
+def from_epoch(value: int) -> datetime:
+    return EPOCH + timedelta(0, 0, value)
 
 
 class Session:
+    '''Session whose times are stored as microseconds since the epoch.
+    The datetimes are built when they are accessed, and comments are
+    interned so that repeated comments are only stored once.'''
+    __slots__ = ('start_us', 'end_us', '_comment')
+
     def __init__(self,
                  start: datetime,
                  end: Optional[datetime] = None,
                  comment: Optional[str] = None):
-        self.start: datetime = start
-        self.end: Optional[datetime] = end
-        self.comment: Optional[str] = comment
+        self.start = start
+        self.end = end
+        self.comment = comment
+
+    @classmethod
+    def from_epoch(cls, start_us: int, end_us: Optional[int] = None,
+                   comment: Optional[str] = None) -> 'Session':
+        session = cls.__new__(cls)
+        session.start_us = start_us
+        session.end_us = end_us
+        session.comment = comment
+        return session
+
+    @property
+    def start(self) -> datetime:
+        return from_epoch(self.start_us)
+
+    @start.setter
+    def start(self, start: datetime) -> None:
+        self.start_us = to_epoch(start)
+
+    @property
+    def end(self) -> Optional[datetime]:
+        return from_epoch(self.end_us) if self.end_us is not None else None
+
+    @end.setter
+    def end(self, end: Optional[datetime]) -> None:
+        self.end_us = to_epoch(end) if end is not None else None
+
+    @property
+    def comment(self) -> Optional[str]:
+        return self._comment
+
+    @comment.setter
+    def comment(self, comment: Optional[str]) -> None:
+        self._comment = (sys.intern(comment) if type(comment) is str
+                         else comment)
 
     @staticmethod
     def from_obj(obj):
@@ -27,15 +81,17 @@ class Session:
 
         return Session(start=start, end=end, comment=comment)
 
-    def duration(self) -> float:
-        return ((self.end or datetime.now()) - self.start).total_seconds()
+    def duration(self, now: Optional[datetime] = None) -> float:
+        if self.end_us is not None:
+            return (self.end_us - self.start_us) / 10**6
+        return (to_epoch(now or datetime.now()) - self.start_us) / 10**6
 
-    def duration_str(self) -> str:
-        seconds = self.duration()
+    def duration_str(self, now: Optional[datetime] = None) -> str:
+        seconds = self.duration(now)
         return format_duration(seconds)
 
     def __repr__(self):
-        return self.__dict__.__str__()
+        return self.__serialize__().__str__()
 
     def __serialize__(self):
         obj = {
@@ -46,3 +102,98 @@ class Session:
             obj['comment'] = self.comment
 
         return obj
+
+
+def start_key(item) -> str:
+    '''Returns the start of a session or of its JSON object as a string
+    that can be compared without parsing the date'''
+    if isinstance(item, Session):
+        return str(from_epoch(item.start_us))
+    return item['start'].replace('T', ' ')
+
+
+# Sorts after the end of every closed session
+OPEN_END = '9999-12-31'
+
+
+def end_key(item) -> str:
+    '''Same as start_key for the end of the session'''
+    if isinstance(item, Session):
+        return str(item.end) if item.end is not None else OPEN_END
+    end = item.get('end')
+    if end in [None, 'None']:
+        return OPEN_END
+    return end.replace('T', ' ')
+
+
+class SessionList:
+    '''List of sessions that are decoded from their JSON object only when
+    they are accessed'''
+
+    def __init__(self, items=()):
+        self.items = list(items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.items)))]
+
+        item = self.items[index]
+        if not isinstance(item, Session):
+            item = self.items[index] = Session.from_obj(item)
+        return item
+
+    def __iter__(self):
+        for index in range(len(self.items)):
+            yield self[index]
+
+    def append(self, session: Session) -> None:
+        self.items.append(session)
+
+    def bisect(self, dt: datetime) -> int:
+        '''Returns the index of the first session started at or after dt'''
+        key = str(dt)
+        low, high = 0, len(self.items)
+        while low < high:
+            middle = (low + high) // 2
+            if start_key(self.items[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def extend_sorted(self, sessions: List[Session]) -> None:
+        '''Merges the sessions into the list, keeping it sorted by start'''
+        sessions = sorted(sessions, key=start_key)
+        # Sessions are usually added after the existing ones
+        if (not self.items or not sessions
+                or start_key(self.items[-1]) <= start_key(sessions[0])):
+            self.items.extend(sessions)
+        else:
+            self.items = list(heapq.merge(
+                self.items, sessions, key=start_key))
+
+    def open_session(self) -> Optional[Session]:
+        '''Returns the running session. It's the last one, unless it was
+        started before sessions that were already completed.'''
+        for index in range(len(self.items) - 1, -1, -1):
+            if end_key(self.items[index]) == OPEN_END:
+                return self[index]
+        return None
+
+    def insert(self, session: Session) -> None:
+        '''Inserts the session while keeping the list sorted by start'''
+        key = start_key(session)
+        index = len(self.items)
+        while index > 0 and start_key(self.items[index - 1]) > key:
+            index -= 1
+        self.items.insert(index, session)
+
+    def __serialize__(self):
+        # Sessions that were never decoded are written back unchanged
+        return self.items
+
+    def __repr__(self):
+        return self.items.__str__()
@@ -0,0 +1,188 @@
+'''Incremental decoder for the JSON data file. The file is read in chunks
+and each session object is decoded on its own, so that only the sessions
+of a time window are kept in memory.'''
+from datetime import datetime
+from typing import Iterator, List, NamedTuple, Optional
+import json
+import re
+
+# Characters read from the file at once
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Whitespace around the comma or bracket after an element of an array
+SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+
+class Window(NamedTuple):
+    '''Sessions overlapping the times, of the projects if given'''
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    projects: Optional[List[str]] = None
+
+
+class JsonReader:
+    '''Walks the values of a JSON document without decoding all of it'''
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        '''Reads the next chunk, dropping what was already consumed'''
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        '''Returns the next character that isn't whitespace'''
+        while True:
+            self.position = WHITESPACE.match(
+                self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise Exception(f'Could not parse Data: expected "{char}"')
+        self.position += 1
+
+    def value(self):
+        '''Decodes the next value'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(
+                    self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise Exception('Could not parse Data')
+                continue
+            # A number at the end of the buffer may continue in the file
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.position = end
+            return value
+
+    def keys(self) -> Iterator[str]:
+        '''Yields the keys of an object, the caller reads their values'''
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == '}':
+                self.position += 1
+                return
+            self.expect(',')
+
+    def array(self) -> Iterator:
+        '''Yields the decoded elements of an array of objects or strings'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        scan = self.decoder.scan_once
+        while True:
+            buffer = self.buffer
+            try:
+                value, end = scan(buffer, self.position)
+                separator = SEPARATOR.match(buffer, end)
+            except (StopIteration, json.JSONDecodeError):
+                separator = None
+            # The element or its separator continues in the next chunk
+            if separator is None:
+                if not self.fill():
+                    raise Exception('Could not parse Data')
+                self.peek()
+                continue
+            self.position = separator.end()
+            yield value
+            if separator.group(1) == ']':
+                return
+
+    def elements(self) -> Iterator[None]:
+        '''Yields once per element of an array, the caller reads it'''
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield None
+            if self.peek() == ']':
+                self.position += 1
+                return
+            self.expect(',')
+
+
+def read_sessions(reader: JsonReader, selected: bool, start: Optional[str],
+                  end: Optional[str], totals: bool) -> dict:
+    '''Reads the sessions of a project, keeping the ones in the window and
+    the running one. The completed sessions are counted, and summed if
+    totals is True.'''
+    kept = []
+    count = 0
+    total = 0.0
+    parse = datetime.fromisoformat
+    for obj in reader.array():
+        session_start = obj['start']
+        session_end = obj.get('end')
+        if session_end in (None, 'None'):
+            # The running session is always kept
+            kept.append(obj)
+            continue
+        count += 1
+        if totals:
+            total += (parse(session_end)
+                      - parse(session_start)).total_seconds()
+        if not selected:
+            continue
+        # Times are compared as strings, like start_key and end_key
+        if ((end is None or session_start.replace('T', ' ') < end)
+                and (start is None or start < session_end.replace('T', ' '))):
+            kept.append(obj)
+    return {'sessions': kept, 'count': count, 'total': total}
+
+
+def read_window(f, window: Window, totals: bool = True) -> dict:
+    '''Returns the object of the data file with only the sessions in the
+    window, and the number and total duration of the completed sessions of
+    each project'''
+    reader = JsonReader(f)
+    start = str(window.start) if window.start is not None else None
+    end = str(window.end) if window.end is not None else None
+
+    obj = {}
+    for key in reader.keys():
+        if key != 'projects':
+            obj[key] = reader.value()
+            continue
+        obj['projects'] = []
+        for _ in reader.elements():
+            project = {}
+            for project_key in reader.keys():
+                if project_key != 'sessions':
+                    project[project_key] = reader.value()
+                    continue
+                # Projects whose name comes after their sessions are kept
+                selected = (window.projects is None or 'name' not in project
+                            or project['name'] in window.projects)
+                project.update(read_sessions(
+                    reader, selected, start, end, totals))
+            obj['projects'].append(project)
+    return obj
@@ -1,24 +1,153 @@
+from functools import wraps
+from os import path
+from typing import Optional
+
+import click
+
+from . import profiling, prompt
 from .data import Data
+from .data.session import to_epoch
+from .data.stream import Window
+from .storage import Storage, open_storage
+from .storage.cache import file_key
+from .storage.storage import atomic_write
+from .utils import week_range
 
 
 DATA_FILE = ''
+STORAGE: Storage
+
+# Number of times the changes are replayed on data changed by another process
+RETRIES = 3
+
+# Set by the daemon, which saves the changes once the command has run
+DEFER_SAVES = False
 
 
 def set_file(file):
-    global DATA_FILE
+    global DATA_FILE, STORAGE
     DATA_FILE = file
+    STORAGE = open_storage(file)
 
 
-def load_file() -> Data:
-    try:
-        with open(DATA_FILE) as f:
-            data = Data.from_file(f)
-    except FileNotFoundError:
-        data = Data()
+def lock_file():
+    return STORAGE.lock()
+
+
+def load_file(window: Optional[Window] = None) -> Data:
+    return STORAGE.load(window)
 
+
+def pass_data(window=None):
+    '''Passes the data to the command, like click.pass_obj. The data of
+    read-only commands is loaded here, so that window can return the Window
+    of sessions the command needs from its parameters.'''
+    def decorator(command):
+        @wraps(command)
+        def wrapper(*args, **kwargs):
+            ctx = click.get_current_context()
+            if ctx.obj is None:
+                with profiling.phase('load'):
+                    ctx.obj = load_file(window(**kwargs) if window else None)
+                profiling.count_data(ctx.obj)
+            return command(ctx.obj, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def save_file(data) -> Data:
+    '''Saves the changes of the data, unless the daemon saves them once the
+    command has run'''
+    if DEFER_SAVES:
+        return data
+    return commit_file(data)
+
+
+def commit_file(data, capture: bool = True) -> Data:
+    '''Saves the changes of the data. If another process changed the data
+    file since it was loaded, the changes are replayed on a fresh copy.
+    The changes are sent by the next sync unless capture is False.'''
+    for _ in range(RETRIES):
+        if not STORAGE.is_stale():
+            break
+        data = rebase(data)
+    else:
+        print('The data file keeps being changed by another process')
+        exit(1)
+    with profiling.phase('save'):
+        state = None
+        # The sync module is only imported for data files that are synced
+        if capture and path.exists(sync_state_path(DATA_FILE)):
+            from . import sync
+            state = sync.capture(DATA_FILE, data.changes, STORAGE.load)
+        STORAGE.save(data)
+        # The events are kept once the changes they describe are saved
+        if state is not None:
+            state.save(DATA_FILE)
+        update_state(data)
     return data
 
 
-def save_file(data):
-    with open(DATA_FILE, 'w') as f:
-        data.to_file(f)
+def sync_state_path(file: str) -> str:
+    '''Same as strack.sync.state_path, without importing the module'''
+    return file + '.sync'
+
+
+def rebase(data) -> Data:
+    '''Returns the stored data with the pending changes applied to it'''
+    fresh = STORAGE.load()
+    try:
+        for change in data.changes:
+            fresh.record(change)
+    except Exception as error:
+        print(f'The data file was changed by another process: {error}')
+        exit(1)
+    return fresh
+
+
+def compact_file(data):
+    STORAGE.compact(data)
+    update_state(data)
+
+
+def write_file(data):
+    STORAGE.write(data)
+    update_state(data)
+
+
+def can_archive() -> bool:
+    return STORAGE.supports_archive()
+
+
+def archive_file(data, before, compression) -> int:
+    count = STORAGE.archive(data, before, compression)
+    update_state(data)
+    return count
+
+
+def update_state(data: Data) -> None:
+    '''Writes the active session and the totals of the current day and week
+    for the prompt command, see strack.prompt'''
+    today = data.now.date()
+    durations = data.durations_per_day(*week_range(today))
+    active = data.active_project if data.is_active() else None
+    project = durations.get(active, {})
+
+    def microseconds(seconds: float) -> int:
+        return round(seconds * 10**6)
+
+    fields = {
+        'project': active,
+        'start': (data.get_active().active_session().start_us
+                  if active else None),
+        'at': to_epoch(data.now),
+        'today': microseconds(sum(per_day.get(today, 0)
+                                  for per_day in durations.values())),
+        'week': microseconds(sum(sum(per_day.values())
+                                 for per_day in durations.values())),
+        'project_today': microseconds(project.get(today, 0)),
+        'project_week': microseconds(sum(project.values())),
+    }
+    files = STORAGE.files()
+    with atomic_write(prompt.state_path(DATA_FILE)) as f:
+        f.write(prompt.format_state(zip(files, file_key(*files)), fields))
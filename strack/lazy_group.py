@@ -0,0 +1,28 @@
+from importlib import import_module
+import click
+
+
+class LazyGroup(click.Group):
+    '''Group that only imports the module of a command when it is used'''
+
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Maps command names to 'module.attribute' import paths
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        commands = super().list_commands(ctx)
+        return sorted(commands + list(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands:
+            return self.load_command(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def load_command(self, cmd_name):
+        module_name, attribute = self.lazy_subcommands[cmd_name].rsplit('.', 1)
+        command = getattr(import_module(module_name), attribute)
+        if not isinstance(command, click.Command):
+            raise ValueError(
+                f'Lazy loading of {cmd_name} did not return a command')
+        return command
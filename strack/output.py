@@ -0,0 +1,67 @@
+'''Machine-readable output of the commands, written as the records are
+produced without going through rich'''
+from datetime import date, datetime
+from typing import Iterable, List, Optional
+import csv
+import json
+import os
+import sys
+
+import click
+
+FORMATS = ['json', 'csv', 'tsv']
+
+
+def format_option(command):
+    return click.option(
+        '-f', '--format', 'output_format', default=None,
+        type=click.Choice(FORMATS),
+        help='Print the data in this format instead of a table')(command)
+
+
+def to_value(value):
+    '''Converts times to ISO 8601 and durations to whole seconds'''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return round(value)
+    return value
+
+
+def write_records(format: str, fields: List[str], records: Iterable[tuple],
+                  single: bool = False, file=None) -> None:
+    '''Writes the records, tuples of the fields, as they are produced. A
+    single record is written as a JSON object instead of an array.'''
+    file = file or sys.stdout
+    try:
+        if format == 'json':
+            write_json(file, fields, records, single)
+        else:
+            writer = csv.writer(file, lineterminator='\n',
+                                delimiter='\t' if format == 'tsv' else ',')
+            writer.writerow(fields)
+            for record in records:
+                writer.writerow(['' if value is None else to_value(value)
+                                 for value in record])
+        file.flush()
+    except BrokenPipeError:
+        # The reader stopped early, e.g. head
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, file.fileno())
+
+
+def write_json(file, fields: List[str], records: Iterable[tuple],
+               single: bool) -> None:
+    def encode(record) -> str:
+        return json.dumps(dict(zip(fields, map(to_value, record))))
+
+    if single:
+        record: Optional[tuple] = next(iter(records), None)
+        file.write((encode(record) if record is not None else 'null') + '\n')
+        return
+
+    separator = '[\n'
+    for record in records:
+        file.write(separator + encode(record))
+        separator = ',\n'
+    file.write('[]\n' if separator == '[\n' else '\n]\n')
@@ -0,0 +1,142 @@
+'''Timing of the phases of a command, enabled with the --profile option or
+the STRACK_TRACE environment variable. Only the standard library is
+imported, the profilers are imported when they are requested.'''
+from __future__ import annotations
+from contextlib import contextmanager, nullcontext
+import sys
+import time
+
+# This module is imported before the timing starts, so typing is only
+# imported by type checkers, which treat the name as True
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional
+
+# Imported before the CLI, so that the time spent importing it is known
+STARTED = time.perf_counter()
+
+# Tracer of the running command, None when it isn't traced
+TRACER: Optional[Tracer] = None
+
+OUTPUTS = ['text', 'json']
+
+
+class Tracer:
+    '''Records the wall and CPU time of the phases of a command'''
+
+    def __init__(self, output: str = 'text', cprofile: Optional[str] = None,
+                 tracemalloc: Optional[str] = None):
+        self.output = output
+        self.cprofile_path = cprofile
+        self.tracemalloc_path = tracemalloc
+        self.phases: List[dict] = []
+        self.counts: Dict[str, int] = {}
+        self.depth = 0
+        self.profiler = None
+
+    @staticmethod
+    def parse(spec: str) -> Tracer:
+        '''Creates a tracer from a comma separated list of the output
+        format and of cprofile=FILE and tracemalloc=FILE'''
+        options = {}
+        for item in filter(None, spec.split(',')):
+            key, _, value = item.partition('=')
+            if key in OUTPUTS and not value:
+                options['output'] = key
+            elif key in ('cprofile', 'tracemalloc') and value:
+                options[key] = value
+            elif key not in ('1', 'true', 'yes'):
+                raise ValueError(f'Unknown profiling option "{item}"')
+        return Tracer(**options)
+
+    def start(self) -> None:
+        '''Starts the requested profilers'''
+        self.add('import', time.perf_counter() - STARTED, time.process_time())
+        if self.tracemalloc_path:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cprofile_path:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def add(self, name: str, wall: float, cpu: float) -> None:
+        self.phases.append(
+            {'name': name, 'depth': self.depth, 'wall': wall, 'cpu': cpu})
+
+    @contextmanager
+    def phase(self, name: str):
+        # Phases are listed in the order they started
+        record = {'name': name, 'depth': self.depth}
+        self.phases.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self) -> None:
+        '''Stops the profilers and prints the timings to stderr'''
+        wall = time.perf_counter() - STARTED
+        cpu = time.process_time()
+        result = {'wall': wall, 'cpu': cpu, 'phases': self.phases,
+                  'counts': self.counts}
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.cprofile_path)
+        if self.tracemalloc_path:
+            import tracemalloc
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.take_snapshot().dump(self.tracemalloc_path)
+            tracemalloc.stop()
+
+        if self.output == 'json':
+            import json
+            sys.stderr.write(json.dumps(result) + '\n')
+        else:
+            sys.stderr.write(format_summary(result))
+
+
+def format_summary(result: dict) -> str:
+    lines = [f'{"phase":<20}{"wall":>12}{"cpu":>12}']
+    for phase in result['phases']:
+        name = '  ' * phase['depth'] + phase['name']
+        lines.append((f'{name:<20}{phase["wall"] * 1000:>10.1f}ms'
+                      f'{phase["cpu"] * 1000:>10.1f}ms'))
+    lines.append((f'{"total":<20}{result["wall"] * 1000:>10.1f}ms'
+                  f'{result["cpu"] * 1000:>10.1f}ms'))
+    if result['counts']:
+        lines.append(', '.join(f'{name}: {value}'
+                               for name, value in result['counts'].items()))
+    if 'peak_memory' in result:
+        lines.append(f'peak memory: {result["peak_memory"] / 2**20:.1f} MiB')
+    return '\n'.join(lines) + '\n'
+
+
+def start(spec: str) -> Tracer:
+    global TRACER
+    TRACER = Tracer.parse(spec)
+    TRACER.start()
+    return TRACER
+
+
+def count_data(data) -> None:
+    '''Counts the projects and sessions of the loaded data'''
+    if TRACER is not None:
+        TRACER.count('projects', len(data.projects))
+        TRACER.count('sessions', sum(project.session_count()
+                                     for project in data.projects))
+
+
+def phase(name: str):
+    '''Times the block as a phase of the command, if it is traced'''
+    if TRACER is None:
+        return nullcontext()
+    return TRACER.phase(name)
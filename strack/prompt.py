@@ -0,0 +1,169 @@
+'''Prompt segment read from a small state file next to the data file. The
+state is written whenever the data is saved, so that the prompt doesn't
+have to load the data. Only os, sys and time are imported, times are kept
+in microseconds since the epoch like the sessions.'''
+import os
+import sys
+import time
+
+STATE_VERSION = '1'
+
+DEFAULT_FORMAT = '{project} {elapsed}'
+
+DAY = 86400 * 10**6
+MINUTE = 60 * 10**6
+
+# Totals of the completed sessions and of the running one up to the time
+# the state was written
+TOTALS = ['today', 'week', 'project_today', 'project_week']
+
+
+def state_path(file: str) -> str:
+    return file + '.state'
+
+
+def format_state(files, fields: dict) -> str:
+    '''Returns the content of the state file. Each line holds a name and a
+    value, the files are identified by their inode, mtime and size.'''
+    lines = [f'strack-state {STATE_VERSION}']
+    for file, key in files:
+        key = ' '.join(map(str, key)) if key is not None else '-'
+        lines.append(f'file {key} {file}')
+    for name, value in fields.items():
+        if value is not None:
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def read_state(file: str):
+    '''Returns the fields of the state, or None if it is missing or the data
+    files changed since it was written'''
+    try:
+        with open(state_path(file)) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    if not lines or lines[0] != f'strack-state {STATE_VERSION}':
+        return None
+
+    fields = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(' ')
+        if name != 'file':
+            fields[name] = value
+            continue
+        # Inode, mtime and size, then the path which may contain spaces
+        parts = value.split(' ', 3)
+        if parts[0] == '-':
+            key, path = None, value[2:]
+        else:
+            key, path = parts[:3], parts[3]
+        try:
+            info = os.stat(path)
+            current = [str(info.st_ino), str(info.st_mtime_ns),
+                       str(info.st_size)]
+        except FileNotFoundError:
+            current = None
+        if current != key:
+            return None
+    return fields
+
+
+def local_now() -> int:
+    '''Returns the local time in microseconds since the epoch, like the
+    naive datetimes of the sessions'''
+    now = time.time()
+    return int((now + time.localtime(now).tm_gmtoff) * 10**6)
+
+
+def format_duration(value: int) -> str:
+    '''Same as strack.utils.format_duration for microseconds'''
+    minutes = round(value / 10**6) // 60
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def prompt_fields(state: dict, now: int) -> dict:
+    '''Returns the values of the placeholders of the format at the time'''
+    at = int(state['at'])
+    start = int(state['start']) if 'start' in state else None
+    day = now // DAY * DAY
+    # The epoch was on a Thursday, weeks start on Monday
+    week = day - (now // DAY + 3) % 7 * DAY
+
+    def since(name: str, period_start: int) -> int:
+        # Totals of a previous day or week are over
+        same_period = at >= period_start
+        total = int(state[name]) if same_period else 0
+        if start is not None:
+            total += now - max(start, at if same_period else period_start)
+        return total
+
+    fields = {name: format_duration(since(name, week if 'week' in name
+                                          else day))
+              for name in TOTALS}
+    fields['project'] = state.get('project', '')
+    fields['elapsed'] = fields['start'] = ''
+    if start is not None:
+        fields['elapsed'] = format_duration(now - start)
+        minutes = start // MINUTE % (24 * 60)
+        fields['start'] = f'{minutes // 60:02d}:{minutes % 60:02d}'
+    return fields
+
+
+def refresh(file: str) -> dict:
+    '''Writes the state from the data, when it is missing or outdated'''
+    from strack.file_utils import load_file, set_file, update_state
+    from strack.utils import week_range
+    from strack.data.stream import Window
+
+    set_file(file)
+    update_state(load_file(Window(*week_range())))
+    return read_state(file) or {}
+
+
+def render(file: str, format: str = DEFAULT_FORMAT, idle: str = '') -> str:
+    state = read_state(file)
+    if state is None:
+        state = refresh(file)
+    fields = prompt_fields(state, local_now())
+    try:
+        # Both are formatted, so that errors don't depend on the state
+        active, inactive = format.format(**fields), idle.format(**fields)
+    except (KeyError, IndexError, ValueError) as error:
+        raise ValueError(f'Invalid prompt format: {error}')
+    return active if 'project' in state else inactive
+
+
+def parse_args(args):
+    '''Returns the format and idle text of the arguments of the prompt
+    command, or None if they have to be parsed by the CLI'''
+    format, idle = None, ''
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg in ('-i', '--idle') and index + 1 < len(args):
+            idle = args[index + 1]
+            index += 2
+            continue
+        if arg.startswith('--idle='):
+            idle = arg[len('--idle='):]
+        elif arg.startswith('-') or format is not None:
+            return None
+        else:
+            format = arg
+        index += 1
+    return format if format is not None else DEFAULT_FORMAT, idle
+
+
+def main(file: str, args) -> bool:
+    '''Prints the prompt without going through the CLI. Returns False if
+    the arguments have to be parsed by the CLI.'''
+    parsed = parse_args(args)
+    if parsed is None:
+        return False
+    try:
+        sys.stdout.write(render(file, *parsed) + '\n')
+    except ValueError as error:
+        sys.stderr.write(f'{error}\n')
+        sys.exit(1)
+    return True
@@ -0,0 +1,32 @@
+from os import path
+from typing import Type
+
+from .storage import Storage
+from .journal import JournalStorage
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+BINARY_SUFFIX = '.strack'
+
+
+def storage_class(file: str) -> Type[Storage]:
+    '''Returns the backend of the data file based on its extension'''
+    # Backends are imported when needed to keep the startup fast
+    extension = path.splitext(file)[1]
+    if extension in SQLITE_SUFFIXES:
+        from .sqlite import SqliteStorage
+        return SqliteStorage
+    if extension == BINARY_SUFFIX:
+        from .binary import BinaryStorage
+        return BinaryStorage
+    # Directories and new paths without an extension hold monthly shards,
+    # existing files without one are JSON
+    if path.isdir(file) or (not extension and not path.exists(file)):
+        from .sharded import ShardedStorage
+        return ShardedStorage
+    return JournalStorage
+
+
+def open_storage(file: str, read_only: bool = False) -> Storage:
+    '''Returns the backend for the data file, which only reads the data
+    file if read_only is set'''
+    return storage_class(file)(file, read_only)
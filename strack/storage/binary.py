@@ -0,0 +1,314 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import mmap
+import struct
+
+from strack.data import Data, Project, Session
+from strack.data.data import BINARY_VERSION
+from strack.data.index import EPOCH, OPEN, add_days, to_epoch
+from strack.data.session import SessionList
+from .journal import JournalStorage
+from .storage import atomic_write
+
+MAGIC = b'STRK'
+
+# Magic, version, reserved, generation, index of the active project (-1 if
+# none), number of projects and sessions, position of the string table
+HEADER = struct.Struct('<4sHHQiIQQ')
+
+# Name and color in the string table, index and number of the sessions of
+# the project, and total duration of its completed sessions in seconds
+PROJECT = struct.Struct('<IIQQd')
+
+# Start and end in microseconds since the epoch (OPEN while the session is
+# running), index of the project and comment in the string table
+SESSION = struct.Struct('<qqII')
+START = struct.Struct('<q')
+NO_COMMENT = 0xFFFFFFFF
+
+LENGTH = struct.Struct('<I')
+
+
+class StringTable:
+    '''Distinct strings, each prefixed with its length in bytes'''
+
+    def __init__(self):
+        self.offsets: Dict[str, int] = {}
+        self.buffer = bytearray()
+
+    def add(self, string: str) -> int:
+        offset = self.offsets.get(string)
+        if offset is None:
+            offset = self.offsets[string] = len(self.buffer)
+            encoded = string.encode()
+            self.buffer += LENGTH.pack(len(encoded)) + encoded
+        return offset
+
+
+def write_binary(data: Data, f) -> None:
+    '''Writes the data in the binary format. The sessions of each project
+    are stored next to each other, sorted by start.'''
+    strings = StringTable()
+    projects = bytearray()
+    sessions = bytearray()
+    session_count = 0
+    active = -1
+    for index, project in enumerate(data.projects):
+        first = session_count
+        total = 0.0
+        for session in project.sessions:
+            if session.end_us is not None:
+                end = session.end_us
+                total += session.duration()
+            else:
+                end = OPEN
+            comment = (strings.add(session.comment)
+                       if session.comment is not None else NO_COMMENT)
+            sessions += SESSION.pack(session.start_us, end, index, comment)
+            session_count += 1
+
+        if project.name == data.active_project:
+            active = index
+        projects += PROJECT.pack(
+            strings.add(project.name), strings.add(project.color_name),
+            first, session_count - first, total)
+
+    strings_offset = HEADER.size + len(projects) + len(sessions)
+    f.write(HEADER.pack(MAGIC, BINARY_VERSION, 0, data.generation, active,
+                        len(data.projects), session_count, strings_offset))
+    f.write(projects)
+    f.write(sessions)
+    f.write(strings.buffer)
+
+
+class BinaryFile:
+    '''Mapped binary data file, of which only the accessed pages are read'''
+
+    def __init__(self, buffer: mmap.mmap):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        (magic, version, _, self.generation, self.active, self.project_count,
+         self.session_count, self.strings) = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise Exception('Not a binary data file')
+        if version != BINARY_VERSION:
+            raise Exception(f'Binary version {version} is not supported')
+        self.sessions = HEADER.size + self.project_count * PROJECT.size
+        self.comments: Dict[int, str] = {}
+
+    def project(self, index: int) -> tuple:
+        return PROJECT.unpack_from(
+            self.buffer, HEADER.size + index * PROJECT.size)
+
+    def string(self, offset: int) -> str:
+        position = self.strings + offset
+        length, = LENGTH.unpack_from(self.buffer, position)
+        position += LENGTH.size
+        return str(self.view[position:position + length], 'utf-8')
+
+    def comment(self, offset: int) -> Optional[str]:
+        if offset == NO_COMMENT:
+            return None
+        # Comments are decoded once, like the interned comments of the index
+        if offset not in self.comments:
+            self.comments[offset] = self.string(offset)
+        return self.comments[offset]
+
+    def session(self, index: int) -> Session:
+        start, end, _, comment = SESSION.unpack_from(
+            self.buffer, self.sessions + index * SESSION.size)
+        return Session.from_epoch(start, end if end != OPEN else None,
+                                  self.comment(comment))
+
+    def start(self, index: int) -> int:
+        return START.unpack_from(
+            self.buffer, self.sessions + index * SESSION.size)[0]
+
+    def bisect(self, low: int, high: int, value: int) -> int:
+        '''Returns the first session in the range started at or after the
+        time, reading only the start of log2(high - low) sessions'''
+        while low < high:
+            middle = (low + high) // 2
+            if self.start(middle) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def spans(self, low: int, high: int, start: int,
+              end: int) -> Iterator[Tuple[int, int]]:
+        '''Yields the start and end of the sessions in the range that
+        overlap the times'''
+        first = low
+        low, high = self.bisect(low, high, start), self.bisect(low, high, end)
+        # The sessions of a project don't overlap, only the one before can
+        # continue into the range
+        if low > first:
+            low -= 1
+        records = self.view[self.sessions + low * SESSION.size:
+                            self.sessions + high * SESSION.size]
+        for session_start, session_end, _, _ in SESSION.iter_unpack(records):
+            yield session_start, session_end
+
+
+class BinaryProject(Project):
+    '''Project whose sessions are only decoded from the file when needed'''
+
+    def __init__(self, file: Optional[BinaryFile], name: str, color,
+                 first: int = 0, count: int = 0, total: float = 0.0):
+        self.file = file
+        self.first = first
+        self.count = count
+        self.total = total
+        self._sessions = None
+        self._active = None
+        super().__init__(name, color)
+
+    @property
+    def sessions(self):
+        if self._sessions is None:
+            last = self.first + self.count
+            sessions = [self.file.session(index)
+                        for index in range(self.first, last)]
+            # The active session may have been stopped in the meantime
+            if self._active is not None:
+                sessions[-1] = self._active
+            self._sessions = SessionList(sessions)
+        return self._sessions
+
+    @sessions.setter
+    def sessions(self, sessions):
+        # Project.__init__ assigns an empty list, which means "not loaded"
+        self._sessions = sessions or None
+
+    def session_count(self) -> int:
+        if self._sessions is not None:
+            return len(self._sessions)
+        return self.count
+
+    def last_session(self) -> Optional[Session]:
+        '''Returns the last session stored in the file, which is the only
+        one that can be running'''
+        if self._active is None and self.count:
+            self._active = self.file.session(self.first + self.count - 1)
+            self.was_running = self._active.end is None
+        return self._active
+
+    def active_session(self) -> Session:
+        if self._sessions is None:
+            session = self.last_session()
+            if session is not None and session.end is None:
+                return session
+        # The running session was started before completed sessions, they
+        # are decoded to find it
+        return super().active_session()
+
+    def total_duration(self, now=None) -> float:
+        if self._sessions is not None:
+            return super().total_duration(now)
+        # The stored total doesn't include the session that was running
+        total = self.total
+        session = self.last_session()
+        if session is not None and self.was_running:
+            total += session.duration(now)
+        return total
+
+    def spans(self, start: datetime,
+              end: datetime) -> Iterator[Tuple[int, int]]:
+        '''Yields the start and end in microseconds of the sessions that may
+        overlap the times'''
+        if self._sessions is not None:
+            sessions = self._sessions
+            low = max(sessions.bisect(start) - 1, 0)
+            for index in range(low, sessions.bisect(end)):
+                yield span(sessions[index])
+            return
+
+        # The last session is read from memory, it may have been stopped
+        high = self.first + self.count
+        if self._active is not None:
+            high -= 1
+        # Projects added since the file was written have no sessions in it
+        if high > self.first:
+            yield from self.file.spans(
+                self.first, high, to_epoch(start), to_epoch(end))
+        if self._active is not None and self._active.start < end:
+            yield span(self._active)
+
+
+def span(session: Session) -> Tuple[int, int]:
+    return (session.start_us,
+            session.end_us if session.end_us is not None else OPEN)
+
+
+class BinaryData(Data):
+    '''Data whose reports only read the sessions of the range'''
+
+    def new_project(self, name: str, color: str) -> Project:
+        return BinaryProject(None, name, color)
+
+    def durations_per_day(self,
+                          start: datetime,
+                          end: datetime,
+                          projects: Optional[List[str]] = None
+                          ) -> Dict[str, Dict[date, float]]:
+        now = to_epoch(self.now)
+        start_us, end_us = to_epoch(start), to_epoch(end)
+        durations = {}
+        for project in self.projects:
+            if projects is not None and project.name not in projects:
+                continue
+            per_day: Dict[int, int] = {}
+            for session_start, session_end in project.spans(start, end):
+                # Only the part of the session in the range counts
+                add_days(per_day, max(session_start, start_us),
+                         min(session_end, now, end_us))
+            if per_day:
+                durations[project.name] = {
+                    EPOCH.date() + timedelta(days=day): duration / 10**6
+                    for day, duration in per_day.items()}
+        return durations
+
+    def total_duration(self, name: str) -> float:
+        return self.get_project(name).total_duration(self.now)
+
+
+class BinaryStorage(JournalStorage):
+    '''Binary snapshot read through mmap, with a journal of the changes'''
+
+    def read_snapshot(self) -> Data:
+        try:
+            with open(self.path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # Empty files can't be mapped
+            return BinaryData()
+
+        file = BinaryFile(buffer)
+        projects = []
+        for index in range(file.project_count):
+            name, color, first, count, total = file.project(index)
+            projects.append(BinaryProject(
+                file, file.string(name), file.string(color),
+                first, count, total))
+
+        active = ''
+        if file.active >= 0:
+            active = projects[file.active].name
+            # Decodes the sessions if the running one isn't stored last, so
+            # that the total includes it
+            projects[file.active].active_session()
+        return BinaryData(projects=projects, active_project=active,
+                          generation=file.generation)
+
+    def can_stream(self) -> bool:
+        # Only the sessions that are used are read from the mapped file
+        return False
+
+    def supports_archive(self) -> bool:
+        # The binary format has no room for the rollups
+        return False
+
+    def write_snapshot(self, data: Data) -> None:
+        with atomic_write(self.path, 'wb') as f:
+            write_binary(data, f)
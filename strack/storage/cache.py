@@ -0,0 +1,191 @@
+from datetime import date, datetime, time, timedelta
+from os import stat
+from typing import Dict, Optional, Tuple
+import json
+
+from strack.data import Data, Session
+from strack.data.index import EPOCH, OPEN, add_days, to_epoch
+from .storage import atomic_write
+
+# Version of the cache file, caches of other versions are rebuilt
+CACHE_VERSION = 3
+
+
+def split_session(session: Session, start: int, end: int) -> Dict[str, float]:
+    '''Returns the seconds of the session in the range (in microseconds)
+    spent on each day'''
+    buckets: Dict[int, int] = {}
+    add_days(buckets, max(to_epoch(session.start), start),
+             min(to_epoch(session.end), end))
+    return {(EPOCH.date() + timedelta(days=day)).isoformat(): duration / 10**6
+            for day, duration in buckets.items()}
+
+
+class AggregateCache:
+    '''Duration of the completed sessions per project and day'''
+
+    def __init__(self, days=None, totals=None):
+        self.days: Dict[str, Dict[str, float]] = days or {}
+        self.totals: Dict[str, float] = totals or {}
+
+    def add(self, name: str, session: Session, sign: int = 1) -> None:
+        '''Adds the session to the durations, or removes it with sign -1'''
+        duration = sign * session.duration()
+        per_day = self.days.setdefault(name, {})
+        if session.start.date() == session.end.date():
+            day = session.start.date().isoformat()
+            per_day[day] = per_day.get(day, 0) + duration
+        else:
+            # Sessions crossing midnight count on each of their days
+            for day, part in split_session(session, 0, OPEN).items():
+                per_day[day] = per_day.get(day, 0) + sign * part
+        self.totals[name] = self.totals.get(name, 0) + duration
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        if old_name in self.days:
+            self.days[new_name] = self.days.pop(old_name)
+        if old_name in self.totals:
+            self.totals[new_name] = self.totals.pop(old_name)
+
+    def remove(self, name: str) -> None:
+        self.days.pop(name, None)
+        self.totals.pop(name, None)
+
+    @staticmethod
+    def build(data: Data) -> 'AggregateCache':
+        cache = AggregateCache()
+        for project in data.projects:
+            for session in project.sessions:
+                if session.end is not None:
+                    cache.add(project.name, session)
+        return cache
+
+
+class CachedData(Data):
+    '''Data whose report totals are read from the aggregate cache'''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.storage = None
+        self.cache: Optional[AggregateCache] = None
+        # Key of the snapshot the data was read from
+        self.snapshot = None
+        # Records of the journal still to replay that the cache includes
+        self.cached_records = 0
+
+    @property
+    def aggregates(self) -> AggregateCache:
+        if self.cache is None:
+            self.cache = AggregateCache.build(self)
+            if self.storage is not None:
+                self.storage.save_cache(self)
+        return self.cache
+
+    def apply(self, change: dict):
+        if self.cached_records:
+            self.cached_records -= 1
+            return super().apply(change)
+
+        if self.cache is not None and change['op'] == 'update':
+            # The session is counted again with its new end
+            old = self.find_session(
+                change['project'], datetime.fromisoformat(change['start']))
+            self.cache.add(change['project'],
+                           Session.from_epoch(old.start_us, old.end_us), -1)
+        result = super().apply(change)
+
+        # Keep the cache up to date, an outdated one is rebuilt when needed
+        if self.cache is not None:
+            op = change['op']
+            if op == 'stop':
+                self.cache.add(change['project'], result)
+            elif op == 'rename':
+                self.cache.rename(change['project'], change['name'])
+            elif op == 'remove':
+                self.cache.remove(change['project'])
+            elif op == 'import':
+                for session in result:
+                    self.cache.add(change['project'], session)
+            elif op == 'update':
+                self.cache.add(change['project'], result)
+
+        return result
+
+    def open_session(self, name: Optional[str] = None):
+        '''Returns the session of the active project'''
+        if not self.is_active() or (name and not self.is_active(name)):
+            return None
+        return self.get_active().active_session()
+
+    def durations_per_day(self, start, end, projects=None):
+        # Buckets can only answer ranges made of whole days
+        if start.time() != time() or end.time() != time():
+            return super().durations_per_day(start, end, projects)
+
+        days = [(start + timedelta(days=index)).date()
+                for index in range((end - start).days)]
+        durations = {}
+        for name, per_day in self.aggregates.days.items():
+            if projects is not None and name not in projects:
+                continue
+            for day in days:
+                duration = per_day.get(day.isoformat())
+                if duration:
+                    durations.setdefault(name, {})[day] = duration
+
+        session = self.open_session()
+        if (session is not None and session.start < end
+                and (projects is None or self.active_project in projects)):
+            running = Session(session.start, self.now)
+            parts = split_session(running, to_epoch(start), to_epoch(end))
+            per_day = durations.setdefault(self.active_project, {})
+            for day, part in parts.items():
+                day = date.fromisoformat(day)
+                per_day[day] = per_day.get(day, 0) + part
+            if not per_day:
+                del durations[self.active_project]
+
+        return self.add_archived(durations, start, end, projects)
+
+    def total_duration(self, name: str) -> float:
+        total = self.aggregates.totals.get(name, 0) + self.archived_total(name)
+        session = self.open_session(name)
+        if session is not None:
+            total += session.duration(self.now)
+        return total
+
+
+def file_key(*files: str):
+    '''Identifies the content of the files without reading them'''
+    key = []
+    for file in files:
+        try:
+            info = stat(file)
+            key.append([info.st_ino, info.st_mtime_ns, info.st_size])
+        except FileNotFoundError:
+            key.append(None)
+    return key
+
+
+def load_cache(file: str,
+               snapshot) -> Optional[Tuple[AggregateCache, int]]:
+    '''Returns the cache if it was written for the snapshot, with the number
+    of records of the journal it includes'''
+    try:
+        with open(file) as f:
+            obj = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    if obj.get('version') != CACHE_VERSION or obj['snapshot'] != snapshot:
+        return None
+    cache = AggregateCache(days=obj['days'], totals=obj['totals'])
+    return cache, obj['records']
+
+
+def save_cache(file: str, snapshot, records: int,
+               cache: AggregateCache) -> None:
+    with atomic_write(file) as f:
+        json.dump({'version': CACHE_VERSION, 'snapshot': snapshot,
+                   'records': records, 'days': cache.days,
+                   'totals': cache.totals}, f, separators=(',', ':'))
@@ -0,0 +1,187 @@
+from datetime import datetime
+from os import SEEK_END, fsync, path, remove
+from typing import List, Optional
+
+from strack import profiling
+from strack.data import Data
+from strack.data.data import journal_generation
+from strack.data.archive import merge_sessions, open_archive, write_archive
+from strack.data.session import SessionList
+from strack.data.stream import Window, read_window
+from .cache import CachedData, file_key, load_cache, save_cache
+from .storage import Storage, atomic_write
+from .window import WindowData
+
+# Size in bytes above which the journal is folded into the snapshot
+JOURNAL_LIMIT = 64 * 1024
+
+# Size in bytes above which only the sessions of a window are decoded.
+# Streaming takes longer than decoding a small file at once.
+STREAM_SIZE = 8 * 2**20
+
+
+class JournalStorage(Storage):
+    '''JSON snapshot with an append-only journal of the changes'''
+
+    @property
+    def journal_path(self) -> str:
+        return self.path + '.journal'
+
+    @property
+    def cache_path(self) -> str:
+        return self.path + '.cache'
+
+    def load(self, window: Optional[Window] = None) -> Data:
+        key = file_key(self.path, self.journal_path)
+        snapshot = key[0]
+        cached = load_cache(self.cache_path, snapshot)
+        with profiling.phase('read'):
+            if window is not None and self.can_stream():
+                # The totals are only summed if the cache can't give them
+                data = self.read_window(window, cached is None)
+            else:
+                data = self.read_snapshot()
+        if isinstance(data, CachedData):
+            data.storage = self
+            data.snapshot = snapshot
+            # The journal records the cache doesn't include are added to it
+            # while they are replayed
+            if cached is not None:
+                data.cache, data.cached_records = cached
+
+        mode = 'r' if self.read_only else 'r+'
+        try:
+            with open(self.journal_path, mode) as f, profiling.phase('replay'):
+                header = f.readline()
+                f.seek(0)
+                if header and journal_generation(header) < data.generation:
+                    # Left by a compaction interrupted before removing it
+                    if not self.read_only:
+                        f.truncate(0)
+                else:
+                    data.replay(f)
+        except FileNotFoundError:
+            pass
+
+        if isinstance(data, CachedData) and data.cached_records:
+            # The cache includes records that aren't in the journal
+            data.cache = None
+            data.cached_records = 0
+        if data.archive is not None:
+            data.archive.directory = path.dirname(self.path)
+        self.loaded = key
+        return data
+
+    def read_snapshot(self) -> Data:
+        try:
+            with open(self.path) as f:
+                return CachedData.from_file(f)
+        except FileNotFoundError:
+            return CachedData()
+
+    def can_stream(self) -> bool:
+        try:
+            return path.getsize(self.path) > STREAM_SIZE
+        except FileNotFoundError:
+            return False
+
+    def read_window(self, window: Window, totals: bool) -> Data:
+        '''Reads the sessions of the window from the JSON snapshot'''
+        with open(self.path) as f:
+            return WindowData.from_window(
+                read_window(f, window, totals))
+
+    def write_snapshot(self, data: Data) -> None:
+        with atomic_write(self.path) as f:
+            data.to_file(f)
+
+    def state(self):
+        return file_key(*self.files())
+
+    @staticmethod
+    def data_files(path: str) -> List[str]:
+        return [path, path + '.journal']
+
+    def save(self, data: Data) -> None:
+        '''Appends the pending changes to the journal'''
+        with open(self.journal_path, 'a+') as f:
+            f.seek(0)
+            journal = f.read()
+            header = journal.split('\n', 1)[0]
+            # The changes would be ignored under the header of a journal
+            # that was already folded into the snapshot, or after a record
+            # partially written by a process that died
+            if header and journal_generation(header) != data.generation:
+                f.truncate(0)
+            elif not journal.endswith('\n'):
+                f.truncate(journal.rfind('\n') + 1)
+            f.seek(0, SEEK_END)
+            data.write_journal(f)
+            f.flush()
+            fsync(f.fileno())
+
+        # The cache isn't written, the records are added to it when the
+        # journal is replayed
+        if path.getsize(self.journal_path) > JOURNAL_LIMIT:
+            self.compact(data)
+        else:
+            self.loaded = self.state()
+
+    def write(self, data: Data) -> None:
+        self.compact(data)
+
+    def compact(self, data: Data) -> None:
+        '''Folds the journal into a new snapshot'''
+        data.generation += 1
+        data.changes = []
+        data.records = 0
+        self.write_snapshot(data)
+
+        # The journal is ignored from now on, since its generation is outdated
+        try:
+            remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+        self.loaded = self.state()
+        if isinstance(data, CachedData):
+            data.snapshot = self.loaded[0]
+            self.save_cache(data)
+
+    def supports_archive(self) -> bool:
+        return True
+
+    def archive(self, data: Data, before: datetime, compression: str) -> int:
+        '''Moves the sessions ended before the date to the archive files of
+        the years they started in, then writes the data without them. The
+        archives are written first, sessions found in both are only archived
+        once if this is interrupted and run again.'''
+        archived = data.archive_sessions(before)
+        archive = data.archive
+        archive.directory = path.dirname(self.path)
+        for year, sessions in sorted(archived.items()):
+            old = archive.read(year) if year in archive.files else {}
+            merged = {key: SessionList(merge_sessions(
+                          old.get(key, SessionList()), sessions.get(key, [])))
+                      for key in {*old, *sessions}}
+            file = archive.file_name(self.path, year, compression)
+            with atomic_write(archive.path(year), 'wb') as f, \
+                    open_archive(file, 'wt', fileobj=f) as compressed:
+                write_archive(compressed, merged)
+            archive.loaded[year] = merged
+
+        # The aggregates still count the archived sessions
+        if isinstance(data, CachedData):
+            data.cache = None
+        self.compact(data)
+        return sum(len(items) for sessions in archived.values()
+                   for items in sessions.values())
+
+    def save_cache(self, data: Data) -> None:
+        '''Stores the aggregates with the snapshot and the number of records
+        of the journal they include. Reports don't hold the lock, so the
+        files may have changed since the data was loaded.'''
+        cache = getattr(data, 'cache', None)
+        # Changes that weren't saved aren't in the journal
+        if cache is not None and not data.changes:
+            save_cache(self.cache_path, data.snapshot, data.records, cache)
@@ -0,0 +1,347 @@
+from datetime import datetime, timedelta
+from os import makedirs, path, remove
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+
+from strack.data import Data, Project, Session
+from strack.data.data import VERSION, serialize
+from strack.data.index import SessionIndex
+from strack.data.session import SessionList
+from .cache import file_key
+from .storage import Storage, atomic_write
+
+MANIFEST = 'manifest.json'
+
+
+def shard_name(dt: datetime) -> str:
+    '''Returns the name of the shard containing sessions started at dt'''
+    return f'{dt:%Y-%m}'
+
+
+class ShardedProject(Project):
+    '''Project whose sessions are spread over the monthly shards'''
+
+    def __init__(self, data: 'ShardedData', id: int, name: str, color):
+        self.data = data
+        self.id = id
+        super().__init__(name, color)
+
+    @property
+    def sessions(self) -> SessionList:
+        sessions = SessionList()
+        for shard in self.shards():
+            for session in self.data.shard(shard).get(self.id, []):
+                sessions.append(session)
+        return sessions
+
+    @sessions.setter
+    def sessions(self, sessions):
+        # Sessions are stored in the shards
+        assert not sessions, 'Sessions of a sharded project are read-only'
+
+    def shards(self) -> List[str]:
+        '''Returns the shards containing sessions of the project'''
+        # Kept until the totals gain or lose a shard of a project
+        shards = self.data.project_shards
+        if self.id not in shards:
+            shards[self.id] = sorted(
+                shard for shard, totals in self.data.totals.items()
+                if self.id in totals)
+        return shards[self.id]
+
+    def add_session(self, session: Session) -> None:
+        shard = shard_name(session.start)
+        self.data.shard(shard).setdefault(self.id, SessionList()).insert(
+            session)
+        self.data.total(shard, self.id)['count'] += 1
+        self.data.dirty.add(shard)
+
+    def import_sessions(self, sessions: List[Session]) -> None:
+        per_shard: Dict[str, List[Session]] = {}
+        for session in sessions:
+            per_shard.setdefault(shard_name(session.start), []).append(session)
+
+        for shard, shard_sessions in per_shard.items():
+            self.data.shard(shard).setdefault(
+                self.id, SessionList()).extend_sorted(shard_sessions)
+            total = self.data.total(shard, self.id)
+            total['count'] += len(shard_sessions)
+            total['duration'] += sum(
+                session.duration() for session in shard_sessions)
+            total['end'] = max(total.get('end', ''), *(
+                str(session.end) for session in shard_sessions))
+            self.data.dirty.add(shard)
+
+    def session_count(self) -> int:
+        return sum(totals[self.id]['count']
+                   for totals in self.data.totals.values()
+                   if self.id in totals)
+
+    def active_session(self) -> Session:
+        # The running session is in the last shard, unless it was started
+        # before sessions that were already completed
+        for shard in reversed(self.shards()):
+            session = self.data.shard(shard)[self.id].open_session()
+            if session is not None:
+                return session
+        assert False, 'Session is not active'
+
+    def total_duration(self, now=None) -> float:
+        total = sum(totals[self.id]['duration']
+                    for totals in self.data.totals.values()
+                    if self.id in totals)
+        # The duration of a session is only added once it is stopped
+        if self.data.is_active(self.name):
+            total += self.active_session().duration(now)
+        return total
+
+
+class ShardedData(Data):
+    '''Data split in one file per month, loaded as needed'''
+
+    def __init__(self, storage: 'ShardedStorage', totals=None, **kwargs):
+        self.storage = storage
+        self.project_shards: Dict[int, List[str]] = {}
+        # Number and duration of the sessions per shard and project
+        self.totals = totals or {}
+        self.shards: Dict[str, Dict[int, SessionList]] = {}
+        self.indexes: Dict[str, SessionIndex] = {}
+        self.dirty = set()
+        super().__init__(**kwargs)
+
+    @property
+    def totals(self) -> Dict[str, Dict[int, dict]]:
+        return self._totals
+
+    @totals.setter
+    def totals(self, totals: Dict[str, Dict[int, dict]]):
+        self._totals = totals
+        self.project_shards = {}
+
+    def shard(self, name: str) -> Dict[int, SessionList]:
+        if name not in self.shards:
+            self.shards[name] = self.storage.load_shard(name)
+        return self.shards[name]
+
+    def total(self, shard: str, project_id: int) -> dict:
+        totals = self.totals.setdefault(shard, {})
+        if project_id not in totals:
+            totals[project_id] = {'count': 0, 'duration': 0, 'end': ''}
+            self.project_shards.pop(project_id, None)
+        return totals[project_id]
+
+    def new_project(self, name: str, color: str) -> Project:
+        ids = [project.id for project in self.projects]
+        return ShardedProject(self, max(ids, default=0) + 1, name, color)
+
+    def apply(self, change: dict):
+        self.indexes = {}
+        if change['op'] == 'remove':
+            project = self.get_project(change['project'])
+            for shard in project.shards():
+                self.shard(shard).pop(project.id, None)
+                del self.totals[shard][project.id]
+                self.dirty.add(shard)
+            self.project_shards.pop(project.id, None)
+        elif change['op'] == 'update':
+            old = self.find_session(
+                change['project'],
+                datetime.fromisoformat(change['start'])).duration()
+
+        result = super().apply(change)
+
+        if change['op'] == 'stop':
+            shard = shard_name(result.start)
+            project = self.get_project(change['project'])
+            total = self.total(shard, project.id)
+            total['duration'] += result.duration()
+            total['end'] = max(total.get('end', ''), str(result.end))
+            self.dirty.add(shard)
+        elif change['op'] == 'update':
+            shard = shard_name(result.start)
+            project = self.get_project(change['project'])
+            total = self.total(shard, project.id)
+            total['duration'] += result.duration() - old
+            total['end'] = max(total.get('end', ''), str(result.end))
+            self.dirty.add(shard)
+
+        return result
+
+    def active_shard(self) -> Optional[str]:
+        '''Returns the shard containing the running session'''
+        if not self.is_active():
+            return None
+        return shard_name(self.get_active().active_session().start)
+
+    def overlaps(self, shard: str, start: Optional[datetime],
+                 end: Optional[datetime],
+                 active_shard: Optional[str] = None) -> bool:
+        '''Returns True if sessions of the shard can overlap the range, the
+        shard of the running session is passed by the caller to only look
+        for it once per query'''
+        if end is not None and shard > shard_name(
+                end - timedelta(microseconds=1)):
+            return False
+        if start is None or shard >= shard_name(start):
+            return True
+
+        # Earlier shards only matter for the sessions ending in the range
+        start_str = str(start)
+        if any(total.get('end', '') > start_str
+               for total in self.totals[shard].values()):
+            return True
+        return shard == active_shard
+
+    def shard_index(self, shard: str) -> SessionIndex:
+        if shard not in self.indexes:
+            projects = {project.id: project for project in self.projects}
+            self.indexes[shard] = SessionIndex(
+                (projects[id], sessions)
+                for id, sessions in self.shard(shard).items()
+                if id in projects)
+        return self.indexes[shard]
+
+    def sessions_between(self,
+                         start: Optional[datetime] = None,
+                         end: Optional[datetime] = None,
+                         projects: Optional[List[str]] = None,
+                         reverse: bool = False
+                         ) -> Iterator[Tuple[Project, Session]]:
+        # Only the shards overlapping the range are loaded
+        active_shard = self.active_shard()
+        shards = sorted((shard for shard in self.totals
+                         if self.overlaps(shard, start, end, active_shard)),
+                        reverse=reverse)
+
+        # Shards are split by start time, so they are already in order
+        for shard in shards:
+            yield from self.shard_index(shard).sessions_between(
+                start, end, self.now, projects, reverse)
+
+    def recent_sessions(self, since=None, before=None, projects=None):
+        # Shards are only loaded as the sessions are consumed
+        sessions = self.sessions_between(since, before, projects, True)
+        for project, session in sessions:
+            if since is not None and session.start < since:
+                continue
+            if before is not None and (session.end or self.now) > before:
+                continue
+            yield project, session
+
+    def durations_per_day(self, start, end, projects=None):
+        durations = {}
+        active_shard = self.active_shard()
+        for shard in self.totals:
+            if not self.overlaps(shard, start, end, active_shard):
+                continue
+            shard_durations = self.shard_index(shard).durations_per_day(
+                start, end, self.now, projects)
+            # Sessions of different shards can end on the same day
+            for name, per_day in shard_durations.items():
+                sums = durations.setdefault(name, {})
+                for day, duration in per_day.items():
+                    sums[day] = sums.get(day, 0) + duration
+        return durations
+
+    def total_duration(self, name: str) -> float:
+        return self.get_project(name).total_duration(self.now)
+
+
+class ShardedStorage(Storage):
+    '''Directory with a manifest and one file per month of sessions'''
+
+    @property
+    def manifest_path(self) -> str:
+        return path.join(self.path, MANIFEST)
+
+    def shard_path(self, name: str) -> str:
+        return path.join(self.path, f'{name}.json')
+
+    def load(self, window=None) -> Data:
+        data = ShardedData(self)
+        self.loaded = self.state()
+        try:
+            with open(self.manifest_path) as f:
+                obj = json.load(f)
+        except FileNotFoundError:
+            return data
+
+        version = obj.get('version', 0)
+        if version < VERSION:
+            raise Exception(f'Version {version} is too old')
+
+        data.active_project = obj.get('active_project', '')
+        data.projects = [
+            ShardedProject(data, project['id'], project['name'],
+                           project['color'])
+            for project in obj['projects']]
+        data.totals = {
+            shard: {int(id): total for id, total in totals.items()}
+            for shard, totals in obj['shards'].items()}
+        return data
+
+    def state(self):
+        return file_key(self.manifest_path)
+
+    @staticmethod
+    def data_files(directory: str) -> List[str]:
+        return [path.join(directory, MANIFEST)]
+
+    def load_shard(self, name: str) -> Dict[int, SessionList]:
+        try:
+            with open(self.shard_path(name)) as f:
+                obj = json.load(f)
+        except FileNotFoundError:
+            return {}
+        return {int(id): SessionList(sessions)
+                for id, sessions in obj['sessions'].items()}
+
+    def save(self, data: Data) -> None:
+        '''Writes the modified shards and the manifest'''
+        assert isinstance(data, ShardedData)
+        makedirs(self.path, exist_ok=True)
+        for shard in data.dirty:
+            sessions = data.shard(shard)
+            if sessions:
+                self.dump({'version': VERSION, 'sessions': sessions},
+                          self.shard_path(shard))
+            elif path.exists(self.shard_path(shard)):
+                remove(self.shard_path(shard))
+            if not sessions and data.totals.pop(shard, None) is not None:
+                data.project_shards = {}
+        data.dirty = set()
+        data.changes = []
+
+        self.dump({
+            'active_project': data.active_project,
+            'projects': [
+                {'id': project.id, 'name': project.name,
+                 'color': project.color_name}
+                for project in data.projects],
+            'version': data.version,
+            'shards': data.totals,
+        }, self.manifest_path)
+        self.loaded = self.state()
+
+    def write(self, data: Data) -> None:
+        sharded = ShardedData(self, active_project=data.active_project)
+        for project in data.projects:
+            sharded.projects.append(
+                sharded.new_project(project.name, project.color_name))
+            new_project = sharded.projects[-1]
+            for session in project.sessions:
+                new_project.add_session(session)
+                if session.end is not None:
+                    shard = shard_name(session.start)
+                    total = sharded.total(shard, new_project.id)
+                    total['duration'] += session.duration()
+                    total['end'] = max(total['end'], str(session.end))
+        self.save(sharded)
+
+    def compact(self, data: Data) -> None:
+        self.save(data)
+
+    @staticmethod
+    def dump(obj, file: str) -> None:
+        with atomic_write(file) as f:
+            json.dump(obj, f, default=serialize)
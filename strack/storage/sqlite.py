@@ -0,0 +1,332 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import sqlite3
+
+from strack.data import Data, Project, Session
+from strack.data.index import EPOCH, add_days, to_epoch
+from strack.data.session import SessionList
+from .storage import Storage
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    color TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id),
+    start TEXT NOT NULL,
+    "end" TEXT,
+    comment TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_project_start
+    ON sessions (project_id, start);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start);
+CREATE INDEX IF NOT EXISTS sessions_end ON sessions ("end");
+'''
+
+# Duration of a session in seconds, open sessions end at the first parameter
+DURATION = '''
+    (julianday(coalesce(s."end", :now)) - julianday(s.start)) * 86400
+'''
+
+
+def to_session(start: str, end: Optional[str], comment: Optional[str]):
+    return Session(start=datetime.fromisoformat(start),
+                   end=datetime.fromisoformat(end) if end else None,
+                   comment=comment)
+
+
+class SqliteProject(Project):
+    '''Project whose sessions are only read from the database when needed'''
+
+    def __init__(self, db: sqlite3.Connection, id: int, name: str, color):
+        self.db = db
+        self.id = id
+        self._sessions = None
+        self._active = None
+        super().__init__(name, color)
+
+    @property
+    def sessions(self):
+        if self._sessions is None:
+            rows = self.db.execute(
+                'SELECT start, "end", comment FROM sessions '
+                'WHERE project_id = ? ORDER BY start', (self.id,))
+            self._sessions = SessionList(to_session(*row) for row in rows)
+        return self._sessions
+
+    @sessions.setter
+    def sessions(self, sessions):
+        # Project.__init__ assigns an empty list, which means "not loaded"
+        self._sessions = sessions or None
+
+    def add_session(self, session: Session) -> None:
+        self._active = session
+        if self._sessions is not None:
+            self._sessions.insert(session)
+
+    def import_sessions(self, sessions: List[Session]) -> None:
+        if self._sessions is not None:
+            self._sessions.extend_sorted(sessions)
+
+    def session_count(self) -> int:
+        if self._sessions is not None:
+            return len(self._sessions)
+        row = self.db.execute(
+            'SELECT count(*) FROM sessions WHERE project_id = ?', (self.id,))
+        return row.fetchone()[0]
+
+    def active_session(self) -> Session:
+        if self._sessions is not None:
+            return super().active_session()
+        if self._active is None:
+            row = self.db.execute(
+                'SELECT start, "end", comment FROM sessions '
+                'WHERE project_id = ? AND "end" IS NULL '
+                'ORDER BY start DESC LIMIT 1', (self.id,)).fetchone()
+            assert row, 'Session is not active'
+            self._active = to_session(*row)
+        assert self._active.end is None, 'Session is not active'
+        return self._active
+
+    def total_duration(self, now=None) -> float:
+        row = self.db.execute(
+            f'SELECT coalesce(sum({DURATION}), 0) FROM sessions s '
+            'WHERE s.project_id = :id',
+            {'id': self.id, 'now': str(now or datetime.now())})
+        return row.fetchone()[0]
+
+    def __serialize__(self):
+        return {
+            'name': self.name,
+            'color': self.color_name,
+            'sessions': self.sessions,
+        }
+
+
+class SqliteData(Data):
+    '''Data whose queries are answered by the database'''
+
+    def __init__(self, db: sqlite3.Connection, **kwargs):
+        super().__init__(**kwargs)
+        self.db = db
+
+    def sessions_between(self,
+                         start: Optional[datetime] = None,
+                         end: Optional[datetime] = None,
+                         projects: Optional[List[str]] = None,
+                         reverse: bool = False
+                         ) -> Iterator[Tuple[Project, Session]]:
+        query, params = self.filter_sessions(start, end, projects, True)
+        order = 'DESC' if reverse else 'ASC'
+        rows = self.db.execute(
+            'SELECT p.name, s.start, s."end", s.comment '
+            f'FROM sessions s JOIN projects p ON p.id = s.project_id {query} '
+            f'ORDER BY s.start {order}', params)
+
+        projects = {project.name: project for project in self.projects}
+        for name, *session in rows:
+            yield projects[name], to_session(*session)
+
+    def recent_sessions(self,
+                        since: Optional[datetime] = None,
+                        before: Optional[datetime] = None,
+                        projects: Optional[List[str]] = None
+                        ) -> Iterator[Tuple[Project, Session]]:
+        query, params = self.filter_sessions(since, before, projects)
+        if before is not None:
+            query += ' AND ' if query else 'WHERE '
+            query += 'coalesce(s."end", :now) <= :end'
+        rows = self.db.execute(
+            'SELECT p.name, s.start, s."end", s.comment '
+            f'FROM sessions s JOIN projects p ON p.id = s.project_id {query} '
+            'ORDER BY s.start DESC', params)
+
+        projects = {project.name: project for project in self.projects}
+        for name, *session in rows:
+            yield projects[name], to_session(*session)
+
+    def durations_per_day(self,
+                          start: datetime,
+                          end: datetime,
+                          projects: Optional[List[str]] = None
+                          ) -> Dict[str, Dict[date, float]]:
+        query, params = self.filter_sessions(start, end, projects, True)
+        query += ' AND ' if query else 'WHERE '
+        # Sessions within a single day of the range are summed by the
+        # database, the few others are split between the days they cover
+        inside = ('s.start >= :start AND coalesce(s."end", :now) <= :end '
+                  'AND date(s.start) = date(coalesce(s."end", :now))')
+        rows = self.db.execute(
+            f'SELECT p.name, date(s.start), sum({DURATION}) '
+            f'FROM sessions s JOIN projects p ON p.id = s.project_id '
+            f'{query} {inside} GROUP BY s.project_id, date(s.start)', params)
+
+        durations = {}
+        for name, day, duration in rows:
+            per_day = durations.setdefault(name, {})
+            per_day[date.fromisoformat(day)] = duration
+
+        rows = self.db.execute(
+            'SELECT p.name, s.start, coalesce(s."end", :now) '
+            f'FROM sessions s JOIN projects p ON p.id = s.project_id '
+            f'{query} NOT ({inside})', params)
+        start_us, end_us = to_epoch(start), to_epoch(end)
+        for name, session_start, session_end in rows:
+            buckets: Dict[int, int] = {}
+            add_days(buckets,
+                     max(to_epoch(datetime.fromisoformat(session_start)),
+                         start_us),
+                     min(to_epoch(datetime.fromisoformat(session_end)),
+                         end_us))
+            per_day = durations.setdefault(name, {})
+            for day, duration in buckets.items():
+                day = EPOCH.date() + timedelta(days=day)
+                per_day[day] = per_day.get(day, 0) + duration / 10**6
+            if not per_day:
+                del durations[name]
+        return durations
+
+    def total_duration(self, name: str) -> float:
+        return self.get_project(name).total_duration(self.now)
+
+    def filter_sessions(self, start, end, projects, overlap=False):
+        '''Returns the conditions selecting the sessions started in the
+        range, or overlapping it'''
+        conditions = []
+        params = {'now': str(self.now)}
+        if start is not None and overlap:
+            conditions.append(
+                '(s."end" > :start OR (s."end" IS NULL AND :now > :start))')
+            params['start'] = str(start)
+        elif start is not None:
+            conditions.append('s.start >= :start')
+            params['start'] = str(start)
+        if end is not None:
+            conditions.append('s.start < :end')
+            params['end'] = str(end)
+        if projects is not None:
+            names = ', '.join(f':project{i}' for i in range(len(projects)))
+            conditions.append(f'p.name IN ({names})')
+            params.update(
+                (f'project{i}', name) for i, name in enumerate(projects))
+
+        if not conditions:
+            return '', params
+        return 'WHERE ' + ' AND '.join(conditions), params
+
+
+class SqliteStorage(Storage):
+    '''SQLite database with indexes on the session start times'''
+
+    def __init__(self, path: str, read_only: bool = False):
+        super().__init__(path, read_only)
+        if read_only:
+            # The database isn't created nor migrated, only queried
+            self.db = sqlite3.connect(
+                f'file:{quote(path)}?mode=ro', uri=True)
+        else:
+            self.db = sqlite3.connect(path)
+            self.db.executescript(SCHEMA)
+
+    def load(self, window=None) -> Data:
+        projects = [
+            SqliteProject(self.db, id, name, color)
+            for id, name, color in self.db.execute(
+                'SELECT id, name, color FROM projects ORDER BY id')]
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE key = ?', ('active_project',))
+        active_project = (row.fetchone() or [None])[0]
+        self.loaded = self.state()
+        return SqliteData(self.db, projects=projects,
+                          active_project=active_project)
+
+    def state(self):
+        # Only changes committed by other connections update the version
+        return self.db.execute('PRAGMA data_version').fetchone()[0]
+
+    def save(self, data: Data) -> None:
+        with self.db:
+            for change in data.changes:
+                self.apply(change)
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                ('active_project', data.active_project))
+        data.changes = []
+
+    def apply(self, change: dict) -> None:
+        '''Translates a journal record to SQL'''
+        op = change['op']
+        project_id = '(SELECT id FROM projects WHERE name = :project)'
+        if op == 'add':
+            self.db.execute(
+                'INSERT INTO projects (name, color) VALUES (:project, :color)',
+                change)
+        elif op == 'remove':
+            self.db.execute(
+                f'DELETE FROM sessions WHERE project_id = {project_id}',
+                change)
+            self.db.execute(
+                'DELETE FROM projects WHERE name = :project', change)
+        elif op == 'rename':
+            self.db.execute(
+                'UPDATE projects SET name = :name WHERE name = :project',
+                change)
+        elif op == 'set-color':
+            self.db.execute(
+                'UPDATE projects SET color = :color WHERE name = :project',
+                change)
+        elif op == 'start':
+            self.db.execute(
+                'INSERT INTO sessions (project_id, start) '
+                f'VALUES ({project_id}, :start)', change)
+        elif op == 'stop':
+            self.db.execute(
+                'UPDATE sessions SET "end" = :end, '
+                'comment = coalesce(:comment, comment) '
+                f'WHERE "end" IS NULL AND project_id = {project_id}',
+                {'comment': None, **change})
+        elif op == 'import':
+            self.db.executemany(
+                'INSERT INTO sessions (project_id, start, "end", comment) '
+                f'VALUES ({project_id}, :start, :end, :comment)',
+                ({'project': change['project'], 'comment': None, **session}
+                 for session in change['sessions']))
+        elif op == 'update':
+            self.db.execute(
+                'UPDATE sessions SET "end" = :end, comment = :comment '
+                f'WHERE project_id = {project_id} AND start = :start',
+                {'comment': None, **change})
+        else:
+            raise Exception(f'Unknown journal record: {op}')
+
+    def write(self, data: Data) -> None:
+        with self.db:
+            self.db.execute('DELETE FROM sessions')
+            self.db.execute('DELETE FROM projects')
+            for project in data.projects:
+                cursor = self.db.execute(
+                    'INSERT INTO projects (name, color) VALUES (?, ?)',
+                    (project.name, project.color_name))
+                self.db.executemany(
+                    'INSERT INTO sessions (project_id, start, "end", comment) '
+                    'VALUES (?, ?, ?, ?)',
+                    ((cursor.lastrowid, str(session.start),
+                      str(session.end) if session.end else None,
+                      session.comment)
+                     for session in project.sessions))
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                ('active_project', data.active_project))
+        data.changes = []
+
+    def compact(self, data: Data) -> None:
+        self.save(data)
+        self.db.execute('VACUUM')
@@ -0,0 +1,114 @@
+from contextlib import contextmanager
+from datetime import datetime
+from os import chmod, fsync, path, remove, replace, stat, umask
+from typing import List, Optional
+import tempfile
+
+from strack.data import Data
+from strack.data.stream import Window
+
+try:
+    import fcntl
+except ImportError:
+    # Locking is advisory and not available on every platform
+    fcntl = None
+
+
+@contextmanager
+def atomic_write(file: str, mode: str = 'w'):
+    '''Writes to a temporary file that replaces the file once it is synced,
+    so a crash never leaves a partially written file behind'''
+    directory, name = path.split(path.abspath(file))
+    f = tempfile.NamedTemporaryFile(
+        mode, dir=directory, prefix=f'.{name}.', suffix='.tmp', delete=False)
+    try:
+        # Temporary files are private, the file keeps its permissions
+        try:
+            mode = stat(file).st_mode
+        except FileNotFoundError:
+            mask = umask(0)
+            umask(mask)
+            mode = 0o666 & ~mask
+        chmod(f.name, mode & 0o777)
+
+        with f:
+            # The wrapper of the temporary file slows down small writes
+            yield f.file
+            f.flush()
+            fsync(f.fileno())
+        replace(f.name, file)
+    except BaseException:
+        remove(f.name)
+        raise
+
+
+class Storage:
+    '''Base class for the backends storing the data'''
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        # Set when reading the data of someone else, which is never written
+        self.read_only = read_only
+        self.loaded = None
+
+    @property
+    def lock_path(self) -> str:
+        return self.path + '.lock'
+
+    @contextmanager
+    def lock(self):
+        '''Holds an exclusive lock on the data while the block runs'''
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def state(self):
+        '''Returns a value that changes whenever the stored data changes'''
+        return None
+
+    @staticmethod
+    def data_files(path: str) -> List[str]:
+        '''Returns the files whose size and modification time change
+        whenever the data stored at the path changes, also in other
+        processes'''
+        return [path]
+
+    def files(self) -> List[str]:
+        return self.data_files(self.path)
+
+    def is_stale(self) -> bool:
+        '''Returns True if the data was changed since it was last loaded or
+        saved by this storage'''
+        return self.state() != self.loaded
+
+    def load(self, window: Optional[Window] = None) -> Data:
+        '''Loads the data. Backends that decode everything at once can only
+        decode the sessions of the window.'''
+        raise NotImplementedError
+
+    def save(self, data: Data) -> None:
+        '''Persists the pending changes of the data'''
+        raise NotImplementedError
+
+    def write(self, data: Data) -> None:
+        '''Replaces everything that is stored with the data'''
+        raise NotImplementedError
+
+    def compact(self, data: Data) -> None:
+        '''Reorganizes the storage to make it smaller and faster to load'''
+        raise NotImplementedError
+
+    def supports_archive(self) -> bool:
+        '''Returns True if old sessions can be moved to archive files'''
+        return False
+
+    def archive(self, data: Data, before: datetime, compression: str) -> int:
+        '''Moves the sessions ended before the date out of the data, and
+        returns their number'''
+        raise NotImplementedError
@@ -0,0 +1,93 @@
+from datetime import datetime
+from typing import List
+
+from strack.data import Data, Project, Session
+from strack.data.archive import Archive, Rollup
+from strack.data.session import SessionList
+from .cache import CachedData
+
+
+class WindowProject(Project):
+    '''Project of which only the sessions of a time window were decoded.
+    The other sessions are only known by their number and total.'''
+
+    def __init__(self, name: str, color, sessions=(), count: int = 0,
+                 total: float = 0.0):
+        super().__init__(name, color)
+        self.sessions = SessionList(sessions)
+        self.count = count
+        self.total = total
+        # Sessions that aren't part of the count and total: the running one
+        # and the ones started since
+        running = self.sessions.open_session()
+        self.uncounted: List[Session] = [running] if running else []
+
+    def add_session(self, session: Session) -> None:
+        super().add_session(session)
+        self.uncounted.append(session)
+
+    def import_sessions(self, sessions: List[Session]) -> None:
+        super().import_sessions(sessions)
+        self.count += len(sessions)
+        self.total += sum(session.duration() for session in sessions)
+
+    def session_count(self) -> int:
+        return self.count + len(self.uncounted)
+
+    def total_duration(self, now=None) -> float:
+        return self.total + sum(session.duration(now)
+                                for session in self.uncounted)
+
+
+class WindowData(CachedData):
+    '''Data decoded for a time window, whose totals come from the aggregate
+    cache or from the sums made while the file was read'''
+
+    @classmethod
+    def from_window(cls, obj: dict) -> 'WindowData':
+        projects = []
+        for item in obj['projects']:
+            project = WindowProject(item['name'], item.get('color'),
+                                    item['sessions'], item['count'],
+                                    item['total'])
+            if 'archived' in item:
+                project.rollup = Rollup.from_obj(item['archived'])
+            projects.append(project)
+        archive = obj.get('archive')
+        return cls(projects=projects,
+                   active_project=obj.get('active_project', ''),
+                   generation=obj.get('generation', 0),
+                   archive=Archive.from_obj(archive) if archive else None)
+
+    def new_project(self, name: str, color: str) -> Project:
+        return WindowProject(name, color)
+
+    def apply(self, change: dict):
+        if change['op'] == 'update':
+            # Only the sessions of the window can be changed
+            try:
+                self.find_session(change['project'],
+                                  datetime.fromisoformat(change['start']))
+            except Exception:
+                return None
+        return super().apply(change)
+
+    @property
+    def aggregates(self):
+        if self.cache is None:
+            raise Exception('The cache can\'t be built from part of the data')
+        return self.cache
+
+    def durations_per_day(self, start, end, projects=None):
+        if self.cache is None:
+            return Data.durations_per_day(self, start, end, projects)
+        return super().durations_per_day(start, end, projects)
+
+    def total_duration(self, name: str) -> float:
+        if self.cache is None:
+            return (self.get_project(name).total_duration(self.now)
+                    + self.archived_total(name))
+        return super().total_duration(name)
+
+    def __serialize__(self):
+        raise Exception('Only part of the data was loaded, it can\'t be saved')
@@ -0,0 +1,463 @@
+'''Merging of the data of several machines through a shared directory.
+
+Each machine appends the changes it saves to its own log in the directory,
+as events identified by the machine (the replica) and a sequence number.
+Events are ordered by a hybrid clock, which follows the wall clock in
+milliseconds but always exceeds the clocks of the events already seen. A
+sync only reads the events added to the other logs since the last one.
+
+Merging gives the same data on every machine whatever the order the events
+are merged in:
+- Projects are identified by a key, their name when they were first added,
+  which stays the same when they are renamed. The latest rename and color
+  win, and a removed project stays removed.
+- When projects of different keys want the same name, the latest rename
+  keeps it and the others are suffixed with their key.
+- Sessions are identified by their project and start. A session sent
+  twice keeps the earliest end and the largest comment.
+- A session ends at the latest where the next session starts, so that
+  sessions tracked at the same time on two machines don't overlap. Only the
+  last session can be running. The sessions of removed projects still end
+  the sessions before them, their starts are kept in the state.
+
+The state of the sync is kept in a file next to the data file.'''
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from os import fsync, listdir, path
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import time
+
+from .data import Data, Session
+from .data.index import OPEN
+from .data.project import random_color
+from .data.session import from_epoch, to_epoch
+from .storage.storage import atomic_write
+
+SYNC_VERSION = 1
+
+# Extension of the logs of the machines in the sync directory
+LOG_SUFFIX = '.jsonl'
+
+
+def state_path(file: str) -> str:
+    return file + '.sync'
+
+
+def to_us(value: Optional[str]) -> int:
+    '''Converts a time of the data to microseconds, open ends are OPEN'''
+    if value in (None, 'None'):
+        return OPEN
+    return to_epoch(datetime.fromisoformat(value))
+
+
+def later_comment(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    '''Returns the largest of the comments, any comment beats none'''
+    return max(a, b, key=lambda comment: (comment is not None, comment or ''))
+
+
+class SyncState:
+    '''Clock, projects and progress of the sync of a data file'''
+
+    def __init__(self, replica: str, directory: str, clock: int = 0,
+                 seq: int = 0, pending=None, seen=None, offsets=None,
+                 projects=None, names=None, removed=None, ghosts=None):
+        self.replica = replica
+        self.directory = directory
+        self.clock = clock
+        # Number of events of this machine
+        self.seq = seq
+        # Events of this machine that weren't written to the directory
+        self.pending: List[dict] = pending or []
+        # Last event merged and bytes read of the log of each machine
+        self.seen: Dict[str, int] = seen or {}
+        self.offsets: Dict[str, int] = offsets or {}
+        # Name and color of each project key, with the clock and replica
+        # of the event that set them
+        self.projects: Dict[str, dict] = projects or {}
+        # Name of each key in the data file
+        self.names: Dict[str, str] = names or {}
+        self.removed: List[str] = removed or []
+        # Starts of the sessions of removed projects, which still end the
+        # sessions before them on the machines that receive them later
+        self.ghosts: List[int] = ghosts or []
+
+    @staticmethod
+    def create(directory: str) -> 'SyncState':
+        import uuid
+        return SyncState(uuid.uuid4().hex, directory)
+
+    @staticmethod
+    def load(file: str) -> Optional['SyncState']:
+        '''Returns the state of the data file, None if it isn't synced'''
+        try:
+            with open(state_path(file)) as f:
+                obj = json.load(f)
+        except FileNotFoundError:
+            return None
+        if obj.get('version') != SYNC_VERSION:
+            raise Exception(f'Could not parse {state_path(file)}')
+        del obj['version']
+        return SyncState(**obj)
+
+    def save(self, file: str) -> None:
+        with atomic_write(state_path(file)) as f:
+            json.dump({'version': SYNC_VERSION, **self.__dict__}, f,
+                      separators=(',', ':'))
+
+    def tick(self) -> int:
+        self.clock = max(self.clock + 1, time.time_ns() // 10**6)
+        return self.clock
+
+    def observe(self, clock: int) -> None:
+        self.clock = max(self.clock, clock)
+
+    def add_event(self, op: str, **fields) -> dict:
+        self.seq += 1
+        event = {'replica': self.replica, 'seq': self.seq,
+                 'clock': self.tick(), 'op': op, **fields}
+        self.pending.append(event)
+        self.apply_project(event)
+        return event
+
+    def add_ghosts(self, starts) -> None:
+        self.ghosts = sorted({*self.ghosts, *starts})
+
+    def key_of(self, name: str) -> Optional[str]:
+        for key, key_name in self.names.items():
+            if key_name == name:
+                return key
+        return None
+
+    def new_key(self, name: str) -> str:
+        '''Returns a key for a project added on this machine'''
+        key = name
+        suffix = 1
+        while key in self.projects or key in self.removed:
+            suffix += 1
+            key = f'{name}#{suffix}'
+        return key
+
+    def publish(self, data: Data, names: List[str]) -> None:
+        '''Adds the events of projects that aren't known yet, with all of
+        their sessions'''
+        if not names:
+            return
+        sessions: Dict[str, list] = {name: [] for name in names}
+        for project, session in data.sessions_between(projects=names):
+            sessions[project.name].append(
+                [session.start_us, session.end_us, session.comment])
+        for name in names:
+            key = self.new_key(name)
+            self.names[key] = name
+            self.add_event('add', key=key, name=name,
+                           color=data.get_project(name).color_name)
+            if sessions[name]:
+                self.add_event('sessions', key=key, sessions=sessions[name])
+
+    def record(self, change: dict) -> None:
+        '''Adds the event of a change saved to the data file. Changes of
+        projects that aren't known are left to the next sync.'''
+        op = change['op']
+        if op == 'add':
+            key = self.new_key(change['project'])
+            self.names[key] = change['project']
+            self.add_event('add', key=key, name=change['project'],
+                           color=change['color'])
+            return
+
+        key = self.key_of(change['project'])
+        if key is None:
+            return
+        if op == 'remove':
+            del self.names[key]
+            self.add_event('remove', key=key)
+        elif op == 'rename':
+            self.names[key] = change['name']
+            self.add_event('rename', key=key, name=change['name'])
+        elif op == 'set-color':
+            self.add_event('set-color', key=key, color=change['color'])
+        elif op == 'import':
+            self.add_event('sessions', key=key, sessions=[
+                [to_us(obj['start']), to_us(obj.get('end')),
+                 obj.get('comment')] for obj in change['sessions']])
+        elif op in ('start', 'stop', 'update') and 'start' in change:
+            end = to_us(change.get('end'))
+            self.add_event('sessions', key=key, sessions=[
+                [to_us(change['start']), end if end != OPEN else None,
+                 change.get('comment')]])
+
+    def apply_project(self, event: dict) -> None:
+        '''Merges an event changing a project into the registers'''
+        key = event.get('key')
+        if event['op'] == 'sessions' or key in self.removed:
+            return
+        if event['op'] == 'remove':
+            self.removed.append(key)
+            self.projects.pop(key, None)
+            return
+        register = self.projects.setdefault(key, {})
+        stamp = [event['clock'], event['replica']]
+        for field in ('name', 'color'):
+            if field in event and (field not in register
+                                   or register[field][1:] < stamp):
+                register[field] = [event[field], *stamp]
+
+    def project_names(self) -> Dict[str, str]:
+        '''Returns the name of each project key'''
+        keys_per_name: Dict[str, List[str]] = {}
+        for key, register in self.projects.items():
+            if 'name' in register:
+                keys_per_name.setdefault(register['name'][0], []).append(key)
+        names = {}
+        for name, keys in keys_per_name.items():
+            keys.sort(key=lambda key: (self.projects[key]['name'][1:], key),
+                      reverse=True)
+            names[keys[0]] = name
+            for key in keys[1:]:
+                names[key] = f'{name} ({key})'
+        return names
+
+
+def capture(file: str, changes: List[dict],
+            load: Callable[[], Data]) -> Optional[SyncState]:
+    '''Returns the state with the events of the changes about to be saved,
+    or None if the data file isn't synced. The stored data is only loaded
+    to find the sessions of removed projects.'''
+    state = SyncState.load(file)
+    if state is None or not changes:
+        return None
+    removed = [change['project'] for change in changes
+               if change['op'] == 'remove']
+    if removed:
+        stored = load()
+        for name in removed:
+            if stored.has_project(name):
+                state.add_ghosts(session.start_us for session
+                                 in stored.get_project(name).sessions)
+    for change in changes:
+        state.record(change)
+    return state
+
+
+def pull(state: SyncState) -> List[dict]:
+    '''Returns the events added to the logs of the other machines since
+    the last sync, in the order of their clocks'''
+    events = []
+    for name in sorted(listdir(state.directory)):
+        replica = name[:-len(LOG_SUFFIX)]
+        if not name.endswith(LOG_SUFFIX) or replica == state.replica:
+            continue
+        file = path.join(state.directory, name)
+        offset = state.offsets.get(replica, 0)
+        # Logs that were replaced are read again, known events are skipped
+        if offset > path.getsize(file):
+            offset = 0
+        with open(file, 'rb') as f:
+            f.seek(offset)
+            content = f.read()
+
+        # A partially written event can only be the last one
+        end = content.rfind(b'\n') + 1
+        seen = state.seen.get(replica, 0)
+        for line in content[:end].splitlines():
+            event = json.loads(line)
+            if event['seq'] > seen:
+                events.append(event)
+                seen = event['seq']
+        state.seen[replica] = seen
+        state.offsets[replica] = offset + end
+
+    events.sort(key=lambda event: (event['clock'], event['replica'],
+                                   event['seq']))
+    if events:
+        state.observe(events[-1]['clock'])
+    return events
+
+
+def push(state: SyncState) -> int:
+    '''Appends the pending events to the log of this machine'''
+    count = len(state.pending)
+    if count:
+        file = path.join(state.directory, state.replica + LOG_SUFFIX)
+        with open(file, 'a') as f:
+            for event in state.pending:
+                f.write(json.dumps(event, separators=(',', ':')) + '\n')
+            f.flush()
+            fsync(f.fileno())
+        state.pending = []
+    return count
+
+
+def merge_projects(data: Data, state: SyncState) -> None:
+    '''Adds, removes, renames and colors the projects of the data like the
+    registers of the state'''
+    for key in [key for key in state.names if key in state.removed]:
+        name = state.names.pop(key)
+        if data.has_project(name):
+            state.add_ghosts(session.start_us for session
+                             in data.get_project(name).sessions)
+            data.record({'op': 'remove', 'project': name})
+
+    names = state.project_names()
+    renamed = [key for key in state.names if state.names[key] != names[key]]
+    # Names can be swapped, so they are freed first
+    for index, key in enumerate(renamed):
+        temporary = f'{state.names[key]} (renaming {index})'
+        data.record({'op': 'rename', 'project': state.names[key],
+                     'name': temporary})
+        state.names[key] = temporary
+    for key in renamed:
+        data.record({'op': 'rename', 'project': state.names[key],
+                     'name': names[key]})
+        state.names[key] = names[key]
+
+    for key, name in names.items():
+        color = state.projects[key].get('color', [None])[0]
+        if key not in state.names:
+            data.record({'op': 'add', 'project': name,
+                         'color': color or random_color()})
+            state.names[key] = name
+        elif color and data.get_project(name).color_name != color:
+            data.record({'op': 'set-color', 'project': name, 'color': color})
+
+
+def archived_starts(data: Data, names: Dict[str, str]) -> set:
+    '''Returns the keys and starts of the archived sessions'''
+    keys = {name: key for key, name in names.items()}
+    starts = set()
+    for year in data.archive.files:
+        projects = data.archived_projects()
+        for archive_key, sessions in data.archive.read(year).items():
+            if archive_key in projects:
+                key = keys.get(projects[archive_key].name)
+                starts.update((key, session.start_us) for session in sessions)
+    return starts
+
+
+def merge_sessions(data: Data, state: SyncState,
+                   events: List[dict]) -> None:
+    '''Merges the sessions of the events into the data. The index of the
+    data is only built once, the changes are recorded at the end.'''
+    # The same session can be sent by several events
+    merged: Dict[Tuple[str, int], list] = {}
+    for event in events:
+        for start, end, comment in event['sessions']:
+            end = end if end is not None else OPEN
+            item = merged.setdefault((event['key'], start), [end, comment])
+            item[0] = min(item[0], end)
+            item[1] = later_comment(item[1], comment)
+    if not merged:
+        return
+    batch = sorted(merged.items(), key=lambda item: item[0][1])
+    batch_starts = [start for (_, start), _ in batch]
+
+    index = data.get_index()
+    starts, ends = index.starts, index.ends
+    keys = {name: key for key, name in state.names.items()}
+    project_keys = [keys.get(project.name) for project in index.projects]
+    archived = set()
+    if data.archive is not None and batch_starts[0] < to_epoch(
+            data.archive.before):
+        archived = archived_starts(data, state.names)
+
+    # New end and comment of the sessions of the data, by position
+    new_ends: Dict[int, int] = {}
+    new_comments: Dict[int, Optional[str]] = {}
+    added: Dict[str, List[Session]] = {}
+    ghosts = []
+    running = None
+    for (key, start), (end, comment) in batch:
+        position = bisect_right(starts, start)
+        if position < len(starts):
+            end = min(end, starts[position])
+        position = bisect_right(batch_starts, start)
+        if position < len(batch_starts):
+            end = min(end, batch_starts[position])
+        position = bisect_right(state.ghosts, start)
+        if position < len(state.ghosts):
+            end = min(end, state.ghosts[position])
+
+        # Sessions started before end where this one starts, also the
+        # sessions of removed projects
+        for position in index.overlapping(from_epoch(start),
+                                          from_epoch(start + 1)):
+            if (starts[position] < start
+                    and new_ends.get(position, ends[position]) > start):
+                new_ends[position] = start
+
+        same = [position for position in range(
+                    bisect_left(starts, start), bisect_right(starts, start))
+                if project_keys[index.project_ids[position]] == key]
+        if same:
+            position = same[0]
+            new_ends[position] = min(new_ends.get(position, ends[position]),
+                                     end)
+            new_comments[position] = later_comment(
+                index.comments[index.comment_ids[position]], comment)
+            continue
+        if key not in state.names:
+            ghosts.append(start)
+            continue
+        if (key, start) in archived:
+            continue
+
+        if end == OPEN:
+            # Sessions started at the same time are ordered by key
+            for position in range(bisect_left(starts, start),
+                                  bisect_right(starts, start)):
+                if new_ends.get(position, ends[position]) != OPEN:
+                    continue
+                if key > str(project_keys[index.project_ids[position]]):
+                    new_ends[position] = start
+                else:
+                    end = start
+        if end == OPEN:
+            running = (key, start)
+        else:
+            added.setdefault(key, []).append(
+                Session.from_epoch(start, end, comment))
+
+    state.add_ghosts(ghosts)
+
+    for position in sorted({*new_ends, *new_comments}):
+        end = new_ends.get(position, ends[position])
+        comment = new_comments.get(
+            position, index.comments[index.comment_ids[position]])
+        if (end == ends[position] and comment
+                == index.comments[index.comment_ids[position]]):
+            continue
+        change = {'project': index.projects[index.project_ids[position]].name,
+                  'start': str(from_epoch(starts[position])),
+                  'end': str(from_epoch(end)), 'comment': comment}
+        if ends[position] == OPEN:
+            if end != OPEN:
+                data.record({'op': 'stop', **change})
+        else:
+            data.record({'op': 'update', **change})
+    for key, sessions in added.items():
+        data.record({'op': 'import', 'project': state.names[key],
+                     'sessions': [session.__serialize__()
+                                  for session in sessions]})
+    if running is not None:
+        data.record({'op': 'start', 'project': state.names[running[0]],
+                     'start': str(from_epoch(running[1]))})
+
+
+def sync(data: Data, state: SyncState) -> Tuple[int, int]:
+    '''Merges the events of the other machines into the data and sends the
+    events of this one. Returns the number of events sent and received.'''
+    # Projects added while the data file wasn't synced, or before
+    known = set(state.names.values())
+    state.publish(data, [project.name for project in data.projects
+                         if project.name not in known])
+
+    events = pull(state)
+    for event in events:
+        state.apply_project(event)
+    merge_projects(data, state)
+    # Sessions of this machine are merged as well, they may overlap
+    merge_sessions(data, state, [
+        event for event in state.pending + events
+        if event['op'] == 'sessions'])
+    return push(state), len(events)
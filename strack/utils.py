@@ -1,25 +1,12 @@
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
+from typing import Optional, Tuple
 
 
-def round_time(dt: datetime) -> datetime:
-    '''Rounds the time to the nearest half hour'''
-    if dt.minute < 30:
-        dt = dt.replace(minute=0, second=0, microsecond=0)
-    else:
-        dt = dt.replace(minute=30, second=0, microsecond=0)
-    return dt
-
-
-def is_this_week(dt):
-    '''Returns True if the date is from the same week as the current date'''
-    # Get the ISO calendar year, week number of the input datetime
-    year, week, _ = dt.isocalendar()
-
-    # Get the ISO calendar year, week number of the current date
-    today_year, today_week, _ = date.today().isocalendar()
-
-    # Check if the input datetime is from the same week as the current date
-    return year == today_year and week == today_week
+def week_range(day: Optional[date] = None) -> Tuple[datetime, datetime]:
+    '''Returns the start of the week of the date and of the following week'''
+    day = day or date.today()
+    start = datetime.combine(day - timedelta(days=day.weekday()), time())
+    return start, start + timedelta(days=7)
 
 
 def format_duration(seconds):
@@ -0,0 +1,158 @@
+'''Live views that stay open and follow the data file. The data is kept in
+memory and only loaded again when the data files change, which is waited
+for with inotify on Linux and by polling the files elsewhere. In between,
+the views only advance the running session to the current time.'''
+from datetime import datetime
+from os import path
+from typing import Callable, Iterable, List, Optional
+import os
+import select
+import struct
+import sys
+import time
+
+from . import file_utils
+from .data import Data
+from .storage.cache import file_key
+
+# Seconds between two updates of the views
+TICK = 1.0
+
+# Files written in the directory, replaced by a rename or removed
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT = struct.Struct('iIII')
+
+
+def open_inotify(directories: Iterable[str]) -> Optional[int]:
+    '''Returns an inotify descriptor watching the directories, or None if
+    inotify isn't available'''
+    if not sys.platform.startswith('linux'):
+        return None
+    import ctypes
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    # The directories are watched, since files are replaced by renames
+    for directory in directories:
+        if libc.inotify_add_watch(fd, os.fsencode(directory), IN_MASK) < 0:
+            os.close(fd)
+            return None
+    return fd
+
+
+class Watcher:
+    '''Waits for changes of the data files'''
+
+    def __init__(self, files: List[str]):
+        self.files = files
+        self.key = file_key(*files)
+        self.names = {os.fsencode(path.basename(file)) for file in files}
+        self.fd = open_inotify({path.dirname(file) or '.'
+                                for file in files})
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def events(self, timeout: float) -> bool:
+        '''Returns True if one of the files was written within the timeout'''
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        buffer = b''
+        while True:
+            try:
+                buffer += os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+        offset = 0
+        written = False
+        while offset < len(buffer):
+            _, _, _, length = EVENT.unpack_from(buffer, offset)
+            offset += EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            written = written or name in self.names
+        return written
+
+    def wait(self, timeout: float) -> bool:
+        '''Waits for the timeout and returns True if the files changed.
+        Returns as soon as they change when inotify is available.'''
+        if self.fd is None:
+            time.sleep(timeout)
+        elif not self.events(timeout) and self.key is not None:
+            return False
+        key = file_key(*self.files)
+        if key == self.key:
+            return False
+        self.key = key
+        return True
+
+
+class View:
+    '''Renderable of data loaded once. The content shown at a time is
+    computed from the state of the view, the renderable is only created
+    again when it changes.'''
+
+    def __init__(self):
+        self.shown = None
+        self.renderable = None
+
+    def content(self, now: datetime):
+        raise NotImplementedError()
+
+    def render(self, content):
+        raise NotImplementedError()
+
+    def update(self, now: datetime):
+        content = self.content(now)
+        if self.renderable is None or content != self.shown:
+            self.shown = content
+            self.renderable = self.render(content)
+        return self.renderable
+
+
+def watch(data: Data, load: Callable[[], Data],
+          view: Callable[[Data], View]) -> None:
+    '''Shows the view of the data until interrupted. The data is loaded
+    again when the data files change or on a new day, since the views show
+    the current day and week.'''
+    from rich.live import Live
+
+    watcher = Watcher(file_utils.STORAGE.files())
+    current = view(data)
+    day = data.now.date()
+    renderable = current.update(data.now)
+    # The view is only refreshed when it changes, not by a thread
+    try:
+        with Live(renderable, auto_refresh=False) as live:
+            while True:
+                changed = watcher.wait(TICK - time.time() % TICK)
+                now = datetime.now()
+                if changed or now.date() != day:
+                    try:
+                        data = load()
+                    except Exception:
+                        # The files may be written, tried on the next tick
+                        watcher.key = None
+                        continue
+                    current = view(data)
+                    day = data.now.date()
+                    now = data.now
+                if current.update(now) is not renderable:
+                    renderable = current.renderable
+                    live.update(renderable, refresh=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
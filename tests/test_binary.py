@@ -0,0 +1,106 @@
+'''Binary data file: sessions written by write_binary and read back through
+the mapped file'''
+from datetime import date, datetime
+import struct
+
+import pytest
+
+from strack.data import Session
+from strack.storage.binary import MAGIC, BinaryStorage
+
+
+def at(hour: int) -> datetime:
+    return datetime(2024, 3, 4, hour)
+
+
+def sessions(data, name='work'):
+    return [(session.start, session.end, session.comment)
+            for session in data.get_project(name).sessions]
+
+
+def written(storage, data):
+    '''Writes the binary file and reads it back'''
+    storage.compact(data)
+    data = storage.load()
+    data.now = at(14)
+    return data
+
+
+def test_round_trip(tmp_path):
+    storage = BinaryStorage(str(tmp_path / 'data.strack'))
+    data = storage.load()
+    data.add_project('work')
+    data.add_project('home')
+    data.import_sessions('work', [Session(at(9), at(10), 'café'),
+                                  Session(at(11), at(12))])
+    data.start_session('home', at(12))
+
+    data = written(storage, data)
+    assert data.active_project == 'home'
+    assert sessions(data) == [(at(9), at(10), 'café'), (at(11), at(12), None)]
+    assert sessions(data, 'home') == [(at(12), None, None)]
+    assert data.total_duration('work') == 2 * 3600
+    assert data.total_duration('home') == 2 * 3600
+
+
+def test_active_session_stored_mid_project(tmp_path):
+    storage = BinaryStorage(str(tmp_path / 'data.strack'))
+    data = storage.load()
+    data.add_project('work')
+    data.start_session('work', at(9))
+    # Completed sessions are stored after the running one
+    data.import_sessions('work', [Session(at(11), at(12))])
+
+    data = written(storage, data)
+    assert data.get_active().active_session().start == at(9)
+    assert data.total_duration('work') == 6 * 3600
+    assert data.durations_per_day(at(0), at(23)) == {
+        'work': {date(2024, 3, 4): 6 * 3600}}
+
+    data.stop_session(at(13))
+    storage.save(data)
+    data = storage.load()
+    assert not data.is_active()
+    assert sessions(data) == [(at(9), at(13), None), (at(11), at(12), None)]
+
+
+def test_project_added_after_writing(tmp_path):
+    storage = BinaryStorage(str(tmp_path / 'data.strack'))
+    data = storage.load()
+    data.add_project('work')
+    data.import_sessions('work', [Session(at(9), at(10))])
+    data = written(storage, data)
+
+    # The new project has no sessions in the mapped file
+    data.add_project('home')
+    storage.save(data)
+    data = storage.load()
+    assert data.durations_per_day(at(0), at(23)) == {
+        'work': {date(2024, 3, 4): 3600}}
+
+
+def test_empty_file(tmp_path):
+    storage = BinaryStorage(str(tmp_path / 'data.strack'))
+    open(storage.path, 'wb').close()
+    data = storage.load()
+    assert data.projects == []
+
+    data.add_project('work')
+    data = written(storage, data)
+    assert [project.name for project in data.projects] == ['work']
+    assert sessions(data) == []
+    assert data.durations_per_day(at(0), at(23)) == {}
+
+
+def test_version_mismatch(tmp_path):
+    storage = BinaryStorage(str(tmp_path / 'data.strack'))
+    data = storage.load()
+    data.add_project('work')
+    storage.compact(data)
+
+    # The version follows the magic number in the header
+    with open(storage.path, 'r+b') as f:
+        f.seek(len(MAGIC))
+        f.write(struct.pack('<H', 99))
+    with pytest.raises(Exception, match='version 99'):
+        BinaryStorage(storage.path).load()
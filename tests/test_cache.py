@@ -0,0 +1,73 @@
+'''Aggregate cache of the JSON data file, which is only written when it is
+built or when the journal is compacted'''
+from datetime import datetime
+from os import path
+
+from strack.data import Session
+from strack.storage.cache import AggregateCache
+from strack.storage.journal import JournalStorage
+
+
+def at(hour: int) -> datetime:
+    return datetime(2024, 3, 4, hour)
+
+
+def totals(data):
+    return data.aggregates.totals
+
+
+def rebuilt(data):
+    return AggregateCache.build(data).totals
+
+
+def test_journal_records_added(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    data = storage.load()
+    data.add_project('work')
+    data.import_sessions('work', [Session(at(9), at(10))])
+    storage.save(data)
+    totals(data)
+    storage.compact(data)
+    written = path.getmtime(storage.cache_path)
+
+    data = storage.load()
+    data.start_session('work', at(11))
+    storage.save(data)
+    data = storage.load()
+    data.stop_session(at(13))
+    storage.save(data)
+    # Starting and stopping only append to the journal
+    assert path.getmtime(storage.cache_path) == written
+
+    data = storage.load()
+    assert data.cache is not None
+    assert totals(data) == rebuilt(data) == {'work': 3 * 3600}
+
+
+def test_built_while_the_journal_grows(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    data = storage.load()
+    data.add_project('work')
+    data.import_sessions('work', [Session(at(9), at(10))])
+    storage.save(data)
+
+    # A report builds the cache while a session is stopped elsewhere
+    report = storage.load()
+    other = JournalStorage(storage.path)
+    data = other.load()
+    data.import_sessions('work', [Session(at(11), at(12))])
+    other.save(data)
+    assert totals(report) == {'work': 3600}
+
+    data = storage.load()
+    assert data.cache is not None
+    assert totals(data) == rebuilt(data) == {'work': 2 * 3600}
+
+
+def test_unsaved_changes(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    data = storage.load()
+    data.add_project('work')
+    data.import_sessions('work', [Session(at(9), at(10))])
+    totals(data)
+    assert not path.exists(storage.cache_path)
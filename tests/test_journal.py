@@ -0,0 +1,114 @@
+'''Journal of the JSON data file: replay, compaction and recovery from an
+interrupted compaction'''
+from datetime import datetime
+from os import path
+import shutil
+
+from strack.storage.journal import JournalStorage
+
+START = datetime(2024, 3, 4, 9)
+END = datetime(2024, 3, 4, 10, 30)
+
+
+def sessions(data, name='work'):
+    return [(session.start, session.end, session.comment)
+            for session in data.get_project(name).sessions]
+
+
+def started(storage):
+    data = storage.load()
+    data.add_project('work')
+    data.start_session('work', START)
+    storage.save(data)
+    return data
+
+
+def test_replay(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    started(storage)
+    assert not path.exists(storage.path)
+
+    data = storage.load()
+    assert data.active_project == 'work'
+    assert sessions(data) == [(START, None, None)]
+
+    data.stop_session(END, 'done')
+    storage.save(data)
+    data = storage.load()
+    assert not data.is_active()
+    assert sessions(data) == [(START, END, 'done')]
+
+
+def test_compact(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    data = started(storage)
+    data.stop_session(END)
+    storage.save(data)
+
+    storage.compact(data)
+    assert not path.exists(storage.journal_path)
+    data = storage.load()
+    assert data.generation == 1
+    assert sessions(data) == [(START, END, None)]
+
+    # Changes after the compaction go to a new journal
+    data.start_session('work', END)
+    storage.save(data)
+    data = storage.load()
+    assert data.active_project == 'work'
+    assert sessions(data) == [(START, END, None), (END, None, None)]
+
+
+def test_partial_record(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    started(storage)
+    with open(storage.journal_path, 'a') as f:
+        f.write('{"op":"stop","project":"wo')
+
+    data = storage.load()
+    assert data.active_project == 'work'
+
+    # The next changes aren't appended to the partial record
+    data.stop_session(END)
+    storage.save(data)
+    data = storage.load()
+    assert sessions(data) == [(START, END, None)]
+
+
+def interrupted_compaction(storage):
+    '''Compacts the data, then puts back the journal as if the process died
+    before removing it'''
+    data = started(storage)
+    data.stop_session(END)
+    storage.save(data)
+    shutil.copy(storage.journal_path, storage.path + '.old')
+    storage.compact(data)
+    shutil.copy(storage.path + '.old', storage.journal_path)
+
+
+def test_stale_journal_on_load(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    interrupted_compaction(storage)
+
+    data = storage.load()
+    assert sessions(data) == [(START, END, None)]
+    assert path.getsize(storage.journal_path) == 0
+
+    data.start_session('work', END)
+    storage.save(data)
+    assert storage.load().active_project == 'work'
+
+
+def test_stale_journal_on_save(tmp_path):
+    storage = JournalStorage(str(tmp_path / 'data.json'))
+    interrupted_compaction(storage)
+
+    # The stale journal is left again once the data is loaded
+    data = JournalStorage(storage.path).load()
+    shutil.copy(storage.path + '.old', storage.journal_path)
+    data.start_session('work', END)
+    storage.save(data)
+
+    data = storage.load()
+    assert data.active_project == 'work'
+    assert sessions(data) == [(START, END, None), (END, None, None)]
@@ -0,0 +1,57 @@
+'''Prompt segment read from the state file, which has to be up to date once
+a command returns, also when the daemon ran it'''
+from os import path
+import os
+import subprocess
+import sys
+import time
+
+from strack.client import is_running
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# Seconds the daemon may take to listen
+STARTUP = 10
+
+
+def strack(file: str, *args: str) -> str:
+    '''Runs the command like the strack entry point and returns its
+    output'''
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    return subprocess.run(
+        [sys.executable, '-m', 'strack.client', '--file', file, *args],
+        env=env, capture_output=True, text=True, check=True).stdout
+
+
+def test_start_then_prompt(tmp_path):
+    file = str(tmp_path / 'data.json')
+    strack(file, 'project', 'add', 'work')
+    assert strack(file, 'prompt') == '\n'
+
+    strack(file, 'start', 'work')
+    assert strack(file, 'prompt', '{project}') == 'work\n'
+    strack(file, 'stop')
+    assert strack(file, 'prompt', '-i', 'idle') == 'idle\n'
+
+
+def test_start_through_daemon(tmp_path):
+    file = str(tmp_path / 'data.json')
+    strack(file, 'project', 'add', 'work')
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    daemon = subprocess.Popen(
+        [sys.executable, '-m', 'strack.strack', '--file', file, 'daemon'],
+        env=env, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + STARTUP
+        while not is_running(file):
+            assert time.monotonic() < deadline, 'The daemon did not start'
+            time.sleep(0.05)
+
+        # The prompt reads the state file right after the daemon replied
+        assert strack(file, 'start', 'work') == 'work is now active.\n'
+        assert strack(file, 'prompt', '{project}') == 'work\n'
+        strack(file, 'stop')
+        assert strack(file, 'prompt', '-i', 'idle') == 'idle\n'
+    finally:
+        daemon.terminate()
+        daemon.wait()
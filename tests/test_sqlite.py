@@ -0,0 +1,110 @@
+'''SQLite backend: journal records translated to SQL and the queries
+answered by the database'''
+from datetime import date, datetime
+import sqlite3
+
+from rich.color import Color
+import pytest
+
+from strack.data import Session
+from strack.storage.sqlite import SqliteStorage
+
+
+def at(hour: int, minute: int = 0, day: int = 4) -> datetime:
+    return datetime(2024, 3, day, hour, minute)
+
+
+def sessions(data, name):
+    return [(session.start, session.end, session.comment)
+            for session in data.get_project(name).sessions]
+
+
+def reload(storage):
+    '''Reads the database through a new connection'''
+    return SqliteStorage(storage.path).load()
+
+
+def test_apply(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'data.db'))
+    data = storage.load()
+    data.add_project('work', Color.parse('#ff0000'))
+    data.add_project('home')
+    data.start_session('work', at(9))
+    storage.save(data)
+    data = reload(storage)
+    assert [project.name for project in data.projects] == ['work', 'home']
+    assert data.active_project == 'work'
+    assert sessions(data, 'work') == [(at(9), None, None)]
+
+    data.stop_session(at(10), 'done')
+    data.import_sessions('work', [Session(at(11), at(12)),
+                                  Session(at(7), at(8), 'early')])
+    data.record({'op': 'update', 'project': 'work', 'start': str(at(11)),
+                 'end': str(at(11, 30)), 'comment': 'short'})
+    data.rename_project('work', 'job')
+    data.set_color('job', Color.parse('#00ff00'))
+    data.remove_project('home')
+    storage.save(data)
+
+    data = reload(storage)
+    assert not data.is_active()
+    assert [project.name for project in data.projects] == ['job']
+    assert data.get_project('job').color_name == '#00ff00'
+    assert sessions(data, 'job') == [
+        (at(7), at(8), 'early'), (at(9), at(10), 'done'),
+        (at(11), at(11, 30), 'short')]
+
+
+def test_durations_across_midnight(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'data.db'))
+    data = storage.load()
+    data.add_project('work')
+    data.import_sessions('work', [Session(at(9), at(10)),
+                                  Session(at(22), at(2, day=5))])
+    storage.save(data)
+
+    data = reload(storage)
+    # The database computes the durations with julianday, in floats
+    durations = data.durations_per_day(at(0), at(0, day=6))
+    assert durations == {'work': {
+        date(2024, 3, 4): pytest.approx(3 * 3600, abs=0.01),
+        date(2024, 3, 5): pytest.approx(2 * 3600, abs=0.01)}}
+    # Only the part of the session in the range counts
+    assert data.durations_per_day(at(0, day=5), at(0, day=6)) == {
+        'work': {date(2024, 3, 5): 2 * 3600}}
+
+
+def test_recent_sessions_before(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'data.db'))
+    data = storage.load()
+    data.add_project('work')
+    data.add_project('home')
+    data.import_sessions('work', [Session(at(9), at(10)),
+                                  Session(at(13), at(14))])
+    data.import_sessions('home', [Session(at(11), at(12))])
+    storage.save(data)
+
+    data = reload(storage)
+    recent = [(project.name, session.start)
+              for project, session in data.recent_sessions(before=at(12))]
+    assert recent == [('home', at(11)), ('work', at(9))]
+    recent = [(project.name, session.start) for project, session
+              in data.recent_sessions(since=at(10), before=at(14))]
+    assert recent == [('work', at(13)), ('home', at(11))]
+
+
+def test_read_only(tmp_path):
+    storage = SqliteStorage(str(tmp_path / 'data.db'))
+    data = storage.load()
+    data.add_project('work')
+    data.start_session('work', at(9))
+    storage.save(data)
+
+    data = SqliteStorage(storage.path, read_only=True).load()
+    assert data.active_project == 'work'
+    assert sessions(data, 'work') == [(at(9), None, None)]
+
+    # A missing database isn't created
+    with pytest.raises(sqlite3.OperationalError):
+        SqliteStorage(str(tmp_path / 'other.db'), read_only=True)
+    assert not (tmp_path / 'other.db').exists()
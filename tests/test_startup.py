@@ -0,0 +1,78 @@
+'''Startup of the entry point, which is paid by every command, even a
+`strack stop` run from a shell hook'''
+from os import path
+import os
+import subprocess
+import sys
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# Time the imports of strack may take, measured with -X importtime, as a
+# share of the time click takes in the same run. Click alone takes most of
+# the 50 ms aimed at, importing rich.console would more than double the
+# rest. Eager imports of rich are also checked by name.
+BUDGET = 0.6
+
+# The best of a few runs is compared, the first one also reads the files
+REPEAT = 3
+
+# Click is imported first so that its time is not counted in strack's
+IMPORT_CLI = 'import click, strack.strack'
+RESOLVE_STOP = ('import click, strack.strack as s; '
+                "s.cli.get_command(click.Context(s.cli), 'stop')")
+
+
+def run(code: str, *options: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    return subprocess.run([sys.executable, *options, '-c', code], env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_share(code: str) -> float:
+    '''Returns the best ratio of the time spent importing strack to the
+    time spent importing click to run the code in a new interpreter'''
+    shares = []
+    for _ in range(REPEAT):
+        times = {'click': 0, 'strack': 0}
+        # Lines are formatted as 'import time: self | cumulative | name',
+        # the names of nested imports are indented
+        for line in run(code, '-X', 'importtime').stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) != 3 or fields[2][1:].startswith(' '):
+                continue
+            package = fields[2].strip().split('.')[0]
+            if package in times:
+                times[package] += int(fields[1])
+        shares.append(times['strack'] / times['click'])
+    return min(shares)
+
+
+def loaded_modules(code: str) -> set:
+    '''Returns the modules imported to run the code in a new interpreter'''
+    output = run(code + '; import sys; print(*sys.modules)').stdout
+    return set(output.split())
+
+
+def test_import_time():
+    assert import_share(IMPORT_CLI) < BUDGET
+
+
+def test_stop_import_time():
+    assert import_share(RESOLVE_STOP) < BUDGET
+
+
+def test_lazy_imports():
+    modules = loaded_modules(IMPORT_CLI)
+    assert not {module for module in modules if module.startswith('rich')}
+    assert not {module for module in modules
+                if module.startswith('strack.commands.')}
+
+
+def test_stop_lazy_imports():
+    modules = loaded_modules(RESOLVE_STOP)
+    # Only the module of the command is imported, rich only when rendering
+    assert {module for module in modules
+            if module.startswith('strack.commands.')} == {
+        'strack.commands.session'}
+    assert 'rich.console' not in modules
+    assert 'rich.table' not in modules
@@ -0,0 +1,84 @@
+'''Sync of two data files through a shared directory, as two machines would
+do it'''
+from datetime import datetime
+
+from strack import sync
+from strack.data import Session
+from strack.storage.journal import JournalStorage
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return datetime(2024, 3, 4, hour, minute)
+
+
+def save(storage, data):
+    '''Saves the changes and their events, like file_utils.commit_file'''
+    state = sync.capture(storage.path, data.changes, storage.load)
+    storage.save(data)
+    if state is not None:
+        state.save(storage.path)
+
+
+def run_sync(storage, directory):
+    '''Runs the sync command on the data file'''
+    state = (sync.SyncState.load(storage.path)
+             or sync.SyncState.create(directory))
+    data = storage.load()
+    counts = sync.sync(data, state)
+    # Merged changes came from the other machine, they aren't sent back
+    storage.save(data)
+    state.save(storage.path)
+    return counts
+
+
+def contents(storage):
+    data = storage.load()
+    return data.active_project, {
+        project.name: [(session.start, session.end, session.comment)
+                       for session in project.sessions]
+        for project in data.projects}
+
+
+def test_two_replicas(tmp_path):
+    directory = str(tmp_path)
+    a = JournalStorage(str(tmp_path / 'a.json'))
+    b = JournalStorage(str(tmp_path / 'b.json'))
+
+    # Projects of both machines are sent with their sessions
+    data = a.load()
+    data.add_project('work')
+    data.import_sessions('work', [Session(at(9), at(10))])
+    save(a, data)
+    assert run_sync(a, directory) == (2, 0)
+    data = b.load()
+    data.add_project('home')
+    data.import_sessions('home', [Session(at(11), at(12), 'b')])
+    save(b, data)
+    assert run_sync(b, directory) == (2, 2)
+    assert run_sync(a, directory) == (0, 2)
+    assert contents(a)[1] == contents(b)[1] == {
+        'work': [(at(9), at(10), None)],
+        'home': [(at(11), at(12), 'b')]}
+
+    # Changes saved once synced are sent by the next sync. The session
+    # started on a ends the one tracked at the same time on b.
+    data = a.load()
+    data.rename_project('home', 'house')
+    data.start_session('work', at(13))
+    save(a, data)
+    data = b.load()
+    data.import_sessions('home', [Session(at(12, 30), at(14))])
+    save(b, data)
+    assert run_sync(b, directory) == (1, 0)
+    assert run_sync(a, directory) == (2, 1)
+    assert run_sync(b, directory) == (0, 2)
+
+    expected = ('work', {
+        'work': [(at(9), at(10), None), (at(13), None, None)],
+        'house': [(at(11), at(12), 'b'), (at(12, 30), at(13), None)]})
+    assert contents(a) == contents(b) == expected
+
+    # Nothing is left to send
+    assert run_sync(a, directory) == (0, 0)
+    assert run_sync(b, directory) == (0, 0)
+    assert contents(a) == contents(b) == expected